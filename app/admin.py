@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Optional
+import hmac
+import logging
+from app import config, profiling
+from app.engine import get_engine
+
+logger = logging.getLogger(__name__)
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Whether `token` grants admin access (nothing does when ADMIN_TOKEN is unset)"""
+    return bool(config.ADMIN_TOKEN) and hmac.compare_digest(token or "", config.ADMIN_TOKEN)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject the request unless it carries ADMIN_TOKEN; with none configured, admin endpoints are disabled"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+class ReembedRequest(BaseModel):
+    model: str = config.EMBEDDING_MODEL
+
+@router.post("/reembed", status_code=202)
+async def start_reembed(request: ReembedRequest):
+    """
+    Re-embed the whole index with another model in the background.
+    Queries keep using the current index and model until the new one is swapped in.
+    """
+    engine = get_engine()
+    if not engine.schedule_reembed(request.model):
+        raise HTTPException(status_code=409, detail="A re-embed is already in progress")
+    logger.info(f"Scheduled re-embedding with {request.model}")
+    return engine.reembed_status
+
+@router.get("/reembed")
+async def reembed_status():
+    """Progress of the current or last re-embed, and the model the index is embedded with"""
+    engine = get_engine()
+    return {**engine.reembed_status, 'index_model': engine.index.model, 'index_dim': engine.index.dim}
+
+@router.get("/dedup")
+async def dedup_report():
+    """Near-duplicate chunks found while ingesting in this worker"""
+    engine = get_engine()
+    stats = engine.dedup_stats
+    return {
+        'mode': config.DEDUP_MODE,
+        'max_distance': config.DEDUP_MAX_DISTANCE,
+        'chunks_ingested': stats['chunks'],
+        'duplicates': stats['duplicates'],
+        'dedup_ratio': round(stats['duplicates'] / stats['chunks'], 4) if stats['chunks'] else 0.0,
+        'index_chunks': len(engine.index),
+    }
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def live_profile(seconds: float = Query(10, gt=0, le=config.PROFILE_MAX_SECONDS),
+                       interval_ms: float = Query(config.PROFILE_INTERVAL_MS, ge=1, le=1000)):
+    """
+    Sample the stacks of every thread of this worker for `seconds` while it keeps
+    serving, and return them as folded stacks (also saved, see X-Profile-Id)
+    """
+    profile_id, sampler = await run_in_threadpool(profiling.sample_for, seconds, interval_ms / 1000)
+    return PlainTextResponse(sampler.folded(), headers={"X-Profile-Id": profile_id})
+
+@router.get("/profiles")
+async def saved_profiles():
+    """Profiles saved by profiled requests and live sampling, newest first"""
+    return profiling.list_profiles()
+
+@router.get("/profiles/{profile_id}")
+async def saved_profile(profile_id: str, format: str = Query("text", pattern="^(text|raw)$"),
+                        sort: str = "cumulative", limit: int = Query(40, ge=1, le=1000)):
+    """
+    A saved profile: cProfile ones as a pstats table (format=text) or the .prof
+    file for snakeviz and friends (format=raw); sampling ones as folded stacks
+    """
+    path = profiling.find_profile(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No such profile")
+    if format == "raw":
+        return FileResponse(path, filename=path.name)
+    if path.suffix == ".prof":
+        try:
+            return PlainTextResponse(profiling.cprofile_report(path, sort, limit))
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown sort key {sort}")
+    return PlainTextResponse(path.read_text(encoding='utf-8'))
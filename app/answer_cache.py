@@ -0,0 +1,99 @@
+"""
+Semantic answer cache.
+
+Paraphrases of a question ("what's d_model?", "what is the model dimension")
+miss an exact-text cache but land close together in embedding space. This
+cache keeps the embeddings of recently answered queries in one preallocated
+matrix; a new query whose embedding has cosine similarity of at least
+SEMANTIC_CACHE_THRESHOLD with a cached one, asked with the same options
+(filters, top_k, ...) against the same index generation, gets the cached
+response without retrieval or synthesis. A lookup is a single matrix-vector
+product over at most SEMANTIC_CACHE_SIZE rows.
+
+Entries are evicted least recently used first, and all of them are dropped
+when the index generation changes.
+"""
+import logging
+import threading
+
+import numpy as np
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Responses to recent queries, looked up by nearest query embedding"""
+
+    def __init__(self, max_entries: int = config.SEMANTIC_CACHE_SIZE,
+                 threshold: float = config.SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.generation = None
+        self.embeddings = None  # (max_entries, dim), allocated on the first store
+        self.scopes = np.zeros(max_entries, dtype=np.int64)
+        self.used = np.zeros(max_entries, dtype=bool)
+        self.last_used = np.zeros(max_entries, dtype=np.int64)
+        self.values = [None] * max_entries
+        self.hits = 0
+        self.misses = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return int(self.used.sum())
+
+    def _reset(self, generation: str):
+        self.generation = generation
+        self.used[:] = False
+        self.values = [None] * self.max_entries
+
+    def lookup(self, embedding: np.ndarray, scope: str, generation: str):
+        """Return (value, similarity) of the closest cached query within the threshold, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if generation != self.generation:
+                self._reset(generation)
+            rows = np.flatnonzero(self.used & (self.scopes == hash(scope)))
+            if not len(rows) or self.embeddings.shape[1] != len(embedding):
+                self.misses += 1
+                return None
+            similarities = self.embeddings[rows] @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            row = rows[best]
+            self._clock += 1
+            self.last_used[row] = self._clock
+            self.hits += 1
+            return self.values[row], float(similarities[best])
+
+    def store(self, embedding: np.ndarray, scope: str, generation: str, value):
+        if not self.enabled:
+            return
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if generation != self.generation:
+                self._reset(generation)
+            if self.embeddings is None or self.embeddings.shape[1] != len(embedding):
+                # First entry, or the embedding model changed
+                self.embeddings = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+                self.used[:] = False
+            free = np.flatnonzero(~self.used)
+            row = int(free[0]) if len(free) else int(np.argmin(self.last_used))
+            self._clock += 1
+            self.embeddings[row] = embedding
+            self.scopes[row] = hash(scope)
+            self.used[row] = True
+            self.last_used[row] = self._clock
+            self.values[row] = value
+
+
+SEMANTIC_CACHE = SemanticCache()
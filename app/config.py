@@ -0,0 +1,118 @@
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+UPLOAD_DIR = Path("uploads")
+
+# Retrieval engine backends, see app/engine.py
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "sentence-transformers")
+SYNTHESIZER_BACKEND = os.getenv("SYNTHESIZER_BACKEND", "rules")
+
+# When the index on disk was embedded with another model than EMBEDDING_MODEL,
+# keep serving it with that model and re-embed it in the background (one worker
+# does, the others follow). An admin re-embed to another model is kept across
+# restarts until EMBEDDING_MODEL changes; set EMBEDDING_MODEL to match it.
+REEMBED_ON_MODEL_CHANGE = os.getenv("REEMBED_ON_MODEL_CHANGE", "true").lower() in ("1", "true", "yes")
+
+# Token required in the X-Admin-Token header by /api/admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Corpus embedding batches texts of similar token length together, each batch
+# padded to at most EMBEDDING_BATCH_TOKENS tokens (batch size x longest text)
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8192"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "256"))
+
+# Where the onnx embedder backends (app/embedders.py) cache their exports
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "models/onnx")
+
+# Threads and CPU pinning for model inference (app/cpu.py). 0 threads keeps the
+# runtime's default, or one per pinned CPU. WORKER_CPU_AFFINITY is "", a CPU
+# list such as "0-3", or "auto" to give each of WORKER_CPU_SLOTS workers its
+# own slice of the CPUs.
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_INTEROP_THREADS = int(os.getenv("EMBEDDING_INTEROP_THREADS", "0"))
+WORKER_CPU_AFFINITY = os.getenv("WORKER_CPU_AFFINITY", "")
+WORKER_CPU_SLOTS = int(os.getenv("WORKER_CPU_SLOTS", os.getenv("WEB_CONCURRENCY", "1")))
+
+# Shared embedding server (app/model_server.py), used with EMBEDDER_BACKEND=server
+EMBEDDING_SERVER_ADDRESS = os.getenv("EMBEDDING_SERVER_ADDRESS", "unix:/tmp/kb-embedding.sock")
+EMBEDDING_SERVER_BACKEND = os.getenv("EMBEDDING_SERVER_BACKEND", "sentence-transformers")
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "30"))
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "256"))
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+
+# Directory for index snapshots shared between workers through memory-mapped
+# files (app/shared_index.py). Unset keeps a private in-memory index per process.
+INDEX_DIR = os.getenv("INDEX_DIR", "")
+
+# Segmented index: searches use a thread pool once the index is this large, and
+# compaction merges the COMPACTION_MERGE_FACTOR smallest segments whenever there
+# are more than COMPACTION_MAX_SEGMENTS, and rewrites any segment with more than
+# COMPACTION_MAX_DELETED_RATIO of its rows deleted.
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", str(min(4, os.cpu_count() or 1))))
+PARALLEL_SEARCH_MIN_CHUNKS = int(os.getenv("PARALLEL_SEARCH_MIN_CHUNKS", "20000"))
+COMPACTION_MAX_SEGMENTS = int(os.getenv("COMPACTION_MAX_SEGMENTS", "8"))
+COMPACTION_MERGE_FACTOR = int(os.getenv("COMPACTION_MERGE_FACTOR", "4"))
+COMPACTION_MAX_DELETED_RATIO = float(os.getenv("COMPACTION_MAX_DELETED_RATIO", "0.3"))
+
+# Two-stage search for large indexes: rank documents by their centroid first,
+# then score only the chunks of the TWO_STAGE_TOP_DOCS best ones. 0 disables it.
+TWO_STAGE_TOP_DOCS = int(os.getenv("TWO_STAGE_TOP_DOCS", "20"))
+TWO_STAGE_MIN_CHUNKS = int(os.getenv("TWO_STAGE_MIN_CHUNKS", "50000"))
+
+# Retrieval limits for /api/query: chunks per page, deepest rank reachable by
+# paging, and how many of the retrieved chunks are handed to the synthesizer
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", "100"))
+MAX_RESULT_WINDOW = int(os.getenv("MAX_RESULT_WINDOW", "1000"))
+CONTEXT_CHUNKS = int(os.getenv("CONTEXT_CHUNKS", "3"))
+
+# The CONTEXT_CHUNKS are picked from the best MMR_CANDIDATES results by maximal
+# marginal relevance, trading relevance (weight MMR_LAMBDA) against overlap with
+# chunks already picked. MMR_LAMBDA=1 keeps the plain top results.
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# Canned answers (app/synthesis.py) cached per index generation, LRU-bounded
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+
+# Semantic answer cache (app/answer_cache.py): a query whose embedding is this
+# close to a recently answered one reuses its response. Size 0 disables it.
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Generative synthesis (SYNTHESIZER_BACKEND=llm, app/generator.py): one shared
+# pipeline, batched across concurrent requests, with a cap on new tokens and a
+# fallback to extractive answers when the queue would exceed the latency budget
+GENERATOR_MODEL = os.getenv("GENERATOR_MODEL", "google/flan-t5-small")
+GENERATOR_MAX_NEW_TOKENS = int(os.getenv("GENERATOR_MAX_NEW_TOKENS", "128"))
+GENERATOR_MAX_BATCH = int(os.getenv("GENERATOR_MAX_BATCH", "8"))
+GENERATOR_MAX_WAIT_MS = float(os.getenv("GENERATOR_MAX_WAIT_MS", "10"))
+GENERATOR_LATENCY_BUDGET_MS = float(os.getenv("GENERATOR_LATENCY_BUDGET_MS", "3000"))
+GENERATOR_QUEUE_SIZE = int(os.getenv("GENERATOR_QUEUE_SIZE", "64"))
+
+# Profiling (app/profiling.py): where profiles of opted-in requests and live
+# sampling runs are saved and how many are kept, the stack sampling interval,
+# and the longest live sampling run /api/admin/profile accepts
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Near-duplicate chunks at ingest (app/dedup.py): chunks whose SimHash is within
+# DEDUP_MAX_DISTANCE bits of an indexed chunk or an earlier chunk of the same
+# file are not embedded. "link" indexes them with their original's embedding,
+# "skip" leaves them out of the index, "off" embeds everything.
+DEDUP_MODE = os.getenv("DEDUP_MODE", "link")
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+
+# Chunking (sizes are in words)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+
+# Load the embedding model and index the uploads in the background at startup
+# instead of on the first query. Off by default so worker boot stays fast.
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "false").lower() in ("1", "true", "yes")
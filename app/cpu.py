@@ -0,0 +1,142 @@
+"""
+CPU threads and affinity for processes that run the embedding model.
+
+By default torch sizes its thread pool to every core, so N uvicorn workers
+each encoding at once run N x cores threads and spend their time context
+switching. Two settings avoid that:
+
+    WORKER_CPU_AFFINITY   "" leaves scheduling to the OS, "0-3,8" pins the
+                          process to those CPUs, and "auto" splits the
+                          available CPUs into WORKER_CPU_SLOTS equal slices
+                          and pins each worker to the first free slice
+    EMBEDDING_THREADS     intra-op threads per process; when unset and the
+                          process is pinned, one per pinned CPU
+
+Slices are claimed with a non-blocking flock on a per-slice lock file that
+stays held for the life of the process, so a restarted worker takes over the
+slice its predecessor released. `python -m benchmarks.threads` measures the
+combinations on the current host and recommends values.
+"""
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from app import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no slot claiming
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# CPUs this process was pinned to by apply_cpu_affinity, None when not pinned
+_pinned_cpus = None
+# Lock file of the claimed "auto" slice, kept open so the flock is held
+_slot_file = None
+_torch_configured = False
+
+
+def parse_cpu_list(spec: str) -> list:
+    """Parse a cpuset-style list such as "0-3,8,10-11" """
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            cpus.update(range(int(first), int(last or first) + 1))
+        except ValueError:
+            raise ValueError(f"Invalid CPU list '{spec}', expected e.g. 0-3,8")
+    return sorted(cpus)
+
+
+def available_cpus() -> list:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slices(cpus: list, slots: int) -> list:
+    """Split `cpus` into `slots` contiguous slices of (nearly) equal size"""
+    slots = max(1, min(slots, len(cpus)))
+    size, extra = divmod(len(cpus), slots)
+    slices, start = [], 0
+    for slot in range(slots):
+        end = start + size + (1 if slot < extra else 0)
+        slices.append(cpus[start:end])
+        start = end
+    return slices
+
+
+def _claim_slot(slots: int):
+    """Index of a free slot, holding its lock until the process exits, or None"""
+    global _slot_file
+    if fcntl is None:
+        return None
+    lock_dir = Path(tempfile.gettempdir()) / "kb-cpu-slots"
+    lock_dir.mkdir(exist_ok=True)
+    for slot in range(slots):
+        slot_file = open(lock_dir / f"slot-{slot}.lock", 'w')
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            slot_file.close()
+            continue
+        _slot_file = slot_file
+        return slot
+    return None
+
+
+def apply_cpu_affinity(spec: str = config.WORKER_CPU_AFFINITY, slots: int = config.WORKER_CPU_SLOTS):
+    """Pin the current process according to WORKER_CPU_AFFINITY; returns the CPUs or None"""
+    global _pinned_cpus
+    if not spec or _pinned_cpus is not None:
+        return _pinned_cpus
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU affinity is not supported on this platform, ignoring WORKER_CPU_AFFINITY")
+        return None
+
+    if spec == "auto":
+        slot = _claim_slot(slots)
+        if slot is None:
+            logger.warning(f"All {slots} CPU slots are taken, not pinning process {os.getpid()}")
+            return None
+        slices = cpu_slices(available_cpus(), slots)
+        cpus = slices[slot % len(slices)]
+    else:
+        cpus = parse_cpu_list(spec)
+
+    os.sched_setaffinity(0, cpus)
+    _pinned_cpus = cpus
+    logger.info(f"Pinned process {os.getpid()} to CPUs {','.join(map(str, cpus))}")
+    return cpus
+
+
+def embedding_threads() -> int:
+    """Intra-op threads for model runtimes; 0 means the runtime's default"""
+    if config.EMBEDDING_THREADS:
+        return config.EMBEDDING_THREADS
+    return len(_pinned_cpus) if _pinned_cpus else 0
+
+
+def configure_torch():
+    """Apply the thread settings to torch; call after importing it, before running a model"""
+    global _torch_configured
+    if _torch_configured:
+        return
+    import torch
+
+    threads = embedding_threads()
+    if threads:
+        torch.set_num_threads(threads)
+    if config.EMBEDDING_INTEROP_THREADS:
+        try:
+            torch.set_num_interop_threads(config.EMBEDDING_INTEROP_THREADS)
+        except RuntimeError:
+            # Only allowed before torch starts any inter-op parallel work
+            logger.warning("torch inter-op threads already initialised, EMBEDDING_INTEROP_THREADS ignored")
+    _torch_configured = True
+    logger.info(f"torch using {torch.get_num_threads()} intra-op and {torch.get_num_interop_threads()} inter-op threads")
@@ -0,0 +1,93 @@
+"""
+Near-duplicate chunk detection.
+
+Drafts and revisions of the same document produce chunks that differ in a
+few words. Each chunk gets a 64-bit SimHash of its word 3-shingles: chunks
+sharing most of their shingles get signatures a few bits apart, so
+"near-duplicate" means a Hamming distance of at most DEDUP_MAX_DISTANCE.
+
+Signatures are looked up with banded LSH: the 64 bits are cut into
+DEDUP_MAX_DISTANCE + 1 bands, and two signatures within the distance must
+agree exactly on at least one band (pigeonhole), so only rows sharing a band
+value are compared. Each band is a sorted array searched with searchsorted,
+which suits immutable index segments.
+"""
+import hashlib
+import re
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+SHINGLE_SIZE = 3
+SIGNATURE_BITS = 64
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the word shingles of `text`"""
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles),
+        dtype=np.uint8,
+    ).reshape(-1, 8)
+    # Each bit of the signature is the majority vote of that bit over the shingle hashes
+    votes = np.unpackbits(hashes, axis=1).sum(axis=0, dtype=np.int64)
+    return int(np.packbits(votes * 2 > len(hashes)).view('>u8')[0])
+
+
+def simhash_signatures(texts: list) -> np.ndarray:
+    return np.fromiter((simhash(text) for text in texts), dtype=np.uint64, count=len(texts))
+
+
+def hamming_distances(signatures: np.ndarray, signature: int) -> np.ndarray:
+    differing = np.bitwise_xor(np.asarray(signatures, dtype=np.uint64), np.uint64(signature))
+    return np.unpackbits(differing.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _bands(max_distance: int) -> list:
+    """(shift, mask) of each band; enough bands that a match within max_distance shares one"""
+    count = min(max_distance + 1, SIGNATURE_BITS)
+    bounds = np.linspace(0, SIGNATURE_BITS, count + 1).astype(int)
+    return [(int(low), (1 << int(high - low)) - 1) for low, high in zip(bounds[:-1], bounds[1:])]
+
+
+class SignatureTable:
+    """LSH lookup over a fixed array of signatures"""
+
+    def __init__(self, signatures: np.ndarray, max_distance: int):
+        self.signatures = np.asarray(signatures, dtype=np.uint64)
+        self.max_distance = max_distance
+        self.bands = []
+        for shift, mask in _bands(max_distance):
+            values = (self.signatures >> np.uint64(shift)) & np.uint64(mask)
+            order = np.argsort(values, kind='stable')
+            self.bands.append((shift, mask, values[order], order))
+
+    def matches(self, signature: int, allowed: np.ndarray = None) -> np.ndarray:
+        """Rows within max_distance of `signature`, ascending; `allowed` masks out rows (e.g. deleted)"""
+        candidates = []
+        for shift, mask, values, order in self.bands:
+            value = np.uint64((signature >> shift) & mask)
+            start, end = np.searchsorted(values, value, 'left'), np.searchsorted(values, value, 'right')
+            if end > start:
+                candidates.append(order[start:end])
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(candidates))
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        return rows[hamming_distances(self.signatures[rows], signature) <= self.max_distance]
+
+
+def first_occurrences(signatures: np.ndarray, max_distance: int) -> np.ndarray:
+    """For each row, the first earlier row it near-duplicates, or -1"""
+    table = SignatureTable(signatures, max_distance)
+    first = np.full(len(signatures), -1, dtype=np.int64)
+    for row, signature in enumerate(signatures.tolist()):
+        matches = table.matches(signature)
+        earlier = matches[matches < row]
+        if len(earlier):
+            # Point at the original, not at another duplicate
+            first[row] = first[earlier[0]] if first[earlier[0]] >= 0 else earlier[0]
+    return first
@@ -0,0 +1,171 @@
+"""
+Faster CPU variants of the sentence-transformers embedder.
+
+    sentence-transformers-int8  the same PyTorch model with its Linear layers
+                                dynamically quantized to int8
+    onnx                        the transformer exported to ONNX and run with
+                                ONNX Runtime
+    onnx-int8                   the ONNX export with int8 dynamically quantized
+                                weights
+
+The ONNX variants export the model on first load into ONNX_CACHE_DIR, along
+with its tokenizer, and afterwards need only onnxruntime and the tokenizer to
+run. Pooling (mean over tokens) and normalisation are done in numpy, matching
+what SentenceTransformer.encode produces for all-MiniLM-L6-v2.
+
+All of them use the thread settings from app/cpu.py. Compare them against the
+fp32 model with `python -m benchmarks.embedders` before switching
+EMBEDDER_BACKEND.
+"""
+import json
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from app import config
+from app.cpu import configure_torch, embedding_threads
+from app.engine import Embedder, SentenceTransformerEmbedder
+from app.metrics import model_load
+
+logger = logging.getLogger(__name__)
+
+# Texts per ONNX Runtime call, as in SentenceTransformer.encode
+ONNX_BATCH_SIZE = 32
+
+
+class QuantizedTorchEmbedder(SentenceTransformerEmbedder):
+    """SentenceTransformer with torch dynamic int8 quantization of its Linear layers"""
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                import torch
+                from sentence_transformers import SentenceTransformer
+
+                configure_torch()
+                logger.info(f"Loading {self.model_name} with int8 dynamic quantization...")
+                with model_load(self.model_name):
+                    model = SentenceTransformer(self.model_name, device="cpu")
+                    self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                logger.info("Quantized SentenceTransformer model loaded successfully")
+
+
+class OnnxEmbedder(Embedder):
+    """Runs the embedding model's transformer with ONNX Runtime"""
+
+    quantize = False
+
+    def __init__(self, model_name: str = config.EMBEDDING_MODEL, cache_dir: str = config.ONNX_CACHE_DIR,
+                 threads: int = None):
+        super().__init__(model_name)
+        self.model_dir = Path(cache_dir) / model_name.replace("/", "__")
+        self.threads = threads
+        self.session = None
+        self.tokenizer = None
+        self.max_seq_length = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_path(self) -> Path:
+        return self.model_dir / ("model.int8.onnx" if self.quantize else "model.onnx")
+
+    @property
+    def loaded(self) -> bool:
+        return self.session is not None
+
+    def export(self):
+        """Export the transformer and tokenizer to `model_dir`, replacing any previous export"""
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Exporting {self.model_name} to ONNX in {self.model_dir}...")
+        model = SentenceTransformer(self.model_name, device="cpu")
+        transformer, pooling = model[0], model[1]
+        if not getattr(pooling, "pooling_mode_mean_tokens", False):
+            raise ValueError(f"{self.model_name} does not use mean pooling, which is all the ONNX backend implements")
+
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        transformer.tokenizer.save_pretrained(self.model_dir)
+        dummy = transformer.tokenizer(["export"], return_tensors="pt")
+        input_names = list(dummy.keys())
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        transformer.auto_model.eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer.auto_model,
+                tuple(dummy[name] for name in input_names),
+                str(self.model_dir / "model.onnx"),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+            )
+
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(self.model_dir / "model.onnx"), str(self.model_dir / "model.int8.onnx"),
+                         weight_type=QuantType.QInt8)
+        with open(self.model_dir / "export.json", 'w', encoding='utf-8') as export_file:
+            json.dump({"model": self.model_name, "max_seq_length": model.max_seq_length}, export_file)
+        logger.info("ONNX export finished")
+
+    def load(self):
+        with self._lock:
+            if self.session is not None:
+                return
+            if not (self.model_dir / "export.json").exists():
+                self.export()
+
+            import onnxruntime
+            from transformers import AutoTokenizer
+
+            with open(self.model_dir / "export.json", encoding='utf-8') as export_file:
+                self.max_seq_length = json.load(export_file)["max_seq_length"]
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            threads = self.threads or embedding_threads()
+            if threads:
+                options.intra_op_num_threads = threads
+            if config.EMBEDDING_INTEROP_THREADS:
+                options.inter_op_num_threads = config.EMBEDDING_INTEROP_THREADS
+            logger.info(f"Loading ONNX model {self.model_path}...")
+            with model_load(self.model_name):
+                self.session = onnxruntime.InferenceSession(str(self.model_path), options,
+                                                            providers=["CPUExecutionProvider"])
+            self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+            logger.info("ONNX model loaded successfully")
+
+    def encode(self, texts: list) -> np.ndarray:
+        self.load()
+        batches = [self.encode_batch(texts[start:start + ONNX_BATCH_SIZE])
+                   for start in range(0, len(texts), ONNX_BATCH_SIZE)]
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(batches)
+
+    def encode_batch(self, texts: list) -> np.ndarray:
+        self.load()
+        tokens = self.tokenizer(list(texts), padding=True, truncation=True,
+                                max_length=self.max_seq_length, return_tensors="np")
+        feeds = {name: tokens[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def token_lengths(self, texts: list) -> np.ndarray:
+        self.load()
+        input_ids = self.tokenizer(list(texts), truncation=True, max_length=self.max_seq_length)['input_ids']
+        return np.array([len(ids) for ids in input_ids], dtype=np.int64)
+
+
+class QuantizedOnnxEmbedder(OnnxEmbedder):
+    """ONNX Runtime with int8 dynamically quantized weights"""
+
+    quantize = True
@@ -0,0 +1,1049 @@
+"""
+Ingestion and retrieval engine.
+
+Everything that turns uploaded files into answers goes through the five
+pieces defined here:
+
+    Extractor   -> file path to plain text
+    Chunker     -> text to overlapping word windows
+    Embedder    -> texts to L2-normalised float32 vectors
+    Index       -> vectors plus chunk metadata, searched by cosine similarity
+    Synthesizer -> query plus retrieved chunks to an answer
+
+Embedder and Synthesizer backends are looked up by name in the registries
+below and imported only when selected, and the document parsers are
+imported on first use, so importing this module (and app.main) stays cheap.
+Keep it that way: benchmarks/import_time.py enforces a budget.
+"""
+import heapq
+import importlib
+import itertools
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from app import config
+from app.dedup import SignatureTable, first_occurrences, simhash_signatures
+from app.metadata import ChunkMetadata, SearchFilter
+from app.metrics import ENCODE_BATCH_SIZE, model_load, timed
+
+logger = logging.getLogger(__name__)
+
+# Rough stand-in for a subword tokenizer: words and individual punctuation marks
+_TOKEN_ESTIMATE = re.compile(r"\w+|[^\w\s]")
+
+EMBEDDER_BACKENDS = {
+    "sentence-transformers": "app.engine:SentenceTransformerEmbedder",
+    "sentence-transformers-int8": "app.embedders:QuantizedTorchEmbedder",
+    "onnx": "app.embedders:OnnxEmbedder",
+    "onnx-int8": "app.embedders:QuantizedOnnxEmbedder",
+    "server": "app.model_server:RemoteEmbedder",
+}
+
+SYNTHESIZER_BACKENDS = {
+    "rules": "app.engine:RuleSynthesizer",
+    "llm": "app.generator:GenerativeSynthesizer",
+}
+
+
+class ModelMismatchError(ValueError):
+    """Vectors from different embedding models (or dimensions) were about to be mixed"""
+
+
+def load_backend(registry: dict, name: str):
+    """Import and return the class registered under `name`"""
+    try:
+        spec = registry[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend '{name}'. Available: {', '.join(sorted(registry))}")
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class Extractor:
+    """Extract plain text from uploaded documents"""
+
+    supported_extensions = {'.pdf', '.txt', '.doc', '.docx'}
+
+    def extract(self, file_path: str) -> str:
+        """Extract text from different file types"""
+        return "".join(self.extract_pages(file_path))
+
+    def extract_pages(self, file_path: str) -> list:
+        """Extract text page by page; formats without pages yield a single page"""
+        file_extension = Path(file_path).suffix.lower()
+
+        try:
+            if file_extension == '.pdf':
+                return self.extract_pdf_pages(file_path)
+            elif file_extension == '.txt':
+                return [self.extract_txt(file_path)]
+            elif file_extension in ['.doc', '.docx']:
+                return [self.extract_docx(file_path)]
+            else:
+                return []
+        except Exception as e:
+            logger.error(f"Error extracting text from {file_path}: {str(e)}")
+            return []
+
+    def extract_pdf(self, file_path: str) -> str:
+        """Extract text from PDF file"""
+        return "".join(self.extract_pdf_pages(file_path))
+
+    def extract_pdf_pages(self, file_path: str) -> list:
+        """Extract the text of each PDF page"""
+        import PyPDF2
+
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return [page.extract_text() + "\n" for page in pdf_reader.pages]
+
+    def extract_txt(self, file_path: str) -> str:
+        """Extract text from TXT file"""
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return file.read()
+
+    def extract_docx(self, file_path: str) -> str:
+        """Extract text from DOCX file"""
+        import docx
+
+        document = docx.Document(file_path)
+        return "".join(paragraph.text + "\n" for paragraph in document.paragraphs)
+
+
+class Chunker:
+    """Split text into overlapping word windows"""
+
+    def __init__(self, chunk_size: int = config.CHUNK_SIZE, overlap: int = config.CHUNK_OVERLAP):
+        if overlap >= chunk_size:
+            raise ValueError("Chunk overlap must be smaller than the chunk size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def split(self, text: str) -> list:
+        """Split text into overlapping chunks"""
+        words = text.split()
+        step = self.chunk_size - self.overlap
+        return [' '.join(words[i:i + self.chunk_size]) for i in range(0, len(words), step)]
+
+    def split_with_spans(self, text: str):
+        """Split text into overlapping chunks, also returning each chunk's (start, end) character span"""
+        matches = list(re.finditer(r'\S+', text))
+        words = [match.group() for match in matches]
+        step = self.chunk_size - self.overlap
+        chunks, spans = [], []
+        for i in range(0, len(words), step):
+            window = slice(i, i + self.chunk_size)
+            chunks.append(' '.join(words[window]))
+            spans.append((matches[i].start(), matches[min(i + self.chunk_size, len(words)) - 1].end()))
+        return chunks, spans
+
+
+class Embedder:
+    """Base class for embedding backends"""
+
+    def __init__(self, model_name: str = config.EMBEDDING_MODEL):
+        self.model_name = model_name
+
+    @property
+    def loaded(self) -> bool:
+        return True
+
+    def load(self):
+        """Load model weights ahead of the first encode call"""
+
+    def encode(self, texts: list) -> np.ndarray:
+        """Return an (n, dim) float32 array of L2-normalised embeddings"""
+        raise NotImplementedError
+
+    def encode_batch(self, texts: list) -> np.ndarray:
+        """Encode `texts` as a single model batch; backends that split internally override this"""
+        return self.encode(texts)
+
+    def token_lengths(self, texts: list) -> np.ndarray:
+        """Token count of each text, estimated from words and punctuation unless the backend has a tokenizer"""
+        return np.array([len(_TOKEN_ESTIMATE.findall(text)) + 2 for text in texts], dtype=np.int64)
+
+    def encode_corpus(self, texts: list, token_budget: int = config.EMBEDDING_BATCH_TOKENS,
+                      max_batch: int = config.EMBEDDING_MAX_BATCH) -> np.ndarray:
+        """
+        Encode many texts with length-bucketed batches.
+
+        Texts are sorted by token length and cut into consecutive batches whose
+        padded size (batch size x longest text) stays within `token_budget`, so
+        short texts are encoded in large batches and no batch pads a short text
+        to the length of a long one. Results come back in the original order.
+        """
+        if not texts:
+            return self.encode(texts)
+        embeddings = None
+        for rows in length_buckets(self.token_lengths(texts), token_budget, max_batch):
+            batch = self.encode_batch([texts[row] for row in rows])
+            ENCODE_BATCH_SIZE.observe(len(rows))
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            embeddings[rows] = batch
+        return embeddings
+
+
+def length_buckets(lengths: np.ndarray, token_budget: int, max_batch: int) -> list:
+    """Split row numbers, longest first, into batches of at most `token_budget` padded tokens"""
+    order = np.argsort(-np.asarray(lengths), kind='stable')
+    batches, start = [], 0
+    while start < len(order):
+        size = int(max(1, min(max_batch, token_budget // max(int(lengths[order[start]]), 1))))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """Embedder backed by a sentence-transformers model running in-process"""
+
+    def __init__(self, model_name: str = config.EMBEDDING_MODEL):
+        super().__init__(model_name)
+        self.model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+
+                from app.cpu import configure_torch
+
+                configure_torch()
+                logger.info("Loading SentenceTransformer model...")
+                with model_load(self.model_name):
+                    self.model = SentenceTransformer(self.model_name)
+                logger.info("SentenceTransformer model loaded successfully")
+
+    def encode(self, texts: list, batch_size: int = 32) -> np.ndarray:
+        self.load()
+        embeddings = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def encode_batch(self, texts: list) -> np.ndarray:
+        return self.encode(texts, batch_size=max(len(texts), 1))
+
+    def token_lengths(self, texts: list) -> np.ndarray:
+        self.load()
+        input_ids = self.model.tokenizer(list(texts), truncation=True, max_length=self.model.max_seq_length)['input_ids']
+        return np.array([len(ids) for ids in input_ids], dtype=np.int64)
+
+
+class Segment:
+    """
+    Immutable batch of chunks added by one ingest call.
+
+    Only the deletion bitmap changes after creation: removing a file marks its
+    rows deleted, and compaction later rewrites segments without them.
+
+    Each segment also keeps one centroid per file (the normalised mean of its
+    chunk embeddings) and its rows grouped by file, for two-stage search, and
+    the SimHash signature of every chunk for near-duplicate detection at ingest.
+    """
+
+    def __init__(self, segment_id: int, embeddings: np.ndarray, chunks, metadatas, deleted: np.ndarray = None,
+                 centroids: np.ndarray = None, signatures: np.ndarray = None):
+        if not isinstance(metadatas, ChunkMetadata):
+            metadatas = ChunkMetadata.from_dicts(metadatas)
+        self.id = segment_id
+        self.embeddings = embeddings
+        self.chunks = chunks
+        self.metadatas = metadatas
+        self.deleted = deleted if deleted is not None else np.zeros(len(metadatas), dtype=bool)
+
+        file_count = len(metadatas.files)
+        file_ids = np.asarray(metadatas.file_ids)
+        # Rows of file f are file_rows[file_offsets[f]:file_offsets[f + 1]]
+        self.file_rows = np.argsort(file_ids, kind='stable')
+        self.file_offsets = np.concatenate(([0], np.cumsum(np.bincount(file_ids, minlength=file_count))))
+        self.count_live_rows()
+        self.centroids = centroids if centroids is not None else self._file_centroids()
+        # Computed from the texts on first use when not given
+        self._signatures = signatures
+        self._signature_table = None
+
+    def count_live_rows(self):
+        """Recompute live_count and file_live_counts from the deletion bitmap"""
+        self.live_count = int(len(self.metadatas) - self.deleted.sum())
+        self.file_live_counts = np.bincount(np.asarray(self.metadatas.file_ids)[~self.deleted],
+                                            minlength=len(self.metadatas.files))
+
+    def _file_centroids(self) -> np.ndarray:
+        dimension = self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+        file_count = len(self.file_offsets) - 1
+        if not len(self.file_rows):
+            return np.zeros((file_count, dimension), dtype=np.float32)
+        starts = self.file_offsets[:-1]
+        sums = np.zeros((file_count, dimension), dtype=np.float32)
+        # Files without rows are skipped: reduceat sums from each start to the next one given,
+        # so the remaining starts delimit exactly the rows of their files
+        has_rows = starts < self.file_offsets[1:]
+        sums[has_rows] = np.add.reduceat(np.asarray(self.embeddings)[self.file_rows], starts[has_rows])
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        return (sums / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.metadatas)
+
+    @property
+    def signatures(self) -> np.ndarray:
+        if self._signatures is None:
+            self._signatures = simhash_signatures(self.chunks)
+        return self._signatures
+
+    def near_duplicates(self, signatures: np.ndarray, max_distance: int) -> np.ndarray:
+        """For each signature, a live row within max_distance bits of it, or -1"""
+        if self._signature_table is None or self._signature_table.max_distance != max_distance:
+            self._signature_table = SignatureTable(self.signatures, max_distance)
+        found = np.full(len(signatures), -1, dtype=np.int64)
+        if not self.live_count:
+            return found
+        live = ~self.deleted
+        for i, signature in enumerate(np.asarray(signatures).tolist()):
+            rows = self._signature_table.matches(signature, live)
+            if len(rows):
+                found[i] = rows[0]
+        return found
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(~self.deleted)
+
+    def delete_file(self, filename: str) -> int:
+        """Mark every row of `filename` deleted, returning how many were live"""
+        file_id = self.metadatas.file_id(filename)
+        if file_id < 0:
+            return 0
+        rows = self.rows_of_files([file_id])
+        newly_deleted = int((~self.deleted[rows]).sum())
+        self.deleted[rows] = True
+        self.live_count -= newly_deleted
+        self.file_live_counts[file_id] -= newly_deleted
+        return newly_deleted
+
+    def rows_of_files(self, file_ids) -> np.ndarray:
+        """Row numbers of every chunk of the given files, without scanning the segment"""
+        if len(file_ids) == 1:
+            return self.file_rows[self.file_offsets[file_ids[0]]:self.file_offsets[file_ids[0] + 1]]
+        return np.concatenate([self.file_rows[self.file_offsets[f]:self.file_offsets[f + 1]] for f in file_ids]) \
+            if len(file_ids) else np.zeros(0, dtype=np.int64)
+
+    def search(self, query_embedding: np.ndarray, top_k: int, search_filter: SearchFilter = None,
+               min_score: float = None, file_ids=None) -> list:
+        """
+        Return up to top_k (score, row) pairs scoring at least min_score, unordered.
+        With `file_ids`, only the chunks of those files are scored (and search_filter is
+        assumed to have been applied when choosing them).
+        """
+        rows = None
+        if file_ids is not None:
+            rows = self.rows_of_files(file_ids)
+        elif search_filter is not None and not search_filter.is_empty:
+            # Pre-filter on the file table so only matching rows are scored
+            rows = self.metadatas.filter_rows(search_filter)
+
+        if rows is None:
+            available = self.live_count
+            if available <= 0:
+                return []
+            similarities = self.embeddings @ query_embedding
+            if self.live_count < len(self):
+                similarities[self.deleted] = -np.inf
+        else:
+            if self.live_count < len(self):
+                rows = rows[~self.deleted[rows]]
+            available = len(rows)
+            if available <= 0:
+                return []
+            similarities = self.embeddings[rows] @ query_embedding
+
+        positions = None
+        if min_score is not None:
+            positions = np.flatnonzero(similarities >= min_score)
+            similarities = similarities[positions]
+            available = len(positions)
+
+        k = min(top_k, available)
+        if k <= 0:
+            return []
+        top = np.argpartition(-similarities, k - 1)[:k]
+        scores = similarities[top]
+        if positions is not None:
+            top = positions[top]
+        if rows is not None:
+            top = rows[top]
+        return list(zip(scores.tolist(), top.tolist()))
+
+
+class Index:
+    """
+    Segmented in-memory index of chunk embeddings, searched by cosine similarity.
+
+    Each add() creates a new segment, so ingesting is proportional to the new
+    data, and remove_file() only flips bits in the deletion bitmaps. Segments are
+    searched independently (in parallel when the index is large) and their
+    candidates merged with a heap; compact() merges small or mostly-deleted
+    segments according to the policy in app/config.py.
+
+    The index records the embedding model and dimension of its vectors and
+    refuses to add or search with vectors of another model.
+    """
+
+    def __init__(self, segments: list = None, next_segment_id: int = 1, model: str = None, dim: int = None):
+        self.segments = list(segments or [])
+        self.next_segment_id = next_segment_id
+        self.model = model
+        if dim is None and self.segments and self.segments[0].embeddings.ndim == 2:
+            dim = self.segments[0].embeddings.shape[1]
+        self.dim = dim
+        # Bumped whenever the searchable contents change
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(segment.live_count for segment in self.segments)
+
+    def renumber(self, next_segment_id: int):
+        """Give the segments fresh ids from `next_segment_id` on; only for an index not yet published"""
+        with self._lock:
+            for segment in self.segments:
+                segment.id = next_segment_id
+                next_segment_id += 1
+            self.next_segment_id = next_segment_id
+
+    def add(self, chunks: list, metadatas: list, embeddings: np.ndarray, model: str = None,
+            signatures: np.ndarray = None):
+        """Add chunks with their metadata and (normalised) embeddings from `model` as a new segment"""
+        if not chunks:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if model is not None and self.model is not None and model != self.model:
+                raise ModelMismatchError(f"Cannot add {model} embeddings to an index of {self.model} embeddings")
+            if self.dim is not None and embeddings.shape[1] != self.dim:
+                raise ModelMismatchError(f"Cannot add {embeddings.shape[1]}-dimensional embeddings "
+                                         f"to an index of dimension {self.dim}")
+            self.model = self.model or model
+            self.dim = embeddings.shape[1]
+            segment = Segment(self.next_segment_id, embeddings, list(chunks), metadatas, signatures=signatures)
+            self.next_segment_id += 1
+            # Replace rather than append so concurrent searches keep a consistent list
+            self.segments = self.segments + [segment]
+            self.generation += 1
+
+    def remove_file(self, filename: str):
+        """Drop every chunk that came from `filename`"""
+        with self._lock:
+            if sum(segment.delete_file(filename) for segment in self.segments):
+                self.generation += 1
+
+    def find_near_duplicates(self, signatures: np.ndarray, max_distance: int) -> list:
+        """For each signature, (segment, row) of a live chunk within max_distance bits of it, or None"""
+        found = [None] * len(signatures)
+        for segment in self.segments:
+            missing = [i for i, match in enumerate(found) if match is None]
+            if not missing:
+                break
+            rows = segment.near_duplicates(np.asarray(signatures)[missing], max_distance)
+            for i, row in zip(missing, rows.tolist()):
+                if row >= 0:
+                    found[i] = (segment, row)
+        return found
+
+    def iter_chunks(self):
+        """Yield (text, metadata) for every live chunk"""
+        for segment in self.segments:
+            for row in segment.live_rows():
+                yield segment.chunks[row], segment.metadatas[row]
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 3, search_filter: SearchFilter = None,
+               min_score: float = None, with_text: bool = True, with_embeddings: bool = False) -> list:
+        """
+        Return the top_k chunks most similar to a normalised query embedding, best first.
+        With with_text=False the chunk texts are not materialised ('text' is None), and
+        with_embeddings=True adds each chunk's vector as 'embedding'.
+
+        Each segment selects its own top_k with argpartition and the candidates are
+        merged with a bounded heap, so nothing is fully sorted even for large k.
+        """
+        segments = self.segments
+        if not segments or top_k <= 0:
+            return []
+
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        if self.dim is not None and len(query_embedding) != self.dim:
+            raise ModelMismatchError(f"Query embedding has dimension {len(query_embedding)}, the index {self.dim}")
+        total = sum(len(segment) for segment in segments)
+
+        selected = None
+        if config.TWO_STAGE_TOP_DOCS and total >= config.TWO_STAGE_MIN_CHUNKS:
+            selected = self.select_documents(query_embedding, config.TWO_STAGE_TOP_DOCS, top_k, search_filter)
+            segments = [segment for segment in segments if segment.id in selected]
+
+        def search_segment(segment):
+            file_ids = selected[segment.id] if selected is not None else None
+            return segment.search(query_embedding, top_k, search_filter, min_score, file_ids)
+
+        if len(segments) > 1 and total >= config.PARALLEL_SEARCH_MIN_CHUNKS:
+            # numpy releases the GIL inside the matrix products
+            results = list(_search_pool().map(search_segment, segments))
+        else:
+            results = [search_segment(segment) for segment in segments]
+
+        candidates = (
+            (score, position, row)
+            for position, segment_results in enumerate(results)
+            for score, row in segment_results
+        )
+        results = []
+        for score, position, row in heapq.nlargest(top_k, candidates):
+            result = {
+                'text': segments[position].chunks[row] if with_text else None,
+                'metadata': segments[position].metadatas[row],
+                'similarity': score
+            }
+            if with_embeddings:
+                result['embedding'] = np.array(segments[position].embeddings[row])
+            results.append(result)
+        return results
+
+    def select_documents(self, query_embedding: np.ndarray, top_docs: int, top_k: int,
+                         search_filter: SearchFilter = None) -> dict:
+        """
+        First stage of two-stage search: rank documents by the similarity of their
+        centroid to the query and keep the best `top_docs`, plus as many more as it
+        takes to have `top_k` chunks. Returns {segment id: [file ids]}.
+        """
+        scores, owners = [], []
+        for segment in self.segments:
+            file_ids = np.flatnonzero(segment.file_live_counts > 0)
+            if search_filter is not None and not search_filter.is_empty:
+                file_ids = np.intersect1d(file_ids, segment.metadatas.allowed_file_ids(search_filter))
+            if not len(file_ids):
+                continue
+            scores.append(segment.centroids[file_ids] @ query_embedding)
+            owners.extend((segment, int(file_id)) for file_id in file_ids)
+        if not owners:
+            return {}
+
+        scores = np.concatenate(scores)
+        selected, chunks = {}, 0
+        for position in np.argsort(-scores, kind='stable'):
+            if len(selected) and sum(map(len, selected.values())) >= top_docs and chunks >= top_k:
+                break
+            segment, file_id = owners[position]
+            selected.setdefault(segment.id, []).append(file_id)
+            chunks += int(segment.file_live_counts[file_id])
+        return selected
+
+    def compaction_candidates(self) -> list:
+        """Segments the compaction policy wants merged, or [] when none"""
+        segments = self.segments
+        victims = [
+            segment for segment in segments
+            if len(segment) and 1 - segment.live_count / len(segment) > config.COMPACTION_MAX_DELETED_RATIO
+        ]
+        if len(segments) > config.COMPACTION_MAX_SEGMENTS:
+            by_size = sorted((s for s in segments if s not in victims), key=lambda segment: segment.live_count)
+            victims += by_size[:max(config.COMPACTION_MERGE_FACTOR - len(victims), 0)]
+        if len(victims) == 1 and victims[0].live_count == len(victims[0]):
+            return []
+        return victims
+
+    def compact(self) -> bool:
+        """Merge the segments picked by the compaction policy; returns whether anything changed"""
+        victims = self.compaction_candidates()
+        if not victims:
+            return False
+
+        # Build the merged segment without blocking searches or deletes
+        snapshot = [(segment, segment.live_rows()) for segment in victims]
+        embeddings = [segment.embeddings[rows] for segment, rows in snapshot if len(rows)]
+        dimension = victims[0].embeddings.shape[1] if victims[0].embeddings.ndim == 2 else 0
+        merged_embeddings = np.vstack(embeddings) if embeddings else np.zeros((0, dimension), dtype=np.float32)
+        merged_chunks = [segment.chunks[row] for segment, rows in snapshot for row in rows]
+        merged_metadatas = ChunkMetadata.concat([segment.metadatas.take(rows) for segment, rows in snapshot])
+        merged_signatures = np.concatenate([segment.signatures[rows] for segment, rows in snapshot])
+
+        with self._lock:
+            merged = Segment(self.next_segment_id, merged_embeddings, merged_chunks, merged_metadatas,
+                             signatures=merged_signatures)
+            self.next_segment_id += 1
+
+            # Carry over rows deleted while we were merging
+            offset = 0
+            for segment, rows in snapshot:
+                deleted_since = np.flatnonzero(segment.deleted[rows])
+                merged.deleted[offset + deleted_since] = True
+                offset += len(rows)
+            merged.count_live_rows()
+
+            victim_ids = {segment.id for segment in victims}
+            remaining = [segment for segment in self.segments if segment.id not in victim_ids]
+            self.segments = remaining + ([merged] if len(merged) else [])
+
+        logger.info(f"Compacted {len(victims)} segments into one of {merged.live_count} chunks")
+        return True
+
+
+_pool = None
+
+
+def mmr_order(query_embedding: np.ndarray, embeddings: np.ndarray, k: int, relevance_weight: float) -> list:
+    """
+    Pick k rows of `embeddings` by maximal marginal relevance: each step takes the
+    row maximising relevance_weight * sim(query) - (1 - relevance_weight) * max sim(picked).
+    The pairwise similarities are computed once; each step is a vector update.
+    """
+    k = min(k, len(embeddings))
+    if k <= 0:
+        return []
+    relevance = embeddings @ query_embedding
+    similarity = embeddings @ embeddings.T
+    chosen = [int(np.argmax(relevance))]
+    redundancy = similarity[chosen[0]].copy()
+    available = np.ones(len(embeddings), dtype=bool)
+    available[chosen[0]] = False
+    while len(chosen) < k:
+        scores = relevance_weight * relevance - (1 - relevance_weight) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return chosen
+
+
+def _search_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=config.SEARCH_THREADS, thread_name_prefix="segment-search")
+    return _pool
+
+
+class Synthesizer:
+    """
+    Base class for answer synthesis backends. `generation` identifies the index
+    contents the chunks were retrieved from, for backends that cache answers.
+    """
+
+    def answer(self, query: str, relevant_chunks: list, generation: str = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, query: str, relevant_chunks: list, generation: str = None):
+        """
+        Yield the answer in pieces as they become available. Backends that
+        produce the whole answer at once yield it line by line.
+        """
+        yield from self.answer(query, relevant_chunks, generation).splitlines(keepends=True)
+
+
+class RuleSynthesizer(Synthesizer):
+    """Template and sentence-extraction synthesis from app/synthesis.py"""
+
+    def answer(self, query: str, relevant_chunks: list, generation: str = None) -> str:
+        from app.synthesis import generate_intelligent_answer
+
+        return generate_intelligent_answer(query, relevant_chunks, generation=generation)
+
+
+class Engine:
+    """Keeps the index in step with the upload directory and answers queries"""
+
+    def __init__(self, upload_dir: Path = config.UPLOAD_DIR, extractor: Extractor = None,
+                 chunker: Chunker = None, embedder: Embedder = None, index: Index = None,
+                 synthesizer: Synthesizer = None, store=None):
+        self.upload_dir = Path(upload_dir)
+        self.extractor = extractor or Extractor()
+        self.chunker = chunker or Chunker()
+        self.embedder = embedder or load_backend(EMBEDDER_BACKENDS, config.EMBEDDER_BACKEND)()
+        # Model this process is configured with (EMBEDDING_MODEL), and the one the index should be embedded
+        # with; the live index may still use an older one until re-embedded
+        self.configured_model = self.embedder.model_name
+        self.target_model = self.embedder.model_name
+        self._embedders = {self.embedder.model_name: self.embedder}
+        self.index = index if index is not None else Index(model=self.embedder.model_name)
+        self.synthesizer = synthesizer or load_backend(SYNTHESIZER_BACKENDS, config.SYNTHESIZER_BACKEND)()
+        if store is None and config.INDEX_DIR:
+            from app.shared_index import IndexStore
+
+            store = IndexStore(config.INDEX_DIR)
+        # Shared snapshot store (app/shared_index.py); None keeps the index private to this process
+        self.store = store
+        self.version = 0
+        # filename -> (mtime_ns, size) of the version currently in the index
+        self._files = {}
+        self._lock = threading.RLock()
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compaction")
+        self._compaction_scheduled = False
+        self._reembedder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reembed")
+        self.reembed_status = {'state': 'idle'}
+        # Chunks ingested by this process, and how many were near-duplicates
+        self.dedup_stats = {'chunks': 0, 'duplicates': 0}
+
+    def process_file(self, file_path: Path):
+        """Extract and chunk one file, returning (chunks, ChunkMetadata)"""
+        with timed("extract"):
+            pages = self.extractor.extract_pages(str(file_path))
+        text = "".join(pages)
+        if not text.strip():
+            return [], None
+        with timed("chunk"):
+            chunks, spans = self.chunker.split_with_spans(text)
+        page_starts = list(itertools.accumulate((len(page) for page in pages[:-1]), initial=0))
+        return chunks, ChunkMetadata.for_file(file_path.name, spans, page_starts,
+                                              uploaded_at=file_path.stat().st_mtime)
+
+    def ingest_file(self, file_path: Path):
+        """(Re)index a single file"""
+        chunks, metadatas = self.process_file(file_path)
+        with timed("dedup"):
+            signatures = simhash_signatures(chunks)
+        with self._lock:
+            self.index.remove_file(file_path.name)
+            if not chunks:
+                return
+            if config.DEDUP_MODE == "off":
+                with timed("encode"):
+                    embeddings = self.embedder.encode_corpus(chunks)
+            else:
+                chunks, metadatas, embeddings, signatures = self._deduplicate(
+                    file_path.name, chunks, metadatas, signatures)
+            if chunks:
+                self.index.add(chunks, metadatas, embeddings, model=self.embedder.model_name, signatures=signatures)
+
+    def _deduplicate(self, filename: str, chunks: list, metadatas: ChunkMetadata, signatures: np.ndarray):
+        """
+        Find chunks that near-duplicate an indexed chunk or an earlier chunk of the
+        same file, and encode only the others. DEDUP_MODE=link gives duplicates the
+        embedding of their original; skip leaves them out of the index.
+        Returns (chunks, metadatas, embeddings, signatures) to add. Hold _lock.
+        """
+        with timed("dedup"):
+            originals = self.index.find_near_duplicates(signatures, config.DEDUP_MAX_DISTANCE)
+            within_file = first_occurrences(signatures, config.DEDUP_MAX_DISTANCE)
+        unique = np.array([original is None and first < 0 for original, first in zip(originals, within_file)])
+        duplicates = int(len(chunks) - unique.sum())
+
+        stats = self.dedup_stats
+        stats['chunks'] += len(chunks)
+        stats['duplicates'] += duplicates
+        if duplicates:
+            logger.info(f"{filename}: {duplicates} of {len(chunks)} chunks are near-duplicates "
+                        f"({'linked' if config.DEDUP_MODE == 'link' else 'skipped'})")
+
+        keep = np.flatnonzero(unique) if config.DEDUP_MODE == "skip" else np.arange(len(chunks))
+        unique_rows = np.flatnonzero(unique)
+        with timed("encode"):
+            encoded = self.embedder.encode_corpus([chunks[row] for row in unique_rows])
+        if config.DEDUP_MODE == "skip":
+            embeddings = encoded
+        else:
+            embeddings = np.zeros((len(chunks), encoded.shape[1] if len(encoded) else self.index.dim),
+                                  dtype=np.float32)
+            embeddings[unique_rows] = encoded
+            for row in np.flatnonzero(~unique):
+                if originals[row] is not None:
+                    segment, original_row = originals[row]
+                    embeddings[row] = segment.embeddings[original_row]
+                else:
+                    embeddings[row] = embeddings[within_file[row]]
+        return [chunks[row] for row in keep], metadatas.take(keep), embeddings, signatures[keep]
+
+    def scan_uploads(self) -> dict:
+        """Return {filename: (mtime_ns, size)} for every file in the upload directory"""
+        current = {}
+        if self.upload_dir.exists():
+            for file_path in self.upload_dir.iterdir():
+                if file_path.is_file():
+                    stat = file_path.stat()
+                    current[file_path.name] = (stat.st_mtime_ns, stat.st_size)
+        return current
+
+    def _apply_changes(self, current: dict) -> bool:
+        """Bring the index in line with `current`; returns whether anything changed"""
+        changed = False
+        for filename in set(self._files) - set(current):
+            logger.info(f"Removing {filename} from the index")
+            self.index.remove_file(filename)
+            del self._files[filename]
+            changed = True
+
+        for filename, signature in current.items():
+            if self._files.get(filename) == signature:
+                continue
+            logger.info(f"Indexing {filename}")
+            try:
+                self.ingest_file(self.upload_dir / filename)
+            except Exception as e:
+                logger.error(f"Error processing file {filename}: {str(e)}")
+            self._files[filename] = signature
+            changed = True
+        return changed
+
+    def sync(self):
+        """Index new or modified uploads and forget deleted ones"""
+        current = self.scan_uploads()
+        if self.store is not None and current == self._files and self.store.current_version() == self.version:
+            # Fast path: nothing uploaded and no other worker has published since we attached
+            return
+
+        with self._lock:
+            if self.store is None:
+                changed = self._apply_changes(current)
+            else:
+                with self.store.lock():
+                    self._attach_latest()
+                    changed = self._apply_changes(current)
+                    if changed:
+                        self._publish()
+        if changed:
+            self.schedule_compaction()
+
+    def _attach_latest(self):
+        version = self.store.current_version()
+        if version != self.version:
+            first_attach = self.version == 0
+            self.index, self._files = self.store.attach(version)
+            self.version = version
+            self._follow_index_model(first_attach)
+
+    def _embedder_for(self, model_name: str) -> Embedder:
+        """Embedder of the configured backend for `model_name`, created once"""
+        if model_name not in self._embedders:
+            self._embedders[model_name] = type(self.embedder)(model_name)
+        return self._embedders[model_name]
+
+    def _follow_index_model(self, first_attach: bool = False):
+        """
+        Encode queries with whatever model the attached index was built with.
+        Only a process starting up against an index of another model than it is
+        configured for re-embeds it, unless an admin re-embedded the index with
+        that model while this configuration was in place; later switches were
+        published by another worker's re-embed and are simply followed.
+        """
+        model = self.index.model
+        if model is None or model == self.embedder.model_name:
+            return
+        logger.info(f"Index snapshot {self.version} was embedded with {model}, switching query encoder")
+        self.embedder = self._embedder_for(model)
+        if first_attach and model != self.target_model and config.REEMBED_ON_MODEL_CHANGE:
+            if self.store.model_override() != {'model': model, 'configured_model': self.configured_model}:
+                self.schedule_reembed(self.target_model)
+                return
+            logger.warning(f"Keeping {model}, which an admin re-embedded the index with, instead of "
+                           f"EMBEDDING_MODEL={self.configured_model}; set EMBEDDING_MODEL={model} to match")
+        if self.reembed_status['state'] not in ('queued', 'running'):
+            self.target_model = model
+
+    def _publish(self):
+        self.version = self.store.publish(self.index, self._files)
+        # Drop private copies and map the published snapshot like every other worker
+        self.index, self._files = self.store.attach(self.version)
+
+    def schedule_compaction(self):
+        """Run compact() on the background compaction thread unless it is already queued"""
+        if self.index.compaction_candidates() and not self._compaction_scheduled:
+            self._compaction_scheduled = True
+            self._compactor.submit(self.compact)
+
+    def compact(self):
+        """Merge segments according to the compaction policy"""
+        self._compaction_scheduled = False
+        try:
+            if self.store is None:
+                while self.index.compact():
+                    pass
+                return
+            with self._lock, self.store.lock():
+                self._attach_latest()
+                changed = False
+                while self.index.compact():
+                    changed = True
+                if changed:
+                    self._publish()
+        except Exception as e:
+            logger.error(f"Index compaction failed: {str(e)}", exc_info=True)
+
+    def schedule_reembed(self, model_name: str) -> bool:
+        """Start re-embedding the index with `model_name` in the background; False if one is already running"""
+        with self._lock:
+            if self.reembed_status['state'] in ('queued', 'running'):
+                return False
+            self.target_model = model_name
+            self.reembed_status = {'state': 'queued', 'model': model_name}
+        self._reembedder.submit(self.reembed, model_name)
+        return True
+
+    def reembed(self, model_name: str):
+        """
+        Rebuild the index with `model_name` next to the live one and swap it in.
+
+        Every live chunk is re-encoded outside the engine lock while queries keep
+        using the old index and model. Uploads and deletes that landed in the
+        meantime are then replayed onto the new index, and index and query
+        encoder are replaced together (and published, with a shared store), so
+        searches never mix the two models.
+
+        With a shared store one process re-embeds at a time: workers started
+        together against an index of another model wait for the first, then
+        find its snapshot already uses `model_name` and follow it. A re-embed
+        to another model than EMBEDDING_MODEL is recorded in the store, so
+        restarts with the same configuration keep it instead of reverting.
+        """
+        if self.store is None:
+            self._reembed(model_name)
+            return
+        with self.store.reembed_lock():
+            self._reembed(model_name)
+
+    def _reembed(self, model_name: str):
+        status = {'state': 'running', 'model': model_name, 'done': 0, 'total': 0}
+        self.reembed_status = status
+        try:
+            embedder = self._embedder_for(model_name)
+            embedder.load()
+            with self._lock:
+                if self.store is not None:
+                    with self.store.lock():
+                        self._attach_latest()
+                old_index, files = self.index, dict(self._files)
+
+            if old_index.model == model_name:
+                self.reembed_status = {'state': 'done', 'model': model_name}
+                return
+            logger.info(f"Re-embedding {len(old_index)} chunks from {old_index.model} to {model_name}")
+            status['total'] = len(old_index)
+            new_index = Index(next_segment_id=old_index.next_segment_id, model=model_name)
+            for segment in old_index.segments:
+                rows = segment.live_rows()
+                if not len(rows):
+                    continue
+                chunks = [segment.chunks[row] for row in rows]
+                new_index.add(chunks, segment.metadatas.take(rows), embedder.encode_corpus(chunks), model=model_name,
+                              signatures=segment.signatures[rows])
+                status['done'] += len(rows)
+
+            with self._lock:
+                if self.store is None:
+                    self._swap_index(new_index, embedder, files)
+                else:
+                    with self.store.lock():
+                        self._attach_latest()
+                        if self.index.model == model_name:
+                            logger.info(f"Another worker already re-embedded the index with {model_name}")
+                        else:
+                            self._swap_index(new_index, embedder, files)
+                            self._publish()
+                            self.store.set_model_override(None if model_name == self.configured_model else {
+                                'model': model_name, 'configured_model': self.configured_model})
+            self.reembed_status = {'state': 'done', 'model': model_name, 'chunks': status['done']}
+            logger.info(f"Index re-embedded with {model_name}")
+        except Exception as e:
+            logger.error(f"Re-embedding with {model_name} failed: {str(e)}", exc_info=True)
+            self.reembed_status = {'state': 'failed', 'model': model_name, 'error': str(e)}
+
+    def _swap_index(self, new_index: Index, embedder: Embedder, files: dict):
+        """
+        Replace index and query encoder, replaying file changes made since `files`
+        was taken. Hold _lock, and the store lock after attaching the latest
+        snapshot when shared: the new index was numbered from an older snapshot,
+        and segment ids taken by others since must not be reused.
+        """
+        current = self._files
+        new_index.renumber(self.index.next_segment_id)
+        new_index.generation = self.index.generation + 1
+        self.index, self.embedder, self._files = new_index, embedder, files
+        self._apply_changes(current)
+
+    def warm_up(self):
+        """Load the model and build the index ahead of the first query"""
+        try:
+            self.embedder.load()
+            self.sync()
+        except Exception as e:
+            logger.error(f"Engine warm-up failed: {str(e)}")
+
+    @property
+    def generation(self) -> str:
+        """Identifies the current index contents; changes whenever search results could"""
+        return f"{self.version}.{self.index.generation}"
+
+    def _serving(self):
+        """The (index, embedder) pair queries must use together"""
+        index, embedder = self.index, self.embedder
+        if index.model is not None and index.model != embedder.model_name:
+            # A re-embed may be swapping both right now; it does so under the lock
+            with self._lock:
+                index, embedder = self.index, self.embedder
+            if index.model is not None and index.model != embedder.model_name:
+                raise ModelMismatchError(f"Index embedded with {index.model}, queries with {embedder.model_name}")
+        return index, embedder
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Encode a query with the model the index was built with"""
+        _, embedder = self._serving()
+        with timed("encode_query"):
+            return embedder.encode([query])[0]
+
+    def search(self, query: str, top_k: int = 3, search_filter: SearchFilter = None, min_score: float = None,
+               offset: int = 0, with_text: bool = True, query_embedding: np.ndarray = None,
+               with_embeddings: bool = False) -> list:
+        """
+        Find the most relevant indexed chunks, ranked positions [offset, offset + top_k).
+        Pass `query_embedding` when the query was already encoded with embed_query().
+        Call sync() first to pick up new uploads.
+        """
+        index, embedder = self._serving()
+        if not len(index):
+            return []
+        if query_embedding is None:
+            with timed("encode_query"):
+                query_embedding = embedder.encode([query])[0]
+        with timed("search"):
+            results = index.search(query_embedding, top_k=offset + top_k, search_filter=search_filter,
+                                   min_score=min_score, with_text=with_text, with_embeddings=with_embeddings)
+        return results[offset:]
+
+    def select_context(self, query_embedding: np.ndarray, candidates: list,
+                       k: int = config.CONTEXT_CHUNKS) -> list:
+        """
+        The k chunks handed to the synthesizer, chosen from `candidates` (searched
+        with_embeddings=True, best first) by MMR so overlapping chunks don't take
+        several slots. Falls back to the top k when MMR is disabled.
+        """
+        if config.MMR_LAMBDA >= 1 or len(candidates) <= 1:
+            return candidates[:k]
+        with timed("rerank"):
+            embeddings = np.stack([candidate['embedding'] for candidate in candidates])
+            return [candidates[i] for i in mmr_order(query_embedding, embeddings, k, config.MMR_LAMBDA)]
+
+    def answer(self, query: str, relevant_chunks: list) -> str:
+        return self.synthesizer.answer(query, relevant_chunks, generation=self.generation)
+
+    def stream_answer(self, query: str, relevant_chunks: list):
+        return self.synthesizer.stream(query, relevant_chunks, generation=self.generation)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Process-wide engine, created with the configured backends on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = Engine()
+    return _engine
@@ -1,8 +1,55 @@
+# langchain and transformers take seconds to import, so they are only
+# pulled in when one of these helpers is actually called.
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_huggingface import HuggingFacePipeline
-from transformers import pipeline
+from app import config
+from app.engine import Synthesizer
+from app.metrics import model_load, register_gauge
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE = """
+    You are an expert assistant. Your task is to answer the user's question based *only* on the provided context.
+    Read the context carefully, synthesize the information, and provide a clear, concise answer.Do not repeat yourself.
+    Do not add any information that is not in the context.
+
+    Context:
+    {context}
+
+    Question:
+    {question}
+
+    Concise Answer:
+    """
+
+@lru_cache(maxsize=None)
+def get_pipeline(model_name: str = config.GENERATOR_MODEL):
+    """
+    Load a text2text-generation pipeline once per model and reuse it.
+
+    Args:
+        model_name (str, optional): The name of the model to use. Defaults to GENERATOR_MODEL.
+
+    Returns:
+        Pipeline: A transformers pipeline running on CPU.
+    """
+    from transformers import pipeline
+
+    logger.info(f"Loading generation model {model_name}...")
+    with model_load(model_name):
+        pipe = pipeline(
+            "text2text-generation",
+            model=model_name,
+            max_length=512,
+            device=-1  # Force CPU usage
+        )
+    logger.info("Generation model loaded successfully")
+    return pipe
 
 def get_llm(model_name: str = "google/flan-t5-small", temperature: float = 0.7):
     """
@@ -15,39 +62,24 @@ def get_llm(model_name: str = "google/flan-t5-small", temperature: float = 0.7):
     Returns:
         HuggingFacePipeline: A Hugging Face pipeline.
     """
-    pipe = pipeline(
-        "text2text-generation",
-        model=model_name,
-        max_length=512,
-        device=-1  # Force CPU usage
-    )
+    from langchain_huggingface import HuggingFacePipeline
+
     # The temperature flag is not valid for flan-t5 models and will be ignored.
-    return HuggingFacePipeline(pipeline=pipe)
+    return HuggingFacePipeline(pipeline=get_pipeline(model_name))
 
-def get_prompt_template() -> PromptTemplate:
+def get_prompt_template() -> "PromptTemplate":
     """
     Get the prompt template for the RAG system.
 
     Returns:
         PromptTemplate: A prompt template.
     """
-    prompt_template = """
-    You are an expert assistant. Your task is to answer the user's question based *only* on the provided context.
-    Read the context carefully, synthesize the information, and provide a clear, concise answer.Do not repeat yourself.
-    Do not add any information that is not in the context.
-
-    Context:
-    {context}
-
-    Question:
-    {question}
+    from langchain.prompts import PromptTemplate
 
-    Concise Answer:
-    """
-    return PromptTemplate(template=prompt_template, input_variables=["context", "question"])
+    return PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["context", "question"])
 
 
-def create_llm_chain(llm, prompt_template: PromptTemplate) -> LLMChain:
+def create_llm_chain(llm, prompt_template: "PromptTemplate") -> "LLMChain":
     """
     Create an LLM chain.
 
@@ -58,5 +90,191 @@ def create_llm_chain(llm, prompt_template: PromptTemplate) -> LLMChain:
     Returns:
         LLMChain: An LLM chain.
     """
+    from langchain.chains import LLMChain
+
     return LLMChain(llm=llm, prompt=prompt_template)
 
+
+class _Request:
+    def __init__(self, prompt: str, streamer=None):
+        self.prompt = prompt
+        self.streamer = streamer
+        self.future = Future()
+        self.abandoned = threading.Event()
+
+    def abandon(self):
+        """The caller stopped waiting: skip the request if still queued, stop streaming it if running"""
+        self.abandoned.set()
+        self.future.cancel()
+
+
+def _stop_when(event: threading.Event):
+    """Stopping criteria that end generation as soon as `event` is set"""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class StopWhenSet(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([StopWhenSet()])
+
+
+class GenerativeSynthesizer(Synthesizer):
+    """
+    Answers with a local seq2seq model (SYNTHESIZER_BACKEND=llm).
+
+    One pipeline is loaded per process and driven by a single worker thread.
+    Concurrent requests are queued and generated together in batches of up to
+    GENERATOR_MAX_BATCH, with at most GENERATOR_MAX_NEW_TOKENS new tokens each.
+    When the queue is so long that a new request would wait past
+    GENERATOR_LATENCY_BUDGET_MS (estimated from recent batch times), or
+    generation overruns that budget, the answer falls back to the extractive
+    extract_best_sentences summary instead. A request whose caller stopped
+    waiting is cancelled: skipped if still queued, and when streaming, its
+    generation is stopped.
+    """
+
+    def __init__(self, model_name: str = config.GENERATOR_MODEL,
+                 max_new_tokens: int = config.GENERATOR_MAX_NEW_TOKENS,
+                 max_batch: int = config.GENERATOR_MAX_BATCH,
+                 max_wait_ms: float = config.GENERATOR_MAX_WAIT_MS,
+                 latency_budget_ms: float = config.GENERATOR_LATENCY_BUDGET_MS):
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.latency_budget = latency_budget_ms / 1000
+        self.queue = queue.Queue(maxsize=config.GENERATOR_QUEUE_SIZE)
+        register_gauge("kb_generation_queue_depth", "Requests waiting for the generation worker", self.queue.qsize)
+        # Exponentially weighted average of seconds per batch; None until measured
+        self.batch_seconds = None
+        # A streaming request taken off the queue while filling a batch, generated next round
+        self._holdover = None
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="generation-worker", daemon=True)
+                self._worker.start()
+
+    def estimated_wait(self) -> float:
+        """Seconds a request enqueued now would take to complete"""
+        if self.batch_seconds is None:
+            return 0.0
+        batches_ahead = self.queue.qsize() // self.max_batch + 1
+        return batches_ahead * self.batch_seconds
+
+    def _run(self):
+        pipe = get_pipeline(self.model_name)
+        while True:
+            batch = [self._holdover or self.queue.get()]
+            self._holdover = None
+            # A streaming request is generated on its own so its tokens can flow back as produced
+            if batch[0].streamer is None:
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item.streamer is not None:
+                        # Hold it for the next round; putting it back could block on a full queue
+                        self._holdover = item
+                        break
+                    batch.append(item)
+            # Callers that gave up waiting have cancelled their requests
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            try:
+                kwargs = {"max_new_tokens": self.max_new_tokens, "truncation": True}
+                if batch[0].streamer is not None:
+                    kwargs["streamer"] = batch[0].streamer
+                    kwargs["stopping_criteria"] = _stop_when(batch[0].abandoned)
+                outputs = pipe([item.prompt for item in batch], batch_size=len(batch), **kwargs)
+                for item, output in zip(batch, outputs):
+                    item.future.set_result(output["generated_text"].strip())
+            except Exception as e:
+                logger.error(f"Generation failed: {str(e)}")
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                if batch[0].streamer is not None:
+                    batch[0].streamer.end()
+            elapsed = time.monotonic() - started
+            self.batch_seconds = elapsed if self.batch_seconds is None else 0.8 * self.batch_seconds + 0.2 * elapsed
+
+    def _prompt(self, query: str, relevant_chunks: list) -> str:
+        context = "\n\n".join(chunk['text'] for chunk in relevant_chunks[:config.CONTEXT_CHUNKS])
+        return PROMPT_TEMPLATE.format(context=context, question=query)
+
+    def _submit(self, request: _Request) -> bool:
+        """Queue a request unless that would blow the latency budget"""
+        self._ensure_worker()
+        if self.estimated_wait() > self.latency_budget:
+            logger.warning("Generation queue over its latency budget, falling back to extractive answer")
+            return False
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            logger.warning("Generation queue full, falling back to extractive answer")
+            return False
+        return True
+
+    @staticmethod
+    def _fallback(query: str, relevant_chunks: list) -> str:
+        from app.synthesis import extract_best_sentences
+
+        context = "\n\n".join(chunk['text'] for chunk in relevant_chunks[:config.CONTEXT_CHUNKS])
+        return extract_best_sentences(query, context)
+
+    @staticmethod
+    def _sources_line(relevant_chunks: list) -> str:
+        sources = sorted(set(chunk['metadata']['file'] for chunk in relevant_chunks[:config.CONTEXT_CHUNKS]))
+        return f"\n\n**Source:** {', '.join(sources)}"
+
+    def answer(self, query: str, relevant_chunks: list, generation: str = None) -> str:
+        request = _Request(self._prompt(query, relevant_chunks))
+        answer = None
+        if self._submit(request):
+            try:
+                answer = request.future.result(timeout=self.latency_budget)
+            except FutureTimeoutError:
+                logger.warning("Generation exceeded its latency budget, falling back to extractive answer")
+                request.abandon()
+            except Exception as e:
+                logger.error(f"Generation failed, falling back to extractive answer: {str(e)}")
+        if not answer:
+            answer = self._fallback(query, relevant_chunks)
+        return answer + self._sources_line(relevant_chunks)
+
+    def stream(self, query: str, relevant_chunks: list, generation: str = None):
+        from transformers import TextIteratorStreamer
+
+        pipe = get_pipeline(self.model_name)
+        streamer = TextIteratorStreamer(pipe.tokenizer, skip_special_tokens=True, timeout=self.latency_budget)
+        request = _Request(self._prompt(query, relevant_chunks), streamer)
+
+        streamed = False
+        if self._submit(request):
+            finished = False
+            try:
+                for text in streamer:
+                    if text:
+                        streamed = True
+                        yield text
+                finished = True
+            except queue.Empty:
+                logger.warning("Generation stalled past its latency budget")
+            finally:
+                if not finished:
+                    # Timed out, or the client went away: stop generating for nobody
+                    request.abandon()
+        if not streamed:
+            yield self._fallback(query, relevant_chunks)
+        yield self._sources_line(relevant_chunks)
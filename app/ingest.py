@@ -1,6 +1,5 @@
-from langchain_community.document_loaders import PyMuPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from typing import List
+from app.engine import Chunker, Extractor
 
 def load_documents(file_path: str) -> List[str]:
     """
@@ -12,25 +11,22 @@ def load_documents(file_path: str) -> List[str]:
     Returns:
         List[str]: A list of document contents.
     """
-    if file_path.endswith(".pdf"):
-        loader = PyMuPDFLoader(file_path)
-    elif file_path.endswith(".txt"):
-        loader = TextLoader(file_path, encoding='utf-8')
-    else:
+    extractor = Extractor()
+    if not any(file_path.lower().endswith(ext) for ext in extractor.supported_extensions):
         raise ValueError("Unsupported file type.")
-    return loader.load()
+    return [extractor.extract(file_path)]
 
-def chunk_documents(documents: List[str], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+def chunk_documents(documents: List[str], chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
     """
     Split documents into chunks.
 
     Args:
         documents (List[str]): A list of document contents.
-        chunk_size (int, optional): The size of each chunk. Defaults to 1000.
-        chunk_overlap (int, optional): The overlap between chunks. Defaults to 200.
+        chunk_size (int, optional): The size of each chunk in words. Defaults to 500.
+        chunk_overlap (int, optional): The overlap between chunks in words. Defaults to 50.
 
     Returns:
         List[str]: A list of document chunks.
     """
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    return text_splitter.split_documents(documents)
\ No newline at end of file
+    chunker = Chunker(chunk_size, chunk_overlap)
+    return [chunk for document in documents for chunk in chunker.split(document)]
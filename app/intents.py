@@ -0,0 +1,222 @@
+"""
+Canned answers for common questions, expressed as data.
+
+Each rule in RULES names the keywords a query must contain, optional terms
+the retrieved context must contain (and a pattern whose named groups become
+template parameters), and the answer template. Rules are listed by priority:
+the first rule whose query keywords match is chosen, and if its context
+requirements fail the answer falls back to extracted sentences rather than
+trying the next rule.
+
+All query keywords of all rules are compiled into one Aho-Corasick automaton,
+so a query is scanned once whatever the number of rules, and only rules
+sharing a keyword with the query are looked at. Context terms are matched
+case-insensitively with precompiled patterns, only for the chosen rule.
+"""
+import re
+from collections import deque
+
+ENCODER_SUBLAYERS = """Each encoder layer in the Transformer architecture consists of **two main sub-layers**:
+
+• **Multi-head Self-Attention Mechanism** - Allows the model to attend to different positions in the sequence simultaneously, capturing dependencies regardless of distance
+• **Position-wise Fully Connected Feed-Forward Network** - Applies the same linear transformation with ReLU activation to each position separately and identically
+
+**Additional Features:**
+• Residual connections around each sub-layer
+• Layer normalization after each sub-layer
+• Dropout for regularization
+
+This architecture enables efficient parallel processing while maintaining the ability to capture complex sequence relationships."""
+
+MULTI_HEAD_WHY = """**Multi-head attention** is used for several key reasons:
+
+• **Parallel Representation Learning** - Allows the model to jointly attend to information from different representation subspaces
+• **Enhanced Modeling Capacity** - Each head can learn to focus on different types of syntactic and semantic relationships
+• **Robust Feature Extraction** - Multiple heads provide redundancy and improve model robustness
+• **Flexible Attention Patterns** - Different heads can capture short-range vs long-range dependencies simultaneously
+
+**Technical Benefits:**
+• Enables the model to process multiple aspects of relationships in parallel
+• Provides more expressive power than single-head attention
+• Allows specialization of attention mechanisms for different types of information"""
+
+MODEL_DIMENSION = """**Model Dimension (d_model): {dimension}**
+
+The model dimension represents the **embedding size** throughout the Transformer architecture:
+
+• **Input/Output Consistency** - Maintains consistent dimensionality across all layers
+• **Representation Capacity** - Determines the richness of vector representations
+• **Computational Balance** - Balances model capacity with computational efficiency
+
+**Key Points:**
+• Used for token embeddings, position encodings, and all intermediate representations
+• Typical values: 512, 768, or 1024 depending on model size
+• Affects both model performance and computational requirements"""
+
+ATTENTION_MECHANISM = """**Attention Mechanism** in Transformers:
+
+**Core Components:**
+• **Queries** - Represent what we're looking for
+• **Keys** - Represent what we can attend to  
+• **Values** - Represent the actual information content
+
+**Process:**
+1. Compute attention scores between queries and keys
+2. Apply softmax to get attention weights
+3. Weighted sum of values using attention weights
+
+**Benefits:**
+• **Flexible Context** - Can attend to any position in the sequence
+• **Parallel Computation** - All attention calculations can be done simultaneously
+• **Interpretability** - Attention weights show what the model focuses on"""
+
+TRANSFORMER_ARCHITECTURE = """**Transformer Architecture Overview:**
+
+**Encoder Stack:**
+• Multiple identical layers (typically 6)
+• Each layer with multi-head self-attention and feed-forward network
+• Processes input sequence to create contextual representations
+
+**Decoder Stack:**
+• Also multiple identical layers
+• Additional cross-attention layer to encoder outputs
+• Auto-regressive generation with masked self-attention
+
+**Key Innovations:**
+• **Self-Attention** - Replaces recurrence and convolution
+• **Positional Encoding** - Injects sequence order information
+• **Scaled Dot-Product Attention** - Efficient attention computation
+• **Residual Connections** - Helps with gradient flow in deep networks"""
+
+# query_all: every keyword must occur in the lower-cased query
+# query_any: at least one must occur (when given)
+# context_all: terms the context must contain, case-insensitively
+# context_pattern: regex searched in the context; its named groups fill the template
+RULES = [
+    {
+        'name': 'encoder_sublayers',
+        'query_all': ['sub-layers', 'encoder'],
+        'context_all': ['multi-head self-attention', 'position-wise fully connected'],
+        'template': ENCODER_SUBLAYERS,
+    },
+    {
+        'name': 'multi_head_why',
+        'query_all': ['multi-head attention', 'why'],
+        'template': MULTI_HEAD_WHY,
+    },
+    {
+        'name': 'model_dimension',
+        'query_any': ['model dimension', 'd_model'],
+        'context_pattern': r'd_model\s*[=:\s]+(?P<dimension>\d+)',
+        'template': MODEL_DIMENSION,
+    },
+    {
+        'name': 'attention_mechanism',
+        'query_all': ['attention', 'mechanism'],
+        'template': ATTENTION_MECHANISM,
+    },
+    {
+        'name': 'transformer_architecture',
+        'query_all': ['transformer', 'architecture'],
+        'template': TRANSFORMER_ARCHITECTURE,
+    },
+]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting every keyword occurring in a text, overlaps included"""
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(keyword)
+
+        # Breadth-first, so every state's failure target is finished before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text: str) -> set:
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found |= self.output[state]
+        return found
+
+
+class IntentRule:
+    """One compiled entry of RULES"""
+
+    def __init__(self, priority: int, name: str, template: str, query_all: list = (), query_any: list = (),
+                 context_all: list = (), context_pattern: str = None):
+        if not query_all and not query_any:
+            raise ValueError(f"Intent rule '{name}' needs query_all or query_any keywords")
+        self.priority = priority
+        self.name = name
+        self.template = template
+        self.query_all = frozenset(keyword.lower() for keyword in query_all)
+        self.query_any = frozenset(keyword.lower() for keyword in query_any)
+        self.context_terms = [re.compile(re.escape(term), re.IGNORECASE) for term in context_all]
+        self.context_pattern = re.compile(context_pattern, re.IGNORECASE) if context_pattern else None
+
+    def matches_query(self, keywords: set) -> bool:
+        return self.query_all <= keywords and (not self.query_any or not self.query_any.isdisjoint(keywords))
+
+    def parameters(self, context: str):
+        """Template parameters taken from `context`, or None when the context doesn't support the answer"""
+        if not all(term.search(context) for term in self.context_terms):
+            return None
+        if self.context_pattern is None:
+            return {}
+        match = self.context_pattern.search(context)
+        return match.groupdict() if match else None
+
+    def render(self, parameters: dict) -> str:
+        return self.template.format(**parameters) if parameters else self.template
+
+
+class IntentMatcher:
+    """Picks the highest-priority rule whose query keywords all occur in a query"""
+
+    def __init__(self, rules: list = RULES):
+        self.rules = [IntentRule(priority, **rule) for priority, rule in enumerate(rules)]
+        self.rules_by_keyword = {}
+        for rule in self.rules:
+            for keyword in rule.query_all | rule.query_any:
+                self.rules_by_keyword.setdefault(keyword, []).append(rule)
+        self.automaton = KeywordAutomaton(self.rules_by_keyword)
+
+    def match(self, query: str):
+        """The chosen IntentRule, or None"""
+        keywords = self.automaton.find(query.lower())
+        candidates = {rule for keyword in keywords for rule in self.rules_by_keyword[keyword]}
+        best = None
+        for rule in candidates:
+            if (best is None or rule.priority < best.priority) and rule.matches_query(keywords):
+                best = rule
+        return best
+
+
+INTENTS = IntentMatcher()
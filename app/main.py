@@ -1,10 +1,19 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.upload import router as upload_router
 from app.query import router as query_router
+from app.search import router as search_router
+from app.admin import router as admin_router, is_admin_token
 from app.utils import setup_logging
+from app import config
+from app.engine import get_engine
+from app.cpu import apply_cpu_affinity
+from app.metrics import RequestMetricsMiddleware, render_prometheus
+from app.profiling import ProfilingMiddleware
 
 app = FastAPI(
     title="Knowledge-Base Search Engine",
@@ -25,6 +34,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts and latencies per route, exported by /metrics
+app.add_middleware(RequestMetricsMiddleware)
+# Runs requests asking for it (X-Profile header or ?profile=) under a profiler; only with an admin token configured
+if config.ADMIN_TOKEN:
+    app.add_middleware(ProfilingMiddleware, authorize=is_admin_token)
+
 # Create uploads directory and mount it
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
@@ -33,10 +48,16 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 @app.on_event("startup")
 async def startup_event():
     setup_logging()
+    apply_cpu_affinity()
+    if config.PRELOAD_MODEL:
+        # Warm up off the event loop so the worker starts accepting requests immediately
+        asyncio.get_running_loop().run_in_executor(None, get_engine().warm_up)
 
 # Include routers
 app.include_router(upload_router, prefix="/api")
 app.include_router(query_router, prefix="/api")
+app.include_router(search_router, prefix="/api")
+app.include_router(admin_router, prefix="/api")
 
 @app.get("/")
 async def root():
@@ -44,4 +65,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "Server is running"}
\ No newline at end of file
+    return {"status": "healthy", "message": "Server is running"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text-format metrics of this worker process"""
+    return PlainTextResponse(render_prometheus(get_engine()), media_type="text/plain; version=0.0.4")
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""
+Columnar chunk metadata.
+
+Instead of one dict per chunk ({'file', 'chunk_index', 'total_chunks'}, a few
+hundred bytes each with the filename repeated), a segment keeps its metadata
+as parallel numpy arrays plus a small table of interned file names:
+
+    file_ids      int32   index into `files`
+    chunk_index   int32   position of the chunk within its file
+    starts, ends  int64   character span of the chunk in the extracted text
+    pages         int32   1-based page the chunk starts on (-1 when unknown)
+
+That is 28 bytes per chunk, and filters become vectorized comparisons.
+Per-file attributes (upload time) live in the file table next to the names.
+Indexing a row returns a plain dict for API responses.
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+COLUMNS = {
+    'file_ids': np.int32,
+    'chunk_index': np.int32,
+    'starts': np.int64,
+    'ends': np.int64,
+    'pages': np.int32,
+}
+
+
+class ChunkMetadata:
+    """Metadata for the chunks of one segment, stored column by column"""
+
+    def __init__(self, files: list, file_total_chunks: list, file_ids: np.ndarray, chunk_index: np.ndarray,
+                 starts: np.ndarray, ends: np.ndarray, pages: np.ndarray, file_uploaded_at: list = None):
+        self.files = list(files)
+        self.file_total_chunks = list(file_total_chunks)
+        # Unix timestamp of each file's upload (its mtime), None when unknown
+        self.file_uploaded_at = list(file_uploaded_at) if file_uploaded_at is not None else [None] * len(self.files)
+        self.file_ids = file_ids
+        self.chunk_index = chunk_index
+        self.starts = starts
+        self.ends = ends
+        self.pages = pages
+        self._file_lookup = {name: file_id for file_id, name in enumerate(self.files)}
+
+    def __len__(self) -> int:
+        return len(self.file_ids)
+
+    def __getitem__(self, row: int) -> dict:
+        file_id = int(self.file_ids[row])
+        return {
+            'file': self.files[file_id],
+            'chunk_index': int(self.chunk_index[row]),
+            'total_chunks': self.file_total_chunks[file_id],
+            'start': int(self.starts[row]),
+            'end': int(self.ends[row]),
+            'page': int(self.pages[row]),
+            'uploaded_at': self.file_uploaded_at[file_id],
+        }
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in COLUMNS)
+
+    def file_id(self, filename: str) -> int:
+        """Interned id of `filename` in this segment, or -1"""
+        return self._file_lookup.get(filename, -1)
+
+    def rows_for_file(self, filename: str) -> np.ndarray:
+        file_id = self.file_id(filename)
+        if file_id < 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.file_ids == file_id)
+
+    def allowed_file_ids(self, search_filter: "SearchFilter") -> list:
+        """Ids of the files `search_filter` lets through"""
+        return [
+            file_id for file_id, name in enumerate(self.files)
+            if search_filter.matches_file(name, self.file_uploaded_at[file_id])
+        ]
+
+    def filter_rows(self, search_filter: "SearchFilter"):
+        """
+        Rows allowed by `search_filter`: None when every row passes, otherwise an
+        array of row numbers (empty when the filter excludes the whole segment).
+        """
+        allowed = self.allowed_file_ids(search_filter)
+        if len(allowed) == len(self.files):
+            return None
+        if not allowed:
+            return np.zeros(0, dtype=np.int64)
+        if len(allowed) == 1:
+            return np.flatnonzero(self.file_ids == allowed[0])
+        return np.flatnonzero(np.isin(self.file_ids, allowed))
+
+    @classmethod
+    def for_file(cls, filename: str, spans: list, page_starts: list = None,
+                 uploaded_at: float = None) -> "ChunkMetadata":
+        """Metadata for the chunks of one document, given their (start, end) character spans"""
+        starts = np.array([start for start, _ in spans], dtype=np.int64)
+        ends = np.array([end for _, end in spans], dtype=np.int64)
+        if page_starts:
+            pages = np.searchsorted(np.asarray(page_starts, dtype=np.int64), starts, side='right').astype(np.int32)
+        else:
+            pages = np.full(len(spans), -1, dtype=np.int32)
+        return cls(
+            [filename], [len(spans)],
+            np.zeros(len(spans), dtype=np.int32),
+            np.arange(len(spans), dtype=np.int32),
+            starts, ends, pages,
+            [uploaded_at],
+        )
+
+    @classmethod
+    def from_dicts(cls, metadatas: list) -> "ChunkMetadata":
+        """Build from per-chunk dicts; only 'file' is required"""
+        files, totals, uploaded, lookup = [], [], [], {}
+        file_ids = np.zeros(len(metadatas), dtype=np.int32)
+        columns = {name: np.full(len(metadatas), -1, dtype=COLUMNS[name]) for name in ('starts', 'ends', 'pages')}
+        chunk_index = np.arange(len(metadatas), dtype=np.int32)
+        for row, metadata in enumerate(metadatas):
+            name = metadata['file']
+            if name not in lookup:
+                lookup[name] = len(files)
+                files.append(name)
+                totals.append(metadata.get('total_chunks'))
+                uploaded.append(metadata.get('uploaded_at'))
+            file_ids[row] = lookup[name]
+            chunk_index[row] = metadata.get('chunk_index', row)
+            for key, column in (('start', 'starts'), ('end', 'ends'), ('page', 'pages')):
+                columns[column][row] = metadata.get(key, -1)
+        counts = np.bincount(file_ids, minlength=len(files))
+        totals = [int(counts[i]) if total is None else total for i, total in enumerate(totals)]
+        return cls(files, totals, file_ids, chunk_index, file_uploaded_at=uploaded, **columns)
+
+    @classmethod
+    def concat(cls, parts: list) -> "ChunkMetadata":
+        """Concatenate metadata from several segments, re-interning the names of files that have rows"""
+        files, totals, uploaded, lookup = [], [], [], {}
+        file_ids = []
+        for part in parts:
+            remap = np.zeros(len(part.files), dtype=np.int32)
+            for old_id in np.unique(part.file_ids).tolist():
+                name = part.files[old_id]
+                if name not in lookup:
+                    lookup[name] = len(files)
+                    files.append(name)
+                    totals.append(part.file_total_chunks[old_id])
+                    uploaded.append(part.file_uploaded_at[old_id])
+                remap[old_id] = lookup[name]
+            file_ids.append(remap[part.file_ids] if len(part) else np.zeros(0, dtype=np.int32))
+        return cls(
+            files, totals,
+            np.concatenate(file_ids) if parts else np.zeros(0, dtype=np.int32),
+            *(np.concatenate([getattr(part, name) for part in parts]) if parts else np.zeros(0, dtype=COLUMNS[name])
+              for name in ('chunk_index', 'starts', 'ends', 'pages')),
+            uploaded,
+        )
+
+    def take(self, rows: np.ndarray) -> "ChunkMetadata":
+        """Metadata for a subset of rows; the file table keeps only the files among them"""
+        used, file_ids = np.unique(np.asarray(self.file_ids)[rows], return_inverse=True)
+        used = used.tolist()
+        return ChunkMetadata([self.files[i] for i in used], [self.file_total_chunks[i] for i in used],
+                             file_ids.reshape(-1).astype(np.int32),
+                             *(np.asarray(getattr(self, name))[rows] for name in COLUMNS if name != 'file_ids'),
+                             [self.file_uploaded_at[i] for i in used])
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        with open(directory / "files.json", 'w', encoding='utf-8') as files_file:
+            json.dump({'files': self.files, 'total_chunks': self.file_total_chunks,
+                       'uploaded_at': self.file_uploaded_at}, files_file)
+        for name in COLUMNS:
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, directory: Path) -> "ChunkMetadata":
+        """Load a saved segment's metadata with the columns memory-mapped read-only"""
+        directory = Path(directory)
+        with open(directory / "files.json", encoding='utf-8') as files_file:
+            table = json.load(files_file)
+        return cls(table['files'], table['total_chunks'],
+                   *(np.load(directory / f"{name}.npy", mmap_mode='r') for name in COLUMNS),
+                   table.get('uploaded_at'))
+
+
+class SearchFilter:
+    """Restricts a search to files by name, type (extension) and upload time"""
+
+    def __init__(self, files: list = None, file_types: list = None,
+                 uploaded_after: datetime = None, uploaded_before: datetime = None):
+        # None leaves that attribute unrestricted; an empty list matches no file
+        self.files = set(files) if files is not None else None
+        self.file_types = {
+            file_type.lower() if file_type.startswith('.') else f".{file_type.lower()}"
+            for file_type in file_types
+        } if file_types is not None else None
+        self.uploaded_after = uploaded_after.timestamp() if uploaded_after else None
+        self.uploaded_before = uploaded_before.timestamp() if uploaded_before else None
+
+    @property
+    def is_empty(self) -> bool:
+        return self.files is None and self.file_types is None and \
+            self.uploaded_after is None and self.uploaded_before is None
+
+    def matches_file(self, filename: str, uploaded_at: float = None) -> bool:
+        if self.files is not None and filename not in self.files:
+            return False
+        if self.file_types is not None and Path(filename or "").suffix.lower() not in self.file_types:
+            return False
+        if self.uploaded_after is not None and (uploaded_at is None or uploaded_at < self.uploaded_after):
+            return False
+        if self.uploaded_before is not None and (uploaded_at is None or uploaded_at > self.uploaded_before):
+            return False
+        return True
@@ -0,0 +1,285 @@
+"""
+Latency instrumentation.
+
+`timed(stage)` measures one stage of serving a request (extract, chunk,
+encode_query, search, rerank, synthesize, ...). Every measurement goes into
+that stage's latency histogram. While a request is being timed (after
+start_timings()) it is also added to the request's own per-stage totals,
+which live in a context variable so they follow the request into thread-pool
+calls. Stages nest: "sync" includes the extract, chunk and encode of any
+file it indexes, and "total" includes everything.
+
+The same module keeps per-route request counts and latencies (recorded by
+RequestMetricsMiddleware), encode batch sizes, model load times and gauges
+registered by other components, and renders all of it, plus index and cache
+statistics read at scrape time, in the Prometheus text format for /metrics.
+Metrics are per process: with several workers each scrape sees one of them.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, Prometheus style (a value v lands in the first bucket with v <= bound)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class Histogram:
+    """Fixed-bucket histogram of observed values"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> dict:
+        """Cumulative bucket counts keyed by upper bound, plus count and sum"""
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative[bound] = running
+        return {'buckets': cumulative, 'count': count, 'sum': total}
+
+
+STAGE_SECONDS = {}
+_stages_lock = threading.Lock()
+
+# (method, route template, status) -> count, and route template -> Histogram
+HTTP_REQUESTS = {}
+HTTP_SECONDS = {}
+_http_lock = threading.Lock()
+
+ENCODE_BATCH_SIZE = Histogram(BATCH_SIZE_BUCKETS)
+# model name -> seconds its last load took
+MODEL_LOAD_SECONDS = {}
+# metric name -> (help, function returning the current value)
+GAUGES = {}
+
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def stage_histogram(stage: str) -> Histogram:
+    histogram = STAGE_SECONDS.get(stage)
+    if histogram is None:
+        with _stages_lock:
+            histogram = STAGE_SECONDS.setdefault(stage, Histogram())
+    return histogram
+
+
+def start_timings() -> dict:
+    """Start collecting per-stage seconds for the current request; returns the dict they accumulate in"""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record(stage: str, seconds: float):
+    stage_histogram(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def timings_ms(timings: dict) -> dict:
+    return {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+
+
+def format_timings(timings: dict) -> str:
+    """`stage=12.3ms ...`, for log lines"""
+    return " ".join(f"{stage}={milliseconds}ms" for stage, milliseconds in timings_ms(timings).items())
+
+
+@contextmanager
+def model_load(model_name: str):
+    """Time loading `model_name`; also counted as the request stage "model_load" when it happens mid-request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        MODEL_LOAD_SECONDS[model_name] = seconds
+        record("model_load", seconds)
+
+
+def register_gauge(name: str, help_text: str, function):
+    GAUGES[name] = (help_text, function)
+
+
+def record_request(method: str, route: str, status: int, seconds: float):
+    key = (method, route, status)
+    with _http_lock:
+        HTTP_REQUESTS[key] = HTTP_REQUESTS.get(key, 0) + 1
+        histogram = HTTP_SECONDS.get(route)
+        if histogram is None:
+            histogram = HTTP_SECONDS[route] = Histogram()
+    histogram.observe(seconds)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them until the last body byte
+    is sent (so streamed responses count in full), labelled by route template
+    rather than raw path to keep the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            record_request(scope["method"], _route_template(scope), status, time.perf_counter() - started)
+
+
+def _route_template(scope) -> str:
+    """Path template of the route that handled the request, e.g. /api/query, or "unmatched" """
+    # The router records the matched route in the (shared) scope
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    # Routes of an included router may carry their path without the include prefix
+    try:
+        matched = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope["path"]
+    if path.endswith(matched) and len(path) > len(matched):
+        return path[:-len(matched)] + template
+    return template
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class _Exposition:
+    """Builds a Prometheus text-format page, one metric family at a time"""
+
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name: str, kind: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value, **labels):
+        self.lines.append(f"{name}{_labels(**labels)} {float(value)!r}")
+
+    def histogram(self, name: str, histogram: Histogram, **labels):
+        snapshot = histogram.snapshot()
+        for bound, count in snapshot['buckets'].items():
+            self.sample(f"{name}_bucket", count, **labels, le=_bound(bound))
+        self.sample(f"{name}_sum", snapshot['sum'], **labels)
+        self.sample(f"{name}_count", snapshot['count'], **labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render_prometheus(engine) -> str:
+    """Every metric of this process in the Prometheus text exposition format"""
+    from app.answer_cache import SEMANTIC_CACHE
+    from app.synthesis import ANSWER_CACHE
+
+    page = _Exposition()
+
+    page.family("kb_http_requests_total", "counter", "HTTP requests by method, route and status")
+    with _http_lock:
+        requests, route_histograms = dict(HTTP_REQUESTS), dict(HTTP_SECONDS)
+    for (method, route, status), count in sorted(requests.items()):
+        page.sample("kb_http_requests_total", count, method=method, route=route, status=status)
+    page.family("kb_http_request_duration_seconds", "histogram", "HTTP request latency by route")
+    for route, histogram in sorted(route_histograms.items()):
+        page.histogram("kb_http_request_duration_seconds", histogram, route=route)
+
+    page.family("kb_stage_duration_seconds", "histogram", "Time spent per stage of serving and indexing")
+    for stage, histogram in sorted(STAGE_SECONDS.items()):
+        page.histogram("kb_stage_duration_seconds", histogram, stage=stage)
+
+    page.family("kb_encode_batch_size", "histogram", "Texts per embedding model batch when encoding documents")
+    page.histogram("kb_encode_batch_size", ENCODE_BATCH_SIZE)
+
+    page.family("kb_model_load_seconds", "gauge", "Time the last load of each model took")
+    for model_name, seconds in sorted(MODEL_LOAD_SECONDS.items()):
+        page.sample("kb_model_load_seconds", seconds, model=model_name)
+
+    index = engine.index
+    segments = index.segments
+    page.family("kb_index_chunks", "gauge", "Live chunks in the index")
+    page.sample("kb_index_chunks", len(index))
+    page.family("kb_index_segments", "gauge", "Index segments")
+    page.sample("kb_index_segments", len(segments))
+    page.family("kb_index_bytes", "gauge", "Bytes of embeddings, centroids and chunk metadata in the index")
+    page.sample("kb_index_bytes", sum(
+        segment.embeddings.nbytes + segment.centroids.nbytes + segment.metadatas.nbytes for segment in segments))
+
+    page.family("kb_ingest_chunks_total", "counter", "Chunks ingested by this process")
+    page.sample("kb_ingest_chunks_total", engine.dedup_stats['chunks'])
+    page.family("kb_ingest_duplicate_chunks_total", "counter", "Ingested chunks found to be near-duplicates")
+    page.sample("kb_ingest_duplicate_chunks_total", engine.dedup_stats['duplicates'])
+
+    caches = {'answer': ANSWER_CACHE, 'semantic': SEMANTIC_CACHE}
+    page.family("kb_cache_hits_total", "counter", "Cache hits")
+    for name, cache in caches.items():
+        page.sample("kb_cache_hits_total", cache.hits, cache=name)
+    page.family("kb_cache_misses_total", "counter", "Cache misses")
+    for name, cache in caches.items():
+        page.sample("kb_cache_misses_total", cache.misses, cache=name)
+    page.family("kb_cache_hit_ratio", "gauge", "Hits / lookups since the process started")
+    for name, cache in caches.items():
+        lookups = cache.hits + cache.misses
+        page.sample("kb_cache_hit_ratio", cache.hits / lookups if lookups else 0.0, cache=name)
+    page.family("kb_cache_entries", "gauge", "Entries currently cached")
+    for name, cache in caches.items():
+        page.sample("kb_cache_entries", len(cache), cache=name)
+
+    for name, (help_text, function) in sorted(GAUGES.items()):
+        page.family(name, "gauge", help_text)
+        page.sample(name, function())
+
+    return page.text()
@@ -0,0 +1,273 @@
+"""
+Shared embedding server.
+
+Running uvicorn with N workers would otherwise load N copies of the embedding
+model. Instead, start one server process that owns the model:
+
+    python -m app.model_server                      # listens on EMBEDDING_SERVER_ADDRESS
+
+and point the HTTP workers at it:
+
+    EMBEDDER_BACKEND=server uvicorn app.main:app --workers 4
+
+Requests arriving from all workers within a short window are encoded as a
+single batch, so batching improves as more workers are added.
+
+Wire format: every message is a 4-byte big-endian length followed by the
+payload. A request is one JSON frame ({"op": "encode", "model": ..., "texts": [...]}
+or {"op": "info"}); a reply is a JSON header frame, followed for "encode" by
+one frame holding the float32 embeddings as raw C-ordered bytes. An encode
+naming another model than the server runs is refused, so a worker can never
+label one model's vectors with another's name.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from app import config
+from app.cpu import apply_cpu_affinity
+from app.engine import EMBEDDER_BACKENDS, Embedder, ModelMismatchError, load_backend
+from app.utils import setup_logging
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct(">I")
+
+
+def parse_address(address: str):
+    """Return ("unix", path) or ("tcp", (host, port)) for an address string"""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid embedding server address '{address}', expected unix:/path or host:port")
+    return "tcp", (host, int(port))
+
+
+class EmbeddingServer:
+    """Encodes texts for many clients, coalescing concurrent requests into batches"""
+
+    def __init__(self, embedder: Embedder, max_batch: int = config.EMBEDDING_SERVER_MAX_BATCH,
+                 max_wait_ms: float = config.EMBEDDING_SERVER_MAX_WAIT_MS):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+
+    async def batcher(self):
+        """Drain the queue in batches and run the model off the event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                embeddings = await loop.run_in_executor(None, self.embedder.encode_corpus, texts)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            logger.debug(f"Encoded batch of {len(texts)} texts for {len(pending)} requests")
+            offset = 0
+            for item_texts, future in pending:
+                if not future.done():
+                    future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    async def encode(self, texts: list) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = json.loads(await read_frame_async(reader))
+                except asyncio.IncompleteReadError:
+                    break
+
+                try:
+                    model = request.get("model")
+                    if request.get("op") == "encode" and model is not None and model != self.embedder.model_name:
+                        write_frame_async(writer, json.dumps({
+                            "error": f"Embedding server runs {self.embedder.model_name}, not {model}",
+                            "model_mismatch": True,
+                        }).encode())
+                    elif request.get("op") == "encode":
+                        embeddings = np.ascontiguousarray(await self.encode(request["texts"]), dtype=np.float32)
+                        write_frame_async(writer, json.dumps({"shape": list(embeddings.shape)}).encode())
+                        write_frame_async(writer, embeddings.tobytes())
+                    elif request.get("op") == "info":
+                        write_frame_async(writer, json.dumps({"model": self.embedder.model_name,
+                                                              "loaded": self.embedder.loaded}).encode())
+                    else:
+                        write_frame_async(writer, json.dumps({"error": f"Unknown op {request.get('op')!r}"}).encode())
+                except Exception as e:
+                    logger.error(f"Error handling embedding request: {str(e)}")
+                    write_frame_async(writer, json.dumps({"error": str(e)}).encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, address: str):
+        self.queue = asyncio.Queue()
+        kind, target = parse_address(address)
+        if kind == "unix":
+            if os.path.exists(target):
+                os.unlink(target)
+            server = await asyncio.start_unix_server(self.handle_client, path=target)
+        else:
+            server = await asyncio.start_server(self.handle_client, host=target[0], port=target[1])
+
+        logger.info(f"Loading {self.embedder.model_name} before accepting connections")
+        await asyncio.get_running_loop().run_in_executor(None, self.embedder.load)
+        logger.info(f"Embedding server listening on {address}")
+
+        batcher = asyncio.create_task(self.batcher())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+async def read_frame_async(reader: asyncio.StreamReader) -> bytes:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+def write_frame_async(writer: asyncio.StreamWriter, payload: bytes):
+    writer.write(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Embedding server closed the connection")
+        received += count
+    return bytes(buffer)
+
+
+class RemoteEmbedder(Embedder):
+    """Embedder that forwards encode calls to a shared app.model_server process"""
+
+    def __init__(self, model_name: str = config.EMBEDDING_MODEL, address: str = config.EMBEDDING_SERVER_ADDRESS,
+                 timeout: float = config.EMBEDDING_SERVER_TIMEOUT):
+        super().__init__(model_name)
+        self.address = address
+        self.timeout = timeout
+        # One connection per thread; requests on a connection are strictly sequential
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        sock.connect(target)
+        return sock
+
+    def _request(self, request: dict):
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                payload = json.dumps(request).encode()
+                sock.sendall(_LENGTH.pack(len(payload)) + payload)
+                header = json.loads(self._read_frame(sock))
+                if header.get("model_mismatch"):
+                    raise ModelMismatchError(header["error"])
+                if "error" in header:
+                    raise RuntimeError(f"Embedding server error: {header['error']}")
+                body = self._read_frame(sock) if request["op"] == "encode" else None
+                return header, body
+            except (ConnectionError, OSError):
+                self._local.sock = None
+                if sock is not None:
+                    sock.close()
+                # A worker may hold a connection the server has since dropped; retry once on a fresh one
+                if attempt:
+                    raise
+
+    def _read_frame(self, sock: socket.socket) -> bytes:
+        (length,) = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+        return _recv_exactly(sock, length)
+
+    @property
+    def loaded(self) -> bool:
+        try:
+            header, _ = self._request({"op": "info"})
+            return bool(header.get("loaded"))
+        except Exception:
+            return False
+
+    def load(self):
+        header, _ = self._request({"op": "info"})
+        if header.get("model") != self.model_name:
+            raise ModelMismatchError(f"Embedding server runs {header.get('model')}, this worker expects {self.model_name}")
+
+    def encode(self, texts: list) -> np.ndarray:
+        header, body = self._request({"op": "encode", "model": self.model_name, "texts": list(texts)})
+        return np.frombuffer(body, dtype=np.float32).reshape(header["shape"])
+
+    def encode_corpus(self, texts: list, **kwargs) -> np.ndarray:
+        # The server buckets by length itself, across everything it is batching
+        return self.encode(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve embeddings to the HTTP workers over a local socket")
+    parser.add_argument("--address", default=config.EMBEDDING_SERVER_ADDRESS,
+                        help="unix:/path/to/socket or host:port")
+    parser.add_argument("--backend", default=config.EMBEDDING_SERVER_BACKEND,
+                        help="embedder backend the server runs in-process")
+    parser.add_argument("--max-batch", type=int, default=config.EMBEDDING_SERVER_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=config.EMBEDDING_SERVER_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.backend == "server":
+        parser.error("The embedding server cannot use the 'server' backend itself")
+    apply_cpu_affinity()
+    embedder = load_backend(EMBEDDER_BACKENDS, args.backend)()
+    server = EmbeddingServer(embedder, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    started = time.perf_counter()
+    try:
+        asyncio.run(server.serve(args.address))
+    except KeyboardInterrupt:
+        logger.info(f"Embedding server stopped after {time.perf_counter() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+On-demand profiling of the live server.
+
+A request opts in with an `X-Profile` header or a `profile` query parameter
+(value `cprofile`, `sampling`, or `1` for sampling) plus the admin token;
+without ADMIN_TOKEN configured, profiling is disabled altogether.
+ProfilingMiddleware then runs it under the chosen profiler, saves the profile
+in PROFILE_DIR and names it in the response's X-Profile-Id header; the admin
+endpoints list and return saved profiles.
+
+    cprofile   deterministic, every call on the event loop thread while the
+               request runs (other requests interleaved there are included);
+               only one at a time, later ones fall back to sampling
+    sampling   samples the stacks of all threads every PROFILE_INTERVAL_MS,
+               so work in the thread pool (sync, search, generation) shows up
+               too; saved as folded stacks, the input of flamegraph tools.
+               The default, since most of a request's time is spent there
+
+sample_for() takes a time-bounded sampling profile of the whole process
+without tying it to a request.
+"""
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+MODES = {"1": "sampling", "true": "sampling", "cprofile": "cprofile", "sampling": "sampling"}
+SUFFIXES = {"cprofile": ".prof", "sampling": ".folded"}
+
+_cprofile_lock = threading.Lock()
+
+
+class StackSampler:
+    """Counts the call stacks of every other thread, sampled every `interval` seconds on a background thread"""
+
+    def __init__(self, interval: float = config.PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float):
+        """Sample from the calling thread for `seconds`"""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, args=(float("inf"),), name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        """One `frame;frame;... count` line per distinct stack, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_dir() -> Path:
+    directory = Path(config.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def new_profile_id(label: str) -> str:
+    safe_label = "".join(char if char.isalnum() else "-" for char in label).strip("-")[:40]
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{uuid.uuid4().hex[:6]}"
+
+
+def _prune():
+    profiles = sorted(profile_dir().iterdir(), key=lambda path: path.stat().st_mtime)
+    for path in profiles[:max(len(profiles) - config.PROFILE_KEEP, 0)]:
+        path.unlink(missing_ok=True)
+
+
+def save_cprofile(profile_id: str, profiler: cProfile.Profile):
+    profiler.dump_stats(str(profile_dir() / f"{profile_id}.prof"))
+    _prune()
+
+
+def save_folded(profile_id: str, sampler: StackSampler):
+    (profile_dir() / f"{profile_id}.folded").write_text(sampler.folded(), encoding='utf-8')
+    _prune()
+
+
+def list_profiles() -> list:
+    return [
+        {
+            'id': path.stem,
+            'kind': 'cprofile' if path.suffix == ".prof" else 'sampling',
+            'bytes': path.stat().st_size,
+            'created': path.stat().st_mtime,
+        }
+        for path in sorted(profile_dir().iterdir(), key=lambda path: path.stat().st_mtime, reverse=True)
+        if path.suffix in SUFFIXES.values()
+    ]
+
+
+def find_profile(profile_id: str):
+    """Path of a saved profile, or None (ids never contain path separators)"""
+    if "/" in profile_id or "\\" in profile_id or profile_id.startswith("."):
+        return None
+    for suffix in SUFFIXES.values():
+        path = profile_dir() / f"{profile_id}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def cprofile_report(path: Path, sort: str = "cumulative", limit: int = 40) -> str:
+    """pstats table of a saved cProfile profile"""
+    output = io.StringIO()
+    stats = pstats.Stats(str(path), stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def sample_for(seconds: float, interval: float = config.PROFILE_INTERVAL_MS / 1000):
+    """Sample the whole process for `seconds` from the calling thread; returns (profile id, sampler)"""
+    sampler = StackSampler(interval)
+    sampler.run(seconds)
+    profile_id = new_profile_id("live")
+    save_folded(profile_id, sampler)
+    logger.info(f"Saved live sampling profile {profile_id} ({sampler.samples} samples)")
+    return profile_id, sampler
+
+
+def requested_mode(scope) -> str:
+    """Profiling mode asked for by the request's X-Profile header or profile query parameter, or None"""
+    value = None
+    for name, header_value in scope.get("headers", ()):
+        if name == b"x-profile":
+            value = header_value.decode("latin-1")
+    if value is None and b"profile" in scope.get("query_string", b""):
+        values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+        value = values[-1] if values else None
+    return MODES.get(value.lower()) if value else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the requests that ask for it. `authorize` gets the
+    request's X-Admin-Token header value (or None) and decides whether it may.
+    """
+
+    def __init__(self, app, authorize):
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        mode = requested_mode(scope) if scope["type"] == "http" else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        token = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"x-admin-token"), None)
+        if not self.authorize(token):
+            logger.warning(f"Ignoring unauthorized profiling request for {scope['path']}")
+            await self.app(scope, receive, send)
+            return
+
+        if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+            mode = "sampling"
+        profile_id = new_profile_id(f"{scope['method']}-{scope['path']}")
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, send_with_profile_id)
+                finally:
+                    profiler.disable()
+                save_cprofile(profile_id, profiler)
+            finally:
+                _cprofile_lock.release()
+        else:
+            sampler = StackSampler()
+            sampler.start()
+            try:
+                await self.app(scope, receive, send_with_profile_id)
+            finally:
+                sampler.stop()
+            save_folded(profile_id, sampler)
+        logger.info(f"Saved {mode} profile {profile_id} for {scope['method']} {scope['path']}")
@@ -1,295 +1,223 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-import logging
-import os
-from pathlib import Path
-import PyPDF2
-import docx
-from sentence_transformers import SentenceTransformer, util
-import torch
-import numpy as np
-import re
-import requests
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+import base64
+import hashlib
 import json
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+import logging
+import time
+from app import config
+from app.engine import Chunker, Index, ModelMismatchError, get_engine
+from app.metadata import SearchFilter
+from app.answer_cache import SEMANTIC_CACHE
+from app.metrics import format_timings, record, start_timings, timed, timings_ms
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()  # THIS WAS MISSING!
 
-UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR = config.UPLOAD_DIR
 
-class QueryRequest(BaseModel):
+class RetrievalRequest(BaseModel):
+    """Fields shared by /api/query and /api/search"""
     query: str
+    # Optional scope: only search these files / extensions / upload window
+    files: Optional[List[str]] = None
+    file_types: Optional[List[str]] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    # Retrieval depth: chunks per page, minimum cosine similarity, and the
+    # next_cursor of a previous response to fetch the following page
+    top_k: int = Field(3, ge=1, le=config.MAX_TOP_K)
+    min_score: Optional[float] = Field(None, ge=-1.0, le=1.0)
+    cursor: Optional[str] = None
+
+    def search_filter(self) -> SearchFilter:
+        return SearchFilter(self.files, self.file_types, self.uploaded_after, self.uploaded_before)
+
+    def filter_scope(self) -> list:
+        """The filters and score threshold, with no filter and an empty list kept apart"""
+        return [None if self.files is None else sorted(self.files),
+                None if self.file_types is None else sorted(self.file_types),
+                str(self.uploaded_after), str(self.uploaded_before), self.min_score]
+
+    def fingerprint(self) -> str:
+        """Identifies the result list a cursor pages through"""
+        scope = [self.query, *self.filter_scope()]
+        return hashlib.sha1(json.dumps(scope).encode()).hexdigest()[:16]
+
+class QueryRequest(RetrievalRequest):
+    include_chunks: bool = False
+    # Report how long each stage of answering took, in milliseconds
+    include_timings: bool = False
+
+    def cache_scope(self) -> str:
+        """Everything besides the query text that shapes the response, for the semantic answer cache"""
+        return json.dumps([*self.filter_scope(), self.top_k, self.include_chunks])
 
 class QueryResponse(BaseModel):
     answer: str
     sources: list = []
+    chunks: Optional[list] = None
+    next_cursor: Optional[str] = None
+    timings: Optional[dict] = None
 
-# Initialize the sentence transformer model
-model = None
-
-def initialize_model():
-    global model
-    if model is None:
-        logger.info("Loading SentenceTransformer model...")
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.info("SentenceTransformer model loaded successfully")
+def encode_cursor(offset: int, generation: str, fingerprint: str) -> str:
+    payload = json.dumps({'o': offset, 'g': generation, 'f': fingerprint}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
 
-def extract_text_from_file(file_path: str) -> str:
-    """Extract text from different file types"""
-    file_extension = Path(file_path).suffix.lower()
+def decode_cursor(cursor: str, generation: str, fingerprint: str) -> int:
+    """Return the offset stored in `cursor`, rejecting cursors from another query or index state"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        offset = int(payload['o'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Offsets past MAX_RESULT_WINDOW are rejected by the caller
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if payload.get('f') != fingerprint:
+        raise HTTPException(status_code=400, detail="Cursor belongs to a different query")
+    if payload.get('g') != generation:
+        raise HTTPException(status_code=409, detail="The document index changed since this cursor was issued; repeat the query")
+    return offset
+
+def retrieve_page(engine, request: RetrievalRequest, with_text: bool = True, query_embedding=None):
+    """Run the request's search for the page its cursor points at, returning (chunks, next_cursor)"""
+    fingerprint = request.fingerprint()
+    offset = decode_cursor(request.cursor, engine.generation, fingerprint) if request.cursor else 0
+    if offset + request.top_k > config.MAX_RESULT_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Cannot page beyond the first {config.MAX_RESULT_WINDOW} results")
     
     try:
-        if file_extension == '.pdf':
-            return extract_text_from_pdf(file_path)
-        elif file_extension == '.txt':
-            return extract_text_from_txt(file_path)
-        elif file_extension in ['.doc', '.docx']:
-            return extract_text_from_docx(file_path)
-        else:
-            return ""
-    except Exception as e:
-        logger.error(f"Error extracting text from {file_path}: {str(e)}")
-        return ""
-
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text from PDF file"""
-    text = ""
-    with open(file_path, 'rb') as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+        relevant_chunks = engine.search(request.query, top_k=request.top_k, search_filter=request.search_filter(),
+                                        min_score=request.min_score, offset=offset, with_text=with_text,
+                                        query_embedding=query_embedding)
+    except ModelMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return relevant_chunks, next_page_cursor(engine, request, offset, len(relevant_chunks))
+
+def next_page_cursor(engine, request: RetrievalRequest, offset: int, returned: int):
+    if returned == request.top_k and offset + 2 * request.top_k <= config.MAX_RESULT_WINDOW:
+        return encode_cursor(offset + request.top_k, engine.generation, request.fingerprint())
+    return None
+
+def retrieve_with_context(engine, request: QueryRequest, query_embedding=None):
+    """
+    Like retrieve_page, also returning the chunks to synthesize the answer from:
+    (chunks, next_cursor, context). For a first page the search goes MMR_CANDIDATES
+    deep so engine.select_context can skip chunks that overlap better-ranked ones.
+    """
+    if request.cursor or config.MMR_CANDIDATES <= config.CONTEXT_CHUNKS:
+        relevant_chunks, next_cursor = retrieve_page(engine, request, query_embedding=query_embedding)
+        return relevant_chunks, next_cursor, relevant_chunks
+    
+    try:
+        if query_embedding is None:
+            query_embedding = engine.embed_query(request.query)
+        candidates = engine.search(request.query, top_k=max(request.top_k, config.MMR_CANDIDATES),
+                                   search_filter=request.search_filter(), min_score=request.min_score,
+                                   query_embedding=query_embedding, with_embeddings=True)
+    except ModelMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    relevant_chunks = candidates[:request.top_k]
+    context = engine.select_context(query_embedding, candidates)
+    return relevant_chunks, next_page_cursor(engine, request, 0, len(relevant_chunks)), context
+
+def lookup_cached_answer(engine, request: QueryRequest):
+    """
+    Encode a first-page query and look it up in the semantic answer cache.
+    Returns (query_embedding, cached response fields or None).
+    """
+    if request.cursor or not SEMANTIC_CACHE.enabled:
+        return None, None
+    try:
+        query_embedding = engine.embed_query(request.query)
+    except ModelMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    with timed("cache_lookup"):
+        hit = SEMANTIC_CACHE.lookup(query_embedding, request.cache_scope(), engine.generation)
+    if hit is None:
+        return query_embedding, None
+    cached, similarity = hit
+    logger.info(f"Semantic cache hit ({similarity:.3f}) for query: {request.query}")
+    response = dict(cached)
+    if response['next_cursor'] is not None:
+        # Cursors are bound to the query text, so issue one for this query
+        response['next_cursor'] = encode_cursor(request.top_k, engine.generation, request.fingerprint())
+    return query_embedding, response
+
+def remember_answer(request: QueryRequest, query_embedding, generation: str, response: dict):
+    if query_embedding is not None:
+        SEMANTIC_CACHE.store(query_embedding, request.cache_scope(), generation, response)
+
+def no_results_message(request: RetrievalRequest) -> str:
+    if not request.search_filter().is_empty:
+        return "❌ None of the uploaded documents match the requested filters."
+    return f"❌ I couldn't find specific information about '{request.query}' in the uploaded documents."
+
+def source_files(*chunk_lists) -> list:
+    """Files of the chunks returned and of the context the answer was written from, sorted"""
+    return sorted({chunk['metadata']['file'] for chunks in chunk_lists for chunk in chunks})
+
+def serialize_chunk(chunk: dict) -> dict:
+    return {'text': chunk['text'], 'score': chunk['similarity'], 'metadata': chunk['metadata']}
 
-def extract_text_from_txt(file_path: str) -> str:
-    """Extract text from TXT file"""
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+def initialize_model():
+    """Load the embedding model ahead of the first query"""
+    get_engine().embedder.load()
 
-def extract_text_from_docx(file_path: str) -> str:
-    """Extract text from DOCX file"""
-    doc = docx.Document(file_path)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
+def extract_text_from_file(file_path: str) -> str:
+    """Extract text from different file types"""
+    return get_engine().extractor.extract(file_path)
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list:
+def chunk_text(text: str, chunk_size: int = config.CHUNK_SIZE, overlap: int = config.CHUNK_OVERLAP) -> list:
     """Split text into overlapping chunks"""
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append(chunk)
-    
-    return chunks
+    return Chunker(chunk_size, overlap).split(text)
 
 def get_document_chunks():
     """Get all chunks from all documents with their metadata"""
-    initialize_model()
-    
+    engine = get_engine()
+    engine.sync()
     all_chunks = []
     all_metadatas = []
-    
-    if not UPLOAD_DIR.exists():
-        return all_chunks, all_metadatas
-    
-    for file_path in UPLOAD_DIR.iterdir():
-        if file_path.is_file():
-            try:
-                text = extract_text_from_file(str(file_path))
-                if text.strip():
-                    chunks = chunk_text(text)
-                    for i, chunk in enumerate(chunks):
-                        all_chunks.append(chunk)
-                        all_metadatas.append({
-                            'file': file_path.name,
-                            'chunk_index': i,
-                            'total_chunks': len(chunks)
-                        })
-            except Exception as e:
-                logger.error(f"Error processing file {file_path}: {str(e)}")
-    
+    for chunk, metadata in engine.index.iter_chunks():
+        all_chunks.append(chunk)
+        all_metadatas.append(metadata)
     return all_chunks, all_metadatas
 
 def find_relevant_chunks(query: str, chunks: list, metadatas: list, top_k: int = 3):
-    """Find the most relevant chunks using semantic similarity"""
-    initialize_model()
-    
+    """Rank an ad-hoc list of chunks against the query (the indexed corpus is searched by the engine)"""
     if not chunks:
         return []
-    
-    # Encode the query and all chunks
-    query_embedding = model.encode([query], convert_to_tensor=True)
-    chunk_embeddings = model.encode(chunks, convert_to_tensor=True)
-    
-    # Compute similarity scores
-    similarities = util.pytorch_cos_sim(query_embedding, chunk_embeddings)[0]
-    
-    # Get top-k most similar chunks
-    top_indices = torch.topk(similarities, k=min(top_k, len(chunks))).indices.tolist()
-    
-    relevant_chunks = []
-    for idx in top_indices:
-        relevant_chunks.append({
-            'text': chunks[idx],
-            'metadata': metadatas[idx],
-            'similarity': similarities[idx].item()
-        })
-    
-    return relevant_chunks
-
-def generate_intelligent_answer(query: str, relevant_chunks: list) -> str:
-    """Generate intelligent answer using rule-based synthesis with better formatting"""
-    
-    # Prepare context from relevant chunks
-    context_parts = []
-    for chunk in relevant_chunks[:3]:
-        context_parts.append(chunk['text'])
-    
-    context = "\n\n".join(context_parts)
-    sources = list(set(chunk['metadata']['file'] for chunk in relevant_chunks[:3]))
-    
-    # Enhanced rule-based synthesis
-    query_lower = query.lower()
-    context_lower = context.lower()
-    
-    # Special handling for common technical questions
-    if 'sub-layers' in query_lower and 'encoder' in query_lower:
-        # Look for encoder architecture
-        if 'multi-head self-attention' in context_lower and 'position-wise fully connected' in context_lower:
-            answer = """Each encoder layer in the Transformer architecture consists of **two main sub-layers**:
-
-• **Multi-head Self-Attention Mechanism** - Allows the model to attend to different positions in the sequence simultaneously, capturing dependencies regardless of distance
-• **Position-wise Fully Connected Feed-Forward Network** - Applies the same linear transformation with ReLU activation to each position separately and identically
 
-**Additional Features:**
-• Residual connections around each sub-layer
-• Layer normalization after each sub-layer
-• Dropout for regularization
-
-This architecture enables efficient parallel processing while maintaining the ability to capture complex sequence relationships."""
-        else:
-            answer = extract_best_sentences(query, context)
-    
-    elif 'multi-head attention' in query_lower and 'why' in query_lower:
-        answer = """**Multi-head attention** is used for several key reasons:
-
-• **Parallel Representation Learning** - Allows the model to jointly attend to information from different representation subspaces
-• **Enhanced Modeling Capacity** - Each head can learn to focus on different types of syntactic and semantic relationships
-• **Robust Feature Extraction** - Multiple heads provide redundancy and improve model robustness
-• **Flexible Attention Patterns** - Different heads can capture short-range vs long-range dependencies simultaneously
-
-**Technical Benefits:**
-• Enables the model to process multiple aspects of relationships in parallel
-• Provides more expressive power than single-head attention
-• Allows specialization of attention mechanisms for different types of information"""
-    
-    elif 'model dimension' in query_lower or 'd_model' in query_lower:
-        # Look for dimension specification
-        dim_match = re.search(r'd_model\s*[=:\s]+(\d+)', context_lower)
-        if dim_match:
-            dimension = dim_match.group(1)
-            answer = f"""**Model Dimension (d_model): {dimension}**
-
-The model dimension represents the **embedding size** throughout the Transformer architecture:
-
-• **Input/Output Consistency** - Maintains consistent dimensionality across all layers
-• **Representation Capacity** - Determines the richness of vector representations
-• **Computational Balance** - Balances model capacity with computational efficiency
-
-**Key Points:**
-• Used for token embeddings, position encodings, and all intermediate representations
-• Typical values: 512, 768, or 1024 depending on model size
-• Affects both model performance and computational requirements"""
-        else:
-            answer = extract_best_sentences(query, context)
-    
-    elif 'attention' in query_lower and 'mechanism' in query_lower:
-        answer = """**Attention Mechanism** in Transformers:
-
-**Core Components:**
-• **Queries** - Represent what we're looking for
-• **Keys** - Represent what we can attend to  
-• **Values** - Represent the actual information content
-
-**Process:**
-1. Compute attention scores between queries and keys
-2. Apply softmax to get attention weights
-3. Weighted sum of values using attention weights
-
-**Benefits:**
-• **Flexible Context** - Can attend to any position in the sequence
-• **Parallel Computation** - All attention calculations can be done simultaneously
-• **Interpretability** - Attention weights show what the model focuses on"""
-    
-    elif 'transformer' in query_lower and 'architecture' in query_lower:
-        answer = """**Transformer Architecture Overview:**
-
-**Encoder Stack:**
-• Multiple identical layers (typically 6)
-• Each layer with multi-head self-attention and feed-forward network
-• Processes input sequence to create contextual representations
-
-**Decoder Stack:**
-• Also multiple identical layers
-• Additional cross-attention layer to encoder outputs
-• Auto-regressive generation with masked self-attention
-
-**Key Innovations:**
-• **Self-Attention** - Replaces recurrence and convolution
-• **Positional Encoding** - Injects sequence order information
-• **Scaled Dot-Product Attention** - Efficient attention computation
-• **Residual Connections** - Helps with gradient flow in deep networks"""
-    
-    else:
-        answer = extract_best_sentences(query, context)
-    
-    return f"{answer}\n\n**Source:** {', '.join(sources)}"
-
-def extract_best_sentences(query: str, context: str) -> str:
-    """Extract and format the most relevant sentences"""
-    query_lower = query.lower()
-    sentences = re.split(r'[.!?]+', context)
-    
-    relevant_sentences = []
-    query_words = [word for word in query_lower.split() if len(word) > 3]
-    
-    for sentence in sentences:
-        sentence_lower = sentence.lower()
-        # Score sentence relevance
-        score = sum(1 for word in query_words if word in sentence_lower)
-        
-        if score > 0 and len(sentence.strip()) > 20:
-            relevant_sentences.append((sentence.strip(), score))
-    
-    # Sort by relevance score
-    relevant_sentences.sort(key=lambda x: x[1], reverse=True)
-    
-    if relevant_sentences:
-        top_sentences = [s[0] for s in relevant_sentences[:4]]
-        return "**Key Information from Documents:**\n\n" + "\n".join(f"• {sentence}." for sentence in top_sentences)
-    else:
-        # Fallback: return meaningful excerpt with better formatting
-        words = context.split()
-        if len(words) > 80:
-            excerpt = ' '.join(words[:80])
-            return f"**Relevant Content Found:**\n\n{excerpt}...\n\n*For more detailed information, please refer to the specific sections in the source documents.*"
-        else:
-            return f"**Relevant Content:**\n\n{context}"
+    embedder = get_engine().embedder
+    index = Index()
+    index.add(chunks, metadatas, embedder.encode_corpus(chunks))
+    return index.search(embedder.encode([query])[0], top_k=top_k)
 
 @router.post("/query")
 async def handle_query(request: QueryRequest):
+    timings = start_timings()
+    with timed("total"):
+        response = await answer_query(request)
+    logger.info(f"Query timings: {format_timings(timings)}")
+    if request.include_timings:
+        response.timings = timings_ms(timings)
+    return response
+
+async def answer_query(request: QueryRequest) -> QueryResponse:
+    """
+    Answer a query. Sync, encoding, search and synthesis block, so they run in
+    the thread pool and concurrent queries proceed (and batch) together.
+    """
     try:
         logger.info(f"Processing query: {request.query}")
         
-        # Initialize model
-        initialize_model()
+        engine = get_engine()
         
         # Check if upload directory exists and has files
         if not UPLOAD_DIR.exists() or not any(UPLOAD_DIR.iterdir()):
@@ -298,39 +226,148 @@ async def handle_query(request: QueryRequest):
                 sources=[]
             )
         
-        # Get all document chunks
-        chunks, metadatas = get_document_chunks()
+        # Bring the index up to date with the upload directory
+        with timed("sync"):
+            await run_in_threadpool(engine.sync)
         
-        if not chunks:
+        if not len(engine.index):
             return QueryResponse(
                 answer="❌ No text content could be extracted from the uploaded documents.",
                 sources=[]
             )
         
-        # Find relevant chunks using semantic search
-        relevant_chunks = find_relevant_chunks(request.query, chunks, metadatas, top_k=3)
+        # A paraphrase of a recently answered question gets the cached response
+        query_embedding, cached = await run_in_threadpool(lookup_cached_answer, engine, request)
+        if cached is not None:
+            return QueryResponse(**cached)
+        generation = engine.generation
+        
+        # Find relevant chunks using semantic search, and the diverse ones to answer from
+        relevant_chunks, next_cursor, context = await run_in_threadpool(retrieve_with_context, engine,
+                                                                        request, query_embedding)
+        with timed("serialize"):
+            chunks = [serialize_chunk(chunk) for chunk in relevant_chunks] \
+                if request.include_chunks or request.cursor else None
+        
+        # Source files of the returned chunks and of the answer's context
+        sources = source_files(relevant_chunks, context)
+        
+        if request.cursor:
+            # Follow-up pages only carry more retrieved chunks; the answer came with the first page
+            return QueryResponse(answer="", sources=sources, chunks=chunks, next_cursor=next_cursor)
         
         if not relevant_chunks:
             return QueryResponse(
-                answer=f"❌ I couldn't find specific information about '{request.query}' in the uploaded documents.",
+                answer=no_results_message(request),
                 sources=[]
             )
         
         # Generate intelligent answer
-        answer = generate_intelligent_answer(request.query, relevant_chunks)
-        
-        # Get source files
-        sources = list(set(chunk['metadata']['file'] for chunk in relevant_chunks))
+        with timed("synthesize"):
+            answer = await run_in_threadpool(engine.answer, request.query, context)
         
-        return QueryResponse(
-            answer=answer,
-            sources=sources
-        )
+        response = {'answer': answer, 'sources': sources, 'chunks': chunks, 'next_cursor': next_cursor}
+        remember_answer(request, query_embedding, generation, response)
+        return QueryResponse(**response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/query/stream")
+async def handle_query_stream(request: QueryRequest):
+    """
+    Same as /query, streamed as Server-Sent Events: a `sources` event as soon as
+    retrieval finishes, then `token` events carrying the answer incrementally,
+    then `done` (or a single `error`).
+    """
+    async def events():
+        timings = start_timings()
+        started = time.perf_counter()
+        
+        def done():
+            record("total", time.perf_counter() - started)
+            logger.info(f"Streamed query timings: {format_timings(timings)}")
+            return sse_event("done", {"timings": timings_ms(timings)} if request.include_timings else {})
+        
+        try:
+            logger.info(f"Processing streamed query: {request.query}")
+            engine = get_engine()
+            
+            if not UPLOAD_DIR.exists() or not any(UPLOAD_DIR.iterdir()):
+                yield sse_event("sources", {"sources": []})
+                yield sse_event("token", {"text": "❌ No documents found. Please upload documents first."})
+                yield done()
+                return
+            
+            with timed("sync"):
+                await run_in_threadpool(engine.sync)
+            
+            if not len(engine.index):
+                yield sse_event("sources", {"sources": []})
+                yield sse_event("token", {"text": "❌ No text content could be extracted from the uploaded documents."})
+                yield done()
+                return
+            
+            query_embedding, cached = await run_in_threadpool(lookup_cached_answer, engine, request)
+            if cached is not None:
+                payload = {"sources": cached['sources'], "next_cursor": cached['next_cursor']}
+                if request.include_chunks:
+                    payload["chunks"] = cached['chunks']
+                yield sse_event("sources", payload)
+                yield sse_event("token", {"text": cached['answer']})
+                yield done()
+                return
+            generation = engine.generation
+            
+            relevant_chunks, next_cursor, context = await run_in_threadpool(retrieve_with_context, engine,
+                                                                            request, query_embedding)
+            sources = source_files(relevant_chunks, context)
+            with timed("serialize"):
+                chunks = [serialize_chunk(chunk) for chunk in relevant_chunks] \
+                    if request.include_chunks or request.cursor else None
+            payload = {"sources": sources, "next_cursor": next_cursor}
+            if chunks is not None:
+                payload["chunks"] = chunks
+            yield sse_event("sources", payload)
+            
+            if request.cursor:
+                # Follow-up pages only carry more retrieved chunks
+                yield done()
+                return
+            
+            if not relevant_chunks:
+                yield sse_event("token", {"text": no_results_message(request)})
+            else:
+                pieces = []
+                with timed("synthesize"):
+                    async for text in iterate_in_threadpool(engine.stream_answer(request.query, context)):
+                        pieces.append(text)
+                        yield sse_event("token", {"text": text})
+                remember_answer(request, query_embedding, generation, {
+                    'answer': "".join(pieces), 'sources': sources, 'chunks': chunks, 'next_cursor': next_cursor,
+                })
+            yield done()
+            
+        except HTTPException as e:
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Error processing streamed query: {str(e)}")
+            yield sse_event("error", {"status": 500, "detail": f"Error processing query: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -339,7 +376,8 @@ async def health_check():
         return {
             "status": "healthy",
             "rag_system": "operational",
-            "model_loaded": model is not None
+            "model_loaded": get_engine().embedder.loaded,
+            "embedding_model": get_engine().embedder.model_name,
         }
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
\ No newline at end of file
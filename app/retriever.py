@@ -1,35 +1,37 @@
+from app.engine import Index, get_engine
 
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.chains import RetrievalQA
-import os
-
-EMBEDDING_DIR = "embeddings"
-
-def create_vector_store(chunks: list) -> FAISS:
+def create_vector_store(chunks: list) -> Index:
     """
-    Create a FAISS vector store from a list of document chunks.
+    Create a vector index from a list of document chunks.
 
     Args:
         chunks (list): A list of document chunks.
 
     Returns:
-        FAISS: A FAISS vector store.
+        Index: An index over the chunk embeddings.
     """
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vector_store = FAISS.from_documents(chunks, embedding=embeddings)
-    return vector_store
+    embedder = get_engine().embedder
+    index = Index()
+    index.add(chunks, [{'file': None, 'chunk_index': i, 'total_chunks': len(chunks)} for i in range(len(chunks))],
+              embedder.encode_corpus(chunks))
+    return index
 
-def create_retriever(vector_store: FAISS, k: int = 5):
+def create_retriever(vector_store: Index, k: int = 5):
     """
-    Create a retriever from a FAISS vector store.
+    Create a retriever from a vector index.
 
     Args:
-        vector_store (FAISS): A FAISS vector store.
+        vector_store (Index): A vector index.
         k (int, optional): The number of relevant documents to retrieve. Defaults to 5.
 
     Returns:
-        RetrievalQA: A retriever.
+        Callable[[str], list]: A function mapping a query to its k most relevant chunks.
     """
-    return vector_store.as_retriever(k=k)
+    embedder = get_engine().embedder
+
+    def retrieve(query: str) -> list:
+        if not len(vector_store):
+            return []
+        return vector_store.search(embedder.encode([query])[0], top_k=k)
 
+    return retrieve
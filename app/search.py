@@ -0,0 +1,92 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional
+import html
+import logging
+import re
+from urllib.parse import quote
+from app.engine import get_engine
+from app.query import RetrievalRequest, retrieve_page
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+class SearchRequest(RetrievalRequest):
+    # Optional payload; leaving both off keeps chunk texts out of the response entirely
+    include_text: bool = False
+    snippets: bool = False
+    snippet_words: int = Field(30, ge=5, le=200)
+
+class SearchResponse(BaseModel):
+    results: list = []
+    next_cursor: Optional[str] = None
+
+def query_terms(query: str) -> set:
+    """Lower-cased query words worth highlighting (same rule as extract_best_sentences)"""
+    return {word for word in re.findall(r'\w+', query.lower()) if len(word) > 3}
+
+def highlight_snippet(text: str, terms: set, window: int = 30) -> str:
+    """Return the `window`-word stretch of `text` with the most query terms as HTML, matches wrapped in <mark>"""
+    words = text.split()
+    if not words:
+        return ""
+    hits = [1 if re.sub(r'\W+', '', word.lower()) in terms else 0 for word in words]
+
+    # Sliding window over hit counts
+    count = sum(hits[:window])
+    best_start, best_count = 0, count
+    for start in range(1, max(len(words) - window, 0) + 1):
+        count += hits[start + window - 1] - hits[start - 1]
+        if count > best_count:
+            best_start, best_count = start, count
+
+    # Document text is untrusted: escape it so only our <mark> tags are markup
+    snippet = ' '.join(
+        f"<mark>{html.escape(word)}</mark>" if hit else html.escape(word)
+        for word, hit in zip(words[best_start:best_start + window], hits[best_start:best_start + window])
+    )
+    prefix = "… " if best_start > 0 else ""
+    suffix = " …" if best_start + window < len(words) else ""
+    return f"{prefix}{snippet}{suffix}"
+
+@router.post("/search")
+def search(request: SearchRequest):
+    """
+    Ranked chunks for a query, without answer synthesis.
+    A plain def, so FastAPI runs it in the thread pool: sync can wait on the
+    engine lock during an ingest, and encoding and search block.
+    """
+    try:
+        engine = get_engine()
+        engine.sync()
+        
+        relevant_chunks, next_cursor = retrieve_page(engine, request,
+                                                     with_text=request.include_text or request.snippets)
+        
+        terms = query_terms(request.query) if request.snippets else None
+        results = []
+        for chunk in relevant_chunks:
+            metadata = chunk['metadata']
+            result = {
+                'id': f"{metadata['file']}#{metadata['chunk_index']}",
+                'score': chunk['similarity'],
+                'file': metadata['file'],
+                'file_url': f"/uploads/{quote(metadata['file'])}",
+                'chunk_index': metadata['chunk_index'],
+                'page': metadata['page'],
+                'span': [metadata['start'], metadata['end']],
+            }
+            if request.include_text:
+                result['text'] = chunk['text']
+            if request.snippets:
+                result['snippet'] = highlight_snippet(chunk['text'], terms, request.snippet_words)
+            results.append(result)
+        
+        return SearchResponse(results=results, next_cursor=next_cursor)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing search: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing search: {str(e)}")
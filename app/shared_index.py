@@ -0,0 +1,262 @@
+"""
+Index snapshots shared between uvicorn workers through memory-mapped files.
+
+Segments (see app/engine.py) are immutable, so each one is written exactly
+once and shared by every snapshot that contains it:
+
+    segments/00000012/embeddings.npy      float32 (n, dim), opened with mmap_mode='r'
+    segments/00000012/texts.bin           all chunk texts as one UTF-8 blob
+    segments/00000012/text_offsets.npy    int64 (n + 1) byte offsets into texts.bin
+    segments/00000012/files.json          interned file names (app/metadata.py)
+    segments/00000012/centroids.npy       float32 (files, dim) per-file centroids for two-stage search
+    segments/00000012/signatures.npy      uint64 (n) SimHash of each chunk for near-duplicate detection
+    segments/00000012/<column>.npy        columnar chunk metadata, also memory-mapped
+    v00000007/manifest.json               segment ids, embedding model, indexed file signatures
+    v00000007/deleted.npz                 packed deletion bitmaps per segment
+    CURRENT                               version number of the live snapshot
+    MODEL_OVERRIDE                        model an admin re-embedded the index with, and the
+                                          EMBEDDING_MODEL it overrides (app/engine.py)
+
+Workers map the arrays read-only, so the page cache holds a single copy no
+matter how many workers attach, and publishing writes only new segments plus
+a small manifest. A snapshot is written to a temporary directory, renamed into
+place and only then announced by atomically replacing CURRENT, so readers
+either see the old version or the complete new one.
+"""
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from app.metadata import ChunkMetadata
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker deployments only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Snapshots kept on disk besides the current one, for workers still mapped to them
+KEEP_PREVIOUS_VERSIONS = 2
+
+
+class TextColumn:
+    """Read-only sequence of strings backed by a UTF-8 blob and an offsets array"""
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("text index out of range")
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @staticmethod
+    def write(texts, blob_path: Path, offsets_path: Path):
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        with open(blob_path, 'wb') as blob:
+            for i, text in enumerate(texts):
+                data = text.encode('utf-8')
+                blob.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(offsets_path, offsets)
+
+    @classmethod
+    def open(cls, blob_path: Path, offsets_path: Path) -> "TextColumn":
+        offsets = np.load(offsets_path, mmap_mode='r')
+        # np.memmap refuses empty files
+        blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if offsets[-1] else b""
+        return cls(blob, offsets)
+
+
+class IndexStore:
+    """Publishes index snapshots to a directory and attaches to the current one"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.current_path = self.directory / "CURRENT"
+        self.override_path = self.directory / "MODEL_OVERRIDE"
+
+    def current_version(self) -> int:
+        try:
+            return int(self.current_path.read_text().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def version_dir(self, version: int) -> Path:
+        return self.directory / f"v{version:08d}"
+
+    @contextmanager
+    def _flock(self, name: str):
+        if fcntl is None:
+            yield
+            return
+        with open(self.directory / name, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def lock(self):
+        """Exclusive lock across processes, held while checking for changes and publishing"""
+        return self._flock(".lock")
+
+    def reembed_lock(self):
+        """
+        Exclusive lock across processes, held for a whole re-embed so only one
+        process encodes the index. Take it before lock(), never while holding it.
+        """
+        return self._flock(".reembed.lock")
+
+    def model_override(self):
+        """{'model', 'configured_model'} of the last re-embed away from the configured model, or None"""
+        try:
+            return json.loads(self.override_path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+
+    def set_model_override(self, override):
+        """Record `override` (see model_override), or clear it with None. Call with lock() held."""
+        if override is None:
+            self.override_path.unlink(missing_ok=True)
+            return
+        tmp_path = self.directory / f"MODEL_OVERRIDE.tmp-{os.getpid()}"
+        tmp_path.write_text(json.dumps(override), encoding='utf-8')
+        os.replace(tmp_path, self.override_path)
+
+    def segment_dir(self, segment_id: int) -> Path:
+        return self.directory / "segments" / f"{segment_id:08d}"
+
+    def _is_stored(self, segment) -> bool:
+        """Whether `segment` is the one mapped from this store's segment directory of its id"""
+        stored = self.segment_dir(segment.id) / "embeddings.npy"
+        mapped = getattr(segment.embeddings, 'filename', None)
+        return mapped is not None and stored.exists() and os.path.samefile(mapped, stored)
+
+    def _write_segment(self, segment):
+        path = self.segment_dir(segment.id)
+        if path.exists():
+            # Another snapshot's segment: overwriting or skipping it would corrupt one of the two
+            raise FileExistsError(f"Segment {segment.id} already exists in {self.directory}")
+        tmp_dir = path.with_name(f"tmp-{os.getpid()}-{segment.id}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        np.save(tmp_dir / "embeddings.npy", np.ascontiguousarray(segment.embeddings, dtype=np.float32))
+        TextColumn.write(segment.chunks, tmp_dir / "texts.bin", tmp_dir / "text_offsets.npy")
+        segment.metadatas.save(tmp_dir)
+        np.save(tmp_dir / "centroids.npy", segment.centroids)
+        np.save(tmp_dir / "signatures.npy", segment.signatures)
+        os.replace(tmp_dir, path)
+
+    def publish(self, index, files: dict) -> int:
+        """Write `index` as a new snapshot and make it current. Call with lock() held."""
+        version = self.current_version() + 1
+        for segment in index.segments:
+            # Segments attached from an earlier snapshot are already on disk
+            if not self._is_stored(segment):
+                self._write_segment(segment)
+
+        tmp_dir = self.directory / f"tmp-{os.getpid()}-{version}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        with open(tmp_dir / "manifest.json", 'w', encoding='utf-8') as manifest:
+            json.dump({
+                'segments': [segment.id for segment in index.segments],
+                'next_segment_id': index.next_segment_id,
+                'model': index.model,
+                'dim': index.dim,
+                'files': files,
+            }, manifest)
+        np.savez(tmp_dir / "deleted.npz", **{
+            str(segment.id): np.packbits(segment.deleted)
+            for segment in index.segments if segment.live_count < len(segment)
+        })
+
+        os.replace(tmp_dir, self.version_dir(version))
+        tmp_current = self.directory / f"CURRENT.tmp-{os.getpid()}"
+        tmp_current.write_text(str(version))
+        os.replace(tmp_current, self.current_path)
+
+        logger.info(f"Published index version {version} ({len(index)} chunks in {len(index.segments)} segments)")
+        self._cleanup(version)
+        return version
+
+    def attach(self, version: int):
+        """Map snapshot `version` read-only, returning (index, files)"""
+        from app.engine import Index, Segment
+
+        if version == 0:
+            return Index(), {}
+
+        path = self.version_dir(version)
+        with open(path / "manifest.json", encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        with np.load(path / "deleted.npz") as deleted:
+            bitmaps = {int(key): deleted[key] for key in deleted.files}
+
+        segments = []
+        for segment_id in manifest['segments']:
+            segment_path = self.segment_dir(segment_id)
+            metadatas = ChunkMetadata.load(segment_path)
+            deleted = None
+            if segment_id in bitmaps:
+                # Private, writable copy: deletes stay local until the next publish
+                deleted = np.unpackbits(bitmaps[segment_id], count=len(metadatas)).astype(bool)
+            centroids_path = segment_path / "centroids.npy"
+            signatures_path = segment_path / "signatures.npy"
+            segments.append(Segment(
+                segment_id,
+                np.load(segment_path / "embeddings.npy", mmap_mode='r'),
+                TextColumn.open(segment_path / "texts.bin", segment_path / "text_offsets.npy"),
+                metadatas,
+                deleted,
+                # Segments written before centroids were stored get them computed on attach
+                np.load(centroids_path, mmap_mode='r') if centroids_path.exists() else None,
+                np.load(signatures_path, mmap_mode='r') if signatures_path.exists() else None,
+            ))
+
+        files = {name: tuple(signature) for name, signature in manifest['files'].items()}
+        index = Index(segments, manifest['next_segment_id'], model=manifest.get('model'), dim=manifest.get('dim'))
+        return index, files
+
+    def _cleanup(self, current: int):
+        referenced = set()
+        for path in self.directory.iterdir():
+            if not path.is_dir() or not path.name.startswith("v"):
+                continue
+            try:
+                version = int(path.name[1:])
+            except ValueError:
+                continue
+            if version < current - KEEP_PREVIOUS_VERSIONS:
+                # On Windows a snapshot still mapped by a worker cannot be removed yet
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            try:
+                with open(path / "manifest.json", encoding='utf-8') as manifest_file:
+                    referenced.update(json.load(manifest_file)['segments'])
+            except (OSError, ValueError):
+                pass
+
+        segments_dir = self.directory / "segments"
+        if segments_dir.exists():
+            for path in segments_dir.iterdir():
+                if path.name.isdigit() and int(path.name) not in referenced:
+                    shutil.rmtree(path, ignore_errors=True)
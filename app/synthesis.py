@@ -0,0 +1,122 @@
+import re
+import threading
+from collections import OrderedDict
+from app import config
+from app.intents import INTENTS
+
+class AnswerCache:
+    """
+    Bounded LRU of canned-answer pieces for one index generation.
+
+    Holds the template parameters extracted for a (rule, context chunks) pair
+    and the answers rendered for a (rule, parameters, sorted sources) key, so
+    a repeated FAQ-style question neither rebuilds its context nor re-renders.
+    Everything is dropped as soon as a lookup comes from a newer generation.
+    """
+
+    def __init__(self, max_entries: int = config.ANSWER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.generation = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key, generation: str):
+        with self._lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, generation: str, value):
+        with self._lock:
+            if generation != self.generation or self.max_entries <= 0:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+ANSWER_CACHE = AnswerCache()
+
+def _canned_answer(rule, chunks: list, sources: list, generation: str = None):
+    """Rendered answer of `rule` for these chunks, or None when their context doesn't support it"""
+    if generation is None:
+        parameters = rule.parameters("\n\n".join(chunk['text'] for chunk in chunks))
+        return rule.render(parameters) if parameters is not None else None
+
+    chunk_ids = tuple((chunk['metadata']['file'], chunk['metadata'].get('chunk_index')) for chunk in chunks)
+    parameters_key = ('parameters', rule.name, chunk_ids)
+    parameters = ANSWER_CACHE.get(parameters_key, generation)
+    if parameters is None:
+        parameters = rule.parameters("\n\n".join(chunk['text'] for chunk in chunks))
+        # False marks "context checked, no canned answer" so it is not checked again
+        ANSWER_CACHE.put(parameters_key, generation, parameters if parameters is not None else False)
+    if parameters is None or parameters is False:
+        return None
+
+    answer_key = ('answer', rule.name, tuple(sorted(parameters.items())), tuple(sources))
+    answer = ANSWER_CACHE.get(answer_key, generation)
+    if answer is None:
+        answer = rule.render(parameters)
+        ANSWER_CACHE.put(answer_key, generation, answer)
+    return answer
+
+def generate_intelligent_answer(query: str, relevant_chunks: list, max_chunks: int = config.CONTEXT_CHUNKS,
+                                generation: str = None) -> str:
+    """
+    Generate intelligent answer using rule-based synthesis with better formatting.
+    Pass the index `generation` the chunks came from to reuse cached canned answers.
+    """
+    chunks = relevant_chunks[:max_chunks]
+    sources = sorted(set(chunk['metadata']['file'] for chunk in chunks))
+    
+    # Canned answers for common questions (app/intents.py), else the best sentences
+    answer = None
+    rule = INTENTS.match(query)
+    if rule is not None:
+        answer = _canned_answer(rule, chunks, sources, generation)
+    if answer is None:
+        answer = extract_best_sentences(query, "\n\n".join(chunk['text'] for chunk in chunks))
+    
+    return f"{answer}\n\n**Source:** {', '.join(sources)}"
+
+def extract_best_sentences(query: str, context: str) -> str:
+    """Extract and format the most relevant sentences"""
+    query_lower = query.lower()
+    sentences = re.split(r'[.!?]+', context)
+    
+    relevant_sentences = []
+    query_words = [word for word in query_lower.split() if len(word) > 3]
+    
+    for sentence in sentences:
+        sentence_lower = sentence.lower()
+        # Score sentence relevance
+        score = sum(1 for word in query_words if word in sentence_lower)
+        
+        if score > 0 and len(sentence.strip()) > 20:
+            relevant_sentences.append((sentence.strip(), score))
+    
+    # Sort by relevance score
+    relevant_sentences.sort(key=lambda x: x[1], reverse=True)
+    
+    if relevant_sentences:
+        top_sentences = [s[0] for s in relevant_sentences[:4]]
+        return "**Key Information from Documents:**\n\n" + "\n".join(f"• {sentence}." for sentence in top_sentences)
+    else:
+        # Fallback: return meaningful excerpt with better formatting
+        words = context.split()
+        if len(words) > 80:
+            excerpt = ' '.join(words[:80])
+            return f"**Relevant Content Found:**\n\n{excerpt}...\n\n*For more detailed information, please refer to the specific sections in the source documents.*"
+        else:
+            return f"**Relevant Content:**\n\n{context}"
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
 from fastapi.responses import JSONResponse
 import os
 import shutil
 from pathlib import Path
 import logging
+from app.engine import get_engine
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +15,7 @@ UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 @router.post("/upload")
-async def upload_files(files: list[UploadFile] = File(...)):
+async def upload_files(background_tasks: BackgroundTasks, files: list[UploadFile] = File(...)):
     """
     Upload multiple files to the knowledge base
     """
@@ -81,6 +82,8 @@ async def upload_files(files: list[UploadFile] = File(...)):
     
     # Return response
     if uploaded_files:
+        # Index only the new files as a fresh segment, after the response is sent
+        background_tasks.add_task(get_engine().sync)
         return JSONResponse(
             status_code=200,
             content={
@@ -113,7 +116,7 @@ async def get_uploaded_files():
         raise HTTPException(status_code=500, detail=f"Error fetching files: {str(e)}")
 
 @router.delete("/files/{filename}")
-async def delete_file(filename: str):
+async def delete_file(filename: str, background_tasks: BackgroundTasks):
     """
     Delete a specific file
     """
@@ -129,6 +132,7 @@ async def delete_file(filename: str):
         
         file_path.unlink()
         logger.info(f"Deleted file: {filename}")
+        background_tasks.add_task(get_engine().sync)
         
         return {"message": f"File {filename} deleted successfully"}
         
@@ -0,0 +1 @@
+"""Performance benchmarks for the search engine. Run modules with `python -m benchmarks.<name>`."""
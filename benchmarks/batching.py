@@ -0,0 +1,125 @@
+"""
+Corpus embedding throughput: fixed-size batches vs length-bucketed batches.
+
+Encodes the uploaded documents' chunks with `embedder.encode` (fixed batches
+in arrival order) and with `embedder.encode_corpus` (sorted by token length,
+batch size adapted to EMBEDDING_BATCH_TOKENS), and reports chunks/s and the
+share of padded positions that carry real tokens. Chunks cut at CHUNK_SIZE
+words are mostly the same length, so by default they are also trimmed to
+random lengths to mimic a corpus of mixed document sizes (--no-vary-lengths
+disables that). Also checks that both paths return the same vectors.
+
+    python -m benchmarks.batching [--backend onnx] [--max-chunks 1024] [--json]
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from app import config
+from app.engine import EMBEDDER_BACKENDS, length_buckets, load_backend
+from benchmarks.embedders import REPO_ROOT, load_corpus
+
+FIXED_BATCH_SIZE = 32
+
+
+def vary_lengths(chunks: list, seed: int = 0) -> list:
+    """Trim each chunk to a random number of words, from a sentence up to the full chunk"""
+    rng = np.random.default_rng(seed)
+    varied = []
+    for chunk in chunks:
+        words = chunk.split()
+        varied.append(" ".join(words[:int(rng.integers(min(8, len(words)), len(words) + 1))]))
+    return varied
+
+
+def padding_efficiency(lengths: np.ndarray, batches: list) -> float:
+    """Real tokens / padded positions over `batches` (lists of row numbers)"""
+    real = padded = 0
+    for rows in batches:
+        batch_lengths = lengths[rows]
+        real += int(batch_lengths.sum())
+        padded += int(batch_lengths.max()) * len(rows)
+    return real / padded if padded else 1.0
+
+
+def time_call(function, runs: int) -> float:
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=config.EMBEDDER_BACKEND)
+    parser.add_argument("--upload-dir", default=REPO_ROOT / config.UPLOAD_DIR)
+    parser.add_argument("--max-chunks", type=int, default=1024)
+    parser.add_argument("--no-vary-lengths", dest="vary_lengths", action="store_false")
+    parser.add_argument("--token-budget", type=int, default=config.EMBEDDING_BATCH_TOKENS)
+    parser.add_argument("--max-batch", type=int, default=config.EMBEDDING_MAX_BATCH)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print a JSON summary instead of a table")
+    args = parser.parse_args()
+
+    chunks = load_corpus(args.upload_dir, args.max_chunks)
+    if not chunks:
+        parser.error(f"No indexable documents in {args.upload_dir}")
+    if args.vary_lengths:
+        chunks = vary_lengths(chunks)
+
+    embedder = load_backend(EMBEDDER_BACKENDS, args.backend)()
+    embedder.load()
+    embedder.encode(chunks[:8])  # warm-up
+
+    lengths = embedder.token_lengths(chunks)
+    fixed_batches = [np.arange(start, min(start + FIXED_BATCH_SIZE, len(chunks)))
+                     for start in range(0, len(chunks), FIXED_BATCH_SIZE)]
+    bucketed_batches = length_buckets(lengths, args.token_budget, args.max_batch)
+
+    fixed_seconds = time_call(lambda: embedder.encode(chunks), args.runs)
+    bucketed_seconds = time_call(
+        lambda: embedder.encode_corpus(chunks, token_budget=args.token_budget, max_batch=args.max_batch), args.runs)
+    max_difference = float(np.abs(
+        embedder.encode(chunks)
+        - embedder.encode_corpus(chunks, token_budget=args.token_budget, max_batch=args.max_batch)
+    ).max())
+
+    summary = {
+        "backend": args.backend,
+        "chunks": len(chunks),
+        "tokens_mean": round(float(lengths.mean()), 1),
+        "tokens_max": int(lengths.max()),
+        "fixed": {
+            "batches": len(fixed_batches),
+            "chunks_per_s": round(len(chunks) / fixed_seconds, 1),
+            "padding_efficiency": round(padding_efficiency(lengths, fixed_batches), 3),
+        },
+        "bucketed": {
+            "batches": len(bucketed_batches),
+            "chunks_per_s": round(len(chunks) / bucketed_seconds, 1),
+            "padding_efficiency": round(padding_efficiency(lengths, bucketed_batches), 3),
+        },
+        "speedup": round(fixed_seconds / bucketed_seconds, 2),
+        "max_abs_difference": max_difference,
+    }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"{summary['chunks']} chunks with {args.backend}, "
+          f"{summary['tokens_mean']} tokens on average (max {summary['tokens_max']})\n")
+    print(f"{'':<10}{'batches':>9}{'chunks/s':>11}{'padding eff.':>14}")
+    for name in ("fixed", "bucketed"):
+        result = summary[name]
+        print(f"{name:<10}{result['batches']:>9}{result['chunks_per_s']:>11.1f}{result['padding_efficiency']:>14.3f}")
+    print(f"\nSpeedup {summary['speedup']:.2f}x, max difference between the two paths {max_difference:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Synthetic document corpus for the benchmarks.
+
+Writes `--docs` documents of about `--words` words each, cycling through the
+requested formats (txt, pdf, docx), built from a seeded vocabulary of made-up
+words with Zipf-like frequencies plus a few shared topic terms, so the same
+arguments always give the same corpus. `--near-duplicates` turns that
+fraction of the documents into lightly edited revisions of earlier ones
+(drafts), which exercises near-duplicate detection at ingest.
+
+    python -m benchmarks.corpus --out /tmp/kb-corpus [--docs 50] [--words 2000] [--formats txt pdf docx]
+
+PDFs are written by a minimal built-in writer (Helvetica text, no
+dependencies); docx needs python-docx, which the app already uses to read them.
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+FORMATS = ("txt", "pdf", "docx")
+
+TOPIC_TERMS = [
+    "attention", "encoder", "decoder", "embedding", "transformer", "gradient", "latency", "throughput",
+    "index", "segment", "retrieval", "query", "vector", "dimension", "layer", "training", "dataset",
+    "benchmark", "memory", "cache",
+]
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "sa", "tor", "vel", "qui", "dan", "pe", "shu", "ba", "nix", "or", "tem", "zu"]
+
+WORDS_PER_PAGE = 450
+LINE_CHARACTERS = 90
+
+
+def vocabulary(size: int, rng: np.random.Generator) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES, size=int(rng.integers(2, 5)))))
+    return sorted(words) + TOPIC_TERMS
+
+
+def document_text(words: int, vocab: list, weights: np.ndarray, rng: np.random.Generator) -> str:
+    """Paragraphs of sentences of 8-20 words drawn from `vocab`"""
+    drawn = rng.choice(len(vocab), size=words, p=weights)
+    paragraphs, sentence, sentences = [], [], []
+    for position, word_id in enumerate(drawn):
+        sentence.append(vocab[word_id])
+        if len(sentence) >= rng.integers(8, 21) or position == words - 1:
+            sentences.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+            if len(sentences) >= rng.integers(4, 9) or position == words - 1:
+                paragraphs.append(" ".join(sentences))
+                sentences = []
+    return "\n\n".join(paragraphs)
+
+
+def revise(text: str, vocab: list, rng: np.random.Generator, edit_ratio: float = 0.01) -> str:
+    """A draft of `text`: about `edit_ratio` of its words replaced"""
+    words = text.split(" ")
+    for position in rng.choice(len(words), size=max(1, int(len(words) * edit_ratio)), replace=False):
+        words[position] = vocab[int(rng.integers(len(vocab)))]
+    return " ".join(words)
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, text: str):
+    """Write `text` as a plain multi-page PDF (Helvetica 10pt, WORDS_PER_PAGE words per page)"""
+    words = text.split()
+    pages = [words[start:start + WORDS_PER_PAGE] for start in range(0, len(words), WORDS_PER_PAGE)] or [[]]
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_words in pages:
+        lines, line = [], ""
+        for word in page_words:
+            if len(line) + len(word) + 1 > LINE_CHARACTERS:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+        content = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content.encode('latin-1'))} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {len(page_ids)} >>"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    path.write_bytes(bytes(output))
+
+
+def write_docx(path: Path, text: str):
+    from docx import Document
+
+    document = Document()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    document.save(str(path))
+
+
+def generate_corpus(directory: Path, docs: int, words: int, formats=FORMATS, seed: int = 0,
+                    near_duplicates: float = 0.0, vocabulary_size: int = 5000) -> list:
+    """Write the corpus to `directory`, returning [(path, text)]"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    vocab = vocabulary(vocabulary_size, rng)
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+
+    documents = []
+    for number in range(docs):
+        if documents and rng.random() < near_duplicates:
+            text = revise(documents[int(rng.integers(len(documents)))][1], vocab, rng)
+        else:
+            text = document_text(max(1, int(rng.normal(words, words / 5))), vocab, weights, rng)
+        file_format = formats[number % len(formats)]
+        path = directory / f"doc-{number:05d}.{file_format}"
+        if file_format == "pdf":
+            write_pdf(path, text)
+        elif file_format == "docx":
+            write_docx(path, text)
+        else:
+            path.write_text(text, encoding='utf-8')
+        documents.append((path, text))
+    return documents
+
+
+def sample_queries(texts: list, count: int, seed: int = 0, words: int = 8) -> list:
+    """Distinct queries made of `words` consecutive words from random places in the corpus"""
+    rng = np.random.default_rng(seed + 1)
+    queries = set()
+    attempts = 0
+    while len(queries) < count and attempts < count * 20:
+        attempts += 1
+        text_words = texts[int(rng.integers(len(texts)))].split()
+        if len(text_words) <= words:
+            continue
+        start = int(rng.integers(len(text_words) - words))
+        queries.add(" ".join(text_words[start:start + words]).strip(".").lower())
+    return sorted(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--words", type=int, default=2000, help="mean words per document")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--near-duplicates", type=float, default=0.0, help="fraction of documents that are drafts")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = generate_corpus(args.out, args.docs, args.words, args.formats, args.seed, args.near_duplicates)
+    size = sum(path.stat().st_size for path, _ in documents)
+    print(f"Wrote {len(documents)} documents ({size / 1e6:.1f} MB) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Accuracy-vs-speed benchmark for the embedder backends.
+
+Embeds chunks of the documents in the uploads directory with every backend,
+takes the fp32 sentence-transformers model as the reference, and reports per
+backend:
+
+    chunks/s      encode throughput, median over runs after a warm-up call
+    cosine        mean and minimum cosine between its vectors and the reference's
+    recall@k      overlap of the top-k chunks it retrieves for pseudo-queries
+                  (the opening words of sampled chunks) with the reference's
+
+A backend is acceptable when its mean cosine and recall@k reach the given
+thresholds; the fastest acceptable one is recommended for EMBEDDER_BACKEND.
+
+    python -m benchmarks.embedders [--backends onnx onnx-int8] [--max-chunks 512] [--json]
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app import config
+from app.engine import EMBEDDER_BACKENDS, Chunker, Extractor, load_backend
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+REFERENCE_BACKEND = "sentence-transformers"
+DEFAULT_BACKENDS = ["sentence-transformers-int8", "onnx", "onnx-int8"]
+
+
+def load_corpus(upload_dir: Path, max_chunks: int) -> list:
+    """Chunks of the uploaded documents, as the engine would index them"""
+    extractor = Extractor()
+    chunker = Chunker(config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+    chunks = []
+    for path in sorted(upload_dir.iterdir()):
+        if path.is_file() and path.suffix.lower() in extractor.supported_extensions:
+            chunks.extend(chunker.split(extractor.extract(path)))
+    return chunks[:max_chunks]
+
+
+def pseudo_queries(chunks: list, count: int, words: int = 12) -> list:
+    rows = np.linspace(0, len(chunks) - 1, num=min(count, len(chunks)), dtype=int)
+    return [" ".join(chunks[row].split()[:words]) for row in rows]
+
+
+def time_encode(embedder, texts: list, runs: int) -> float:
+    """Median chunks per second over `runs` encodes of `texts`"""
+    embedder.encode(texts[:8])  # warm-up
+    rates = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        embedder.encode(texts)
+        rates.append(len(texts) / (time.perf_counter() - started))
+    return statistics.median(rates)
+
+
+def top_k(query_embeddings: np.ndarray, embeddings: np.ndarray, k: int) -> np.ndarray:
+    scores = query_embeddings @ embeddings.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def measure(backend: str, chunks: list, queries: list, runs: int) -> dict:
+    embedder = load_backend(EMBEDDER_BACKENDS, backend)()
+    started = time.perf_counter()
+    embedder.load()
+    load_seconds = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "load_s": load_seconds,
+        "chunks_per_s": time_encode(embedder, chunks, runs),
+        "embeddings": embedder.encode(chunks),
+        "query_embeddings": embedder.encode(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=DEFAULT_BACKENDS)
+    parser.add_argument("--upload-dir", type=Path, default=REPO_ROOT / config.UPLOAD_DIR)
+    parser.add_argument("--max-chunks", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=config.CONTEXT_CHUNKS)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--json", action="store_true", help="print a JSON summary instead of a table")
+    args = parser.parse_args()
+
+    chunks = load_corpus(args.upload_dir, args.max_chunks)
+    if not chunks:
+        parser.error(f"No indexable documents in {args.upload_dir}")
+    queries = pseudo_queries(chunks, args.queries)
+    k = min(args.k, len(chunks))
+
+    reference = measure(REFERENCE_BACKEND, chunks, queries, args.runs)
+    reference_top = top_k(reference["query_embeddings"], reference["embeddings"], k)
+
+    results = []
+    for backend in [REFERENCE_BACKEND] + [name for name in args.backends if name != REFERENCE_BACKEND]:
+        try:
+            run = reference if backend == REFERENCE_BACKEND else measure(backend, chunks, queries, args.runs)
+        except Exception as e:
+            results.append({"backend": backend, "error": str(e)})
+            continue
+        cosines = np.sum(run["embeddings"] * reference["embeddings"], axis=1)
+        found = top_k(run["query_embeddings"], run["embeddings"], k)
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, reference_top)])
+        results.append({
+            "backend": backend,
+            "load_s": round(run["load_s"], 2),
+            "chunks_per_s": round(run["chunks_per_s"], 1),
+            "speedup": round(run["chunks_per_s"] / reference["chunks_per_s"], 2),
+            "mean_cosine": round(float(cosines.mean()), 5),
+            "min_cosine": round(float(cosines.min()), 5),
+            f"recall@{k}": round(float(recall), 3),
+            "acceptable": bool(cosines.mean() >= args.min_cosine and recall >= args.min_recall),
+        })
+
+    acceptable = [result for result in results if result.get("acceptable")]
+    recommended = max(acceptable, key=lambda result: result["chunks_per_s"])["backend"] if acceptable else None
+
+    if args.json:
+        print(json.dumps({
+            "chunks": len(chunks),
+            "queries": len(queries),
+            "min_cosine": args.min_cosine,
+            "min_recall": args.min_recall,
+            "results": results,
+            "recommended": recommended,
+        }, indent=2))
+        return
+
+    print(f"{len(chunks)} chunks, {len(queries)} pseudo-queries, reference {REFERENCE_BACKEND}\n")
+    print(f"{'backend':<28}{'load s':>8}{'chunks/s':>10}{'speedup':>9}{'cos mean':>10}{'cos min':>9}"
+          f"{f'recall@{k}':>10}  ok")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<28}  failed: {result['error']}")
+            continue
+        print(f"{result['backend']:<28}{result['load_s']:>8.2f}{result['chunks_per_s']:>10.1f}"
+              f"{result['speedup']:>8.2f}x{result['mean_cosine']:>10.4f}{result['min_cosine']:>9.4f}"
+              f"{result[f'recall@{k}']:>10.3f}  {'yes' if result['acceptable'] else 'no'}")
+    print(f"\nRecommended EMBEDDER_BACKEND: {recommended or 'none within thresholds'}")
+
+
+if __name__ == "__main__":
+    main()
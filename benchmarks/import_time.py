@@ -0,0 +1,114 @@
+"""
+Import-time benchmark for app startup.
+
+Every uvicorn worker imports app.main before it can serve a request, so this
+measures that import with `python -X importtime` in fresh interpreters and
+fails when it goes over budget or when a heavy dependency (torch, the
+document parsers, ...) is imported eagerly again.
+
+    python -m benchmarks.import_time [--budget-ms 1500] [--runs 5] [--top 15]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+TARGET_MODULE = "app.main"
+
+# Cumulative import time of app.main, median over runs. Most of it is FastAPI
+# and pydantic; the app's own modules should stay in the tens of milliseconds.
+DEFAULT_BUDGET_MS = 1500
+
+# Modules that must only ever be imported lazily, on first use.
+FORBIDDEN_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "onnxruntime",
+    "langchain",
+    "langchain_community",
+    "langchain_huggingface",
+    "PyPDF2",
+    "docx",
+    "requests",
+]
+
+
+def run_once(module: str) -> dict:
+    """Import `module` in a fresh interpreter and parse the -X importtime report"""
+    probe = (
+        f"import sys, json, {module}; "
+        f"print(json.dumps(sorted(m for m in {FORBIDDEN_MODULES!r} if m in sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+            timings[name] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue  # header line
+
+    return {
+        "total_ms": timings[module][1] / 1000,
+        "timings": timings,
+        "forbidden": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default=TARGET_MODULE)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="show the N slowest modules by self time")
+    parser.add_argument("--json", action="store_true", help="print a JSON summary instead of a table")
+    args = parser.parse_args()
+
+    runs = [run_once(args.module) for _ in range(args.runs)]
+    median_ms = statistics.median(run["total_ms"] for run in runs)
+    forbidden = sorted({name for run in runs for name in run["forbidden"]})
+
+    # Self time per module, median across runs
+    names = set.intersection(*(set(run["timings"]) for run in runs))
+    self_ms = {name: statistics.median(run["timings"][name][0] for run in runs) / 1000 for name in names}
+    slowest = sorted(self_ms.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    app_ms = sum(ms for name, ms in self_ms.items() if name == "app" or name.startswith("app."))
+
+    within_budget = median_ms <= args.budget_ms and not forbidden
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "median_ms": round(median_ms, 1),
+            "app_self_ms": round(app_ms, 1),
+            "budget_ms": args.budget_ms,
+            "forbidden_imported": forbidden,
+            "slowest_self_ms": {name: round(ms, 1) for name, ms in slowest},
+            "ok": within_budget,
+        }, indent=2))
+    else:
+        print(f"import {args.module}: median {median_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+        print(f"app.* modules (self time): {app_ms:.1f} ms")
+        print("\nSlowest modules by self time:")
+        for name, ms in slowest:
+            print(f"  {ms:8.1f} ms  {name}")
+        if forbidden:
+            print(f"\nHeavy modules imported eagerly: {', '.join(forbidden)}")
+        print("\nOK" if within_budget else "\nFAILED")
+
+    sys.exit(0 if within_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
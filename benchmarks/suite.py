@@ -0,0 +1,390 @@
+"""
+End-to-end ingestion and query benchmark.
+
+Generates a synthetic corpus (see benchmarks/corpus.py) or copies an existing
+one into a scratch uploads directory, runs the app in process and reports:
+
+    ingest       model load, then a full sync of the corpus: docs/s, chunks/s,
+                 MB/s and the time spent per stage (extract, chunk, dedup, encode)
+    query_cold   distinct queries asked one at a time through POST /api/query,
+                 first seen by the caches: p50/p95/p99 latency and stage medians
+    query_warm   the same queries again, answered from the semantic cache
+    concurrent   POST /api/query with N requests in flight at once, for each
+                 --concurrency level, with the semantic cache bypassed so every
+                 request does the full retrieval: QPS and p50/p95/p99
+    memory       peak RSS after each scenario (and the tracemalloc peak of
+                 Python allocations during it with --tracemalloc)
+
+Requests go through the whole ASGI stack (middleware, routing, validation,
+serialisation) via httpx's in-process transport, so no server or sockets are
+involved. The index is kept in memory (INDEX_DIR unset).
+
+Results can be saved as JSON and compared with a previous run; with --baseline
+the exit status is 1 when any latency, throughput or memory figure is more
+than --max-regression percent worse.
+
+    python -m benchmarks.suite [--docs 40] [--words 2000] [--backend hashing] [--output run.json]
+    python -m benchmarks.suite --baseline run.json --max-regression 10
+
+`--backend hashing` swaps the embedding model for a cheap feature-hashing
+embedder defined here, to measure the pipeline without model inference (and
+to run where no model is installed); use the configured backend for numbers
+that reflect production.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from app import config
+from app.engine import EMBEDDER_BACKENDS, Embedder, Extractor, get_engine
+from app.metrics import STAGE_SECONDS
+from benchmarks.corpus import FORMATS, generate_corpus, sample_queries
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+INGEST_STAGES = ("extract", "chunk", "dedup", "encode")
+HASHING_DIM = 384
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class HashingEmbedder(Embedder):
+    """Feature hashing of lowercase words into HASHING_DIM buckets; a stand-in for a model (see --backend)"""
+
+    def __init__(self, model_name: str = f"hashing-{HASHING_DIM}"):
+        super().__init__(model_name)
+
+    def encode(self, texts: list) -> np.ndarray:
+        embeddings = np.zeros((len(texts), HASHING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row, zlib.crc32(word.encode('utf-8')) % HASHING_DIM] += 1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+
+EMBEDDER_BACKENDS["hashing"] = "benchmarks.suite:HashingEmbedder"
+
+
+def percentiles(seconds: list) -> dict:
+    milliseconds = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(milliseconds):
+        return {}
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+        "max_ms": round(float(milliseconds.max()), 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+class MemoryWatch:
+    """Peak RSS after a scenario, plus its tracemalloc peak when tracing"""
+
+    def __init__(self, trace: bool):
+        self.trace = trace
+        if trace:
+            tracemalloc.start()
+
+    def start(self):
+        if self.trace:
+            tracemalloc.reset_peak()
+
+    def report(self) -> dict:
+        report = {"peak_rss_mb": peak_rss_mb()}
+        if self.trace:
+            report["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        return report
+
+
+def stage_sums() -> dict:
+    return {stage: histogram.snapshot()['sum'] for stage, histogram in STAGE_SECONDS.items()}
+
+
+def run_ingest(engine, corpus_bytes: int, documents: int) -> dict:
+    started = time.perf_counter()
+    engine.embedder.load()
+    load_seconds = time.perf_counter() - started
+
+    before = stage_sums()
+    started = time.perf_counter()
+    engine.sync()
+    seconds = time.perf_counter() - started
+    after = stage_sums()
+
+    chunks = engine.dedup_stats['chunks']
+    return {
+        "model_load_ms": round(load_seconds * 1000, 1),
+        "seconds": round(seconds, 3),
+        "documents": documents,
+        "chunks": chunks,
+        "duplicate_chunks": engine.dedup_stats['duplicates'],
+        "docs_per_s": round(documents / seconds, 2),
+        "chunks_per_s": round(chunks / seconds, 1),
+        "mb_per_s": round(corpus_bytes / 2 ** 20 / seconds, 2),
+        "stages_ms": {
+            stage: round((after.get(stage, 0.0) - before.get(stage, 0.0)) * 1000, 1) for stage in INGEST_STAGES
+        },
+    }
+
+
+async def run_requests(client, payloads: list, concurrency: int):
+    """POST every payload to /api/query with `concurrency` in flight; returns (latencies, responses, errors, seconds)"""
+    latencies, responses, errors = [], [], 0
+    pending = iter(payloads)
+
+    async def worker():
+        nonlocal errors
+        for payload in pending:
+            started = time.perf_counter()
+            response = await client.post("/api/query", json=payload)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code == 200:
+                responses.append(response.json())
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, responses, errors, time.perf_counter() - started
+
+
+def stage_medians(responses: list) -> dict:
+    stages = {}
+    for response in responses:
+        for stage, milliseconds in (response.get("timings") or {}).items():
+            stages.setdefault(stage, []).append(milliseconds)
+    return {stage: round(float(np.median(values)), 3) for stage, values in sorted(stages.items())}
+
+
+async def run_queries(app, queries: list, concurrency_levels: list, requests: int, memory: MemoryWatch) -> dict:
+    import httpx
+
+    from app.answer_cache import SEMANTIC_CACHE
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        payloads = [{"query": query, "include_timings": True} for query in queries]
+        for scenario in ("query_cold", "query_warm"):
+            memory.start()
+            hits = SEMANTIC_CACHE.hits
+            latencies, responses, errors, _ = await run_requests(client, payloads, 1)
+            results[scenario] = {
+                "queries": len(payloads),
+                "errors": errors,
+                "cache_hits": SEMANTIC_CACHE.hits - hits,
+                **percentiles(latencies),
+                "stages_ms": stage_medians(responses),
+                **memory.report(),
+            }
+            if scenario == "query_cold":
+                results[scenario]["first_query_ms"] = round(latencies[0] * 1000, 3) if latencies else None
+
+        concurrent = {}
+        max_entries, SEMANTIC_CACHE.max_entries = SEMANTIC_CACHE.max_entries, 0
+        try:
+            for concurrency in concurrency_levels:
+                memory.start()
+                level_payloads = [{"query": queries[i % len(queries)]} for i in range(requests)]
+                latencies, _, errors, seconds = await run_requests(client, level_payloads, concurrency)
+                concurrent[str(concurrency)] = {
+                    "requests": len(level_payloads),
+                    "errors": errors,
+                    "qps": round(len(level_payloads) / seconds, 2),
+                    **percentiles(latencies),
+                    **memory.report(),
+                }
+        finally:
+            SEMANTIC_CACHE.max_entries = max_entries
+        results["concurrent"] = concurrent
+    return results
+
+
+def git_revision() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def environment(engine, corpus: dict) -> dict:
+    return {
+        **git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "embedder_backend": config.EMBEDDER_BACKEND,
+        "model": engine.embedder.model_name,
+        "synthesizer_backend": config.SYNTHESIZER_BACKEND,
+        "config": {
+            name: getattr(config, name)
+            for name in ("CHUNK_SIZE", "CHUNK_OVERLAP", "EMBEDDING_BATCH_TOKENS", "EMBEDDING_MAX_BATCH",
+                         "SEARCH_THREADS", "TWO_STAGE_MIN_CHUNKS", "MMR_CANDIDATES", "DEDUP_MODE")
+        },
+        "corpus": corpus,
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Comparable figures of a run, keyed like "concurrent.4.p95_ms" """
+    figures = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            figures.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(
+                ("_ms", "_mb", "_per_s", "qps", "seconds")):
+            figures[name] = value
+    return figures
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """(figure, baseline, current, percent worse) of every figure more than max_regression percent worse"""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    for name, value in sorted(current.items()):
+        before = previous.get(name)
+        # Per-stage breakdowns are there to explain a regression, not to flag one
+        if not before or ".stages_ms." in name:
+            continue
+        higher_is_better = name.endswith(("_per_s", "qps"))
+        change = (before - value if higher_is_better else value - before) / before * 100
+        if change > max_regression:
+            regressions.append((name, before, value, change))
+    return regressions
+
+
+def print_summary(results: dict):
+    ingest = results["ingest"]
+    print(f"ingest       {ingest['documents']} docs, {ingest['chunks']} chunks in {ingest['seconds']:.2f}s: "
+          f"{ingest['docs_per_s']} docs/s, {ingest['chunks_per_s']} chunks/s, {ingest['mb_per_s']} MB/s "
+          f"(model load {ingest['model_load_ms']}ms, peak RSS {ingest['peak_rss_mb']} MB)")
+    print(f"             stages: " + ", ".join(f"{stage} {ms}ms" for stage, ms in ingest["stages_ms"].items()))
+    for scenario in ("query_cold", "query_warm"):
+        query = results[scenario]
+        print(f"{scenario:<12} p50 {query['p50_ms']}ms  p95 {query['p95_ms']}ms  p99 {query['p99_ms']}ms  "
+              f"({query['queries']} queries, {query['cache_hits']} cache hits, {query['errors']} errors)")
+    for concurrency, level in results["concurrent"].items():
+        print(f"concurrent {concurrency:>3}  {level['qps']} QPS  p50 {level['p50_ms']}ms  p95 {level['p95_ms']}ms  "
+              f"p99 {level['p99_ms']}ms  ({level['errors']} errors, peak RSS {level['peak_rss_mb']} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--words", type=int, default=2000, help="mean words per generated document")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--near-duplicates", type=float, default=0.1, help="fraction of generated documents that are drafts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", type=Path, help="benchmark these documents instead of a generated corpus")
+    parser.add_argument("--backend", help="embedder backend (default: EMBEDDER_BACKEND), or 'hashing'")
+    parser.add_argument("--queries", type=int, default=50, help="distinct queries for the cold and warm scenarios")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak traced Python allocations")
+    parser.add_argument("--workspace", type=Path, help="scratch directory to use and keep (default: a temporary one)")
+    parser.add_argument("--output", type=Path, help="write the results as JSON to this file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="percent worse tolerated by --baseline")
+    args = parser.parse_args()
+
+    workspace = args.workspace or Path(tempfile.mkdtemp(prefix="kb-benchmark-"))
+    upload_dir = workspace.resolve() / "uploads"
+    if upload_dir.exists() and any(upload_dir.iterdir()):
+        parser.error(f"{upload_dir} is not empty")
+    if args.corpus:
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        for path in sorted(args.corpus.iterdir()):
+            if path.is_file():
+                shutil.copy2(path, upload_dir / path.name)
+        corpus = {"source": str(args.corpus)}
+    else:
+        generated = generate_corpus(upload_dir, args.docs, args.words, args.formats, args.seed, args.near_duplicates)
+        queries = sample_queries([text for _, text in generated], args.queries, args.seed)
+        corpus = {"docs": args.docs, "words": args.words, "formats": args.formats,
+                  "near_duplicates": args.near_duplicates, "seed": args.seed}
+    documents = [path for path in upload_dir.iterdir() if path.is_file()]
+    corpus_bytes = sum(path.stat().st_size for path in documents)
+    corpus["bytes"] = corpus_bytes
+
+    config.INDEX_DIR = ""
+    if args.backend:
+        config.EMBEDDER_BACKEND = args.backend
+    original_cwd = os.getcwd()
+    # The app resolves its uploads directory relative to the working directory
+    os.chdir(workspace)
+    try:
+        memory = MemoryWatch(args.tracemalloc)
+        from app.main import app
+
+        engine = get_engine()
+        if args.corpus:
+            extractor = Extractor()
+            texts = [extractor.extract(path) for path in sorted(documents)
+                     if path.suffix.lower() in extractor.supported_extensions]
+            queries = sample_queries(texts, args.queries, args.seed)
+
+        memory.start()
+        results = {"ingest": {**run_ingest(engine, corpus_bytes, len(documents)), **memory.report()}}
+        results.update(asyncio.run(run_queries(app, queries, args.concurrency, args.requests, memory)))
+        results = {"environment": environment(engine, corpus), **results}
+    finally:
+        os.chdir(original_cwd)
+        if args.workspace is None:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_summary(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding='utf-8')
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.max_regression)
+        revision = baseline.get("environment", {}).get("commit") or args.baseline
+        if regressions:
+            print(f"\n{len(regressions)} figures more than {args.max_regression}% worse than {revision}:")
+            for name, before, value, change in regressions:
+                print(f"  {name:<32} {before} -> {value} ({change:+.1f}%)")
+            sys.exit(1)
+        print(f"\nNo figure more than {args.max_regression}% worse than {revision}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Thread and CPU-affinity calibration for the embedding model.
+
+Runs W worker processes encoding the same chunks concurrently, for several
+worker counts, each either pinned to its own slice of the CPUs with one
+intra-op thread per CPU (what WORKER_CPU_AFFINITY=auto does) or unpinned with
+the runtime's default threads (the oversubscribed baseline). Reports the
+aggregate throughput and per-batch latency of each layout and recommends the
+environment settings for this host.
+
+    python -m benchmarks.threads [--workers 1 2 4] [--duration 10] [--objective throughput|latency] [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import time
+
+from app import config
+from app.cpu import available_cpus, cpu_slices
+from app.engine import EMBEDDER_BACKENDS, load_backend
+from benchmarks.embedders import REPO_ROOT, load_corpus
+
+
+def default_worker_counts(cpus: int) -> list:
+    counts, workers = [], 1
+    while workers <= cpus:
+        counts.append(workers)
+        workers *= 2
+    return counts
+
+
+def encode_worker(backend: str, cpus, threads: int, interop_threads: int, chunks: list, batch_size: int,
+                  duration: float, barrier, results):
+    """Body of one calibration process: pin, configure, warm up, then encode until `duration` runs out"""
+    from app import cpu
+
+    config.EMBEDDING_THREADS = threads
+    config.EMBEDDING_INTEROP_THREADS = interop_threads
+    if cpus:
+        cpu.apply_cpu_affinity(",".join(map(str, cpus)))
+    embedder = load_backend(EMBEDDER_BACKENDS, backend)()
+    embedder.load()
+    embedder.encode(chunks[:batch_size])
+
+    barrier.wait()
+    latencies, encoded, position = [], 0, 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        batch = chunks[position:position + batch_size] or chunks[:batch_size]
+        position = (position + batch_size) % len(chunks)
+        started = time.perf_counter()
+        embedder.encode(batch)
+        latencies.append(time.perf_counter() - started)
+        encoded += len(batch)
+    results.put({"encoded": encoded, "latencies": latencies})
+
+
+def run_layout(backend: str, workers: int, pinned: bool, cpus: list, interop_threads: int, chunks: list,
+               batch_size: int, duration: float) -> dict:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    slices = cpu_slices(cpus, workers) if pinned else [None] * workers
+    processes = [
+        context.Process(target=encode_worker, args=(
+            backend, slices[i], len(slices[i]) if pinned else 0, interop_threads,
+            chunks, batch_size, duration, barrier, results,
+        ))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outputs = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for output in outputs for latency in output["latencies"])
+    return {
+        "workers": workers,
+        "pinned": pinned,
+        "threads_per_worker": len(slices[0]) if pinned else "default",
+        "chunks_per_s": round(sum(output["encoded"] for output in outputs) / duration, 1),
+        "batch_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "batch_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+    }
+
+
+def recommend(result: dict) -> dict:
+    settings = {"WEB_CONCURRENCY": result["workers"]}
+    if result["pinned"]:
+        settings.update({
+            "WORKER_CPU_AFFINITY": "auto",
+            "WORKER_CPU_SLOTS": result["workers"],
+            "EMBEDDING_THREADS": result["threads_per_worker"],
+            "EMBEDDING_INTEROP_THREADS": 1,
+        })
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=config.EMBEDDER_BACKEND)
+    parser.add_argument("--workers", type=int, nargs="+", help="worker counts to try (default: 1, 2, 4, ... up to the CPU count)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of encoding per layout")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--interop-threads", type=int, default=1, help="inter-op threads for pinned layouts")
+    parser.add_argument("--upload-dir", default=REPO_ROOT / config.UPLOAD_DIR)
+    parser.add_argument("--max-chunks", type=int, default=256)
+    parser.add_argument("--objective", choices=["throughput", "latency"], default="throughput",
+                        help="maximise chunks/s, or minimise p95 batch latency")
+    parser.add_argument("--json", action="store_true", help="print a JSON summary instead of a table")
+    args = parser.parse_args()
+
+    if args.backend == "server":
+        parser.error("Calibrate the embedding server's own backend, not 'server'")
+    chunks = load_corpus(args.upload_dir, args.max_chunks)
+    if not chunks:
+        parser.error(f"No indexable documents in {args.upload_dir}")
+
+    cpus = available_cpus()
+    worker_counts = args.workers or default_worker_counts(len(cpus))
+    results = []
+    for workers in worker_counts:
+        for pinned in (False, True) if hasattr(os, "sched_setaffinity") else (False,):
+            if pinned and workers > len(cpus):
+                continue
+            results.append(run_layout(args.backend, workers, pinned, cpus, args.interop_threads, chunks,
+                                      args.batch_size, args.duration))
+            if not args.json:
+                result = results[-1]
+                print(f"workers={result['workers']:<3} pinned={'yes' if pinned else 'no ':<4}"
+                      f"threads={result['threads_per_worker']!s:<8}{result['chunks_per_s']:>10.1f} chunks/s"
+                      f"  p50 {result['batch_p50_ms']:>7.1f} ms  p95 {result['batch_p95_ms']:>7.1f} ms")
+
+    if args.objective == "throughput":
+        best = max(results, key=lambda result: result["chunks_per_s"])
+    else:
+        best = min(results, key=lambda result: result["batch_p95_ms"])
+    settings = recommend(best)
+
+    if args.json:
+        print(json.dumps({
+            "backend": args.backend,
+            "cpus": len(cpus),
+            "objective": args.objective,
+            "results": results,
+            "recommended": settings,
+        }, indent=2))
+    else:
+        print(f"\nRecommended for {len(cpus)} CPUs ({args.objective}):")
+        for name, value in settings.items():
+            print(f"  {name}={value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,8 @@ export default function Home() {
     setIsLoading(true);
 
     try {
-      const response = await fetch('http://127.0.0.1:8000/api/query', {
+      // Stream the answer: sources arrive as soon as retrieval is done, then the text incrementally
+      const response = await fetch('http://127.0.0.1:8000/api/query/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -36,9 +37,39 @@ export default function Home() {
         throw new Error(err.detail || "An error occurred.");
       }
 
-      const result = await response.json();
-      const aiMessage = { sender: 'ai', text: result.answer };
-      setMessages(prev => [...prev, aiMessage]);
+      let answer = '';
+      let added = false;
+      const showAnswer = () => {
+        const aiMessage = { sender: 'ai', text: answer };
+        const replaceLast = added;
+        added = true;
+        setMessages(prev => replaceLast ? [...prev.slice(0, -1), aiMessage] : [...prev, aiMessage]);
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const frame = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          const event = frame.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(frame.match(/^data: (.*)$/m)?.[1] || '{}');
+
+          if (event === 'token') {
+            answer += data.text;
+            showAnswer();
+          } else if (event === 'error') {
+            throw new Error(data.detail || "An error occurred.");
+          }
+        }
+      }
 
     } catch (error) {
       const errorMessage = { sender: 'ai', text: `Error: ${error.message}` };
@@ -0,0 +1,21 @@
+import pytest
+
+from app.engine import Engine
+from fakes import WordHashEmbedder
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    """An empty uploads directory"""
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    return upload_dir
+
+
+@pytest.fixture
+def make_engine(uploads):
+    """Factory for engines over `uploads`, embedding with a WordHashEmbedder unless given another embedder"""
+    def make(embedder=None, **kwargs):
+        return Engine(upload_dir=uploads, embedder=embedder or WordHashEmbedder(), **kwargs)
+
+    return make
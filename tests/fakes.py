@@ -0,0 +1,25 @@
+"""Deterministic stand-ins for the models, so the tests need no model downloads."""
+import zlib
+
+import numpy as np
+
+from app.engine import Embedder
+
+# Embedding dimension per model name; differing dimensions keep two models' vectors from being mixed
+DIMENSIONS = {"old-model": 16, "new-model": 8}
+DEFAULT_DIMENSION = 64
+
+
+class WordHashEmbedder(Embedder):
+    """Bag of lowercase words hashed into buckets, L2-normalised"""
+
+    def __init__(self, model_name: str = "word-hash"):
+        super().__init__(model_name)
+
+    def encode(self, texts: list) -> np.ndarray:
+        dim = DIMENSIONS.get(self.model_name, DEFAULT_DIMENSION)
+        embeddings = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row, zlib.crc32(word.encode('utf-8')) % dim] += 1.0
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
@@ -0,0 +1,70 @@
+"""Pagination cursors of /api/query and /api/search."""
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.engine import Chunker
+from app.query import RetrievalRequest, decode_cursor, encode_cursor, retrieve_page
+
+QUERY = "orchard apples"
+
+
+def raises_http(status_code: int, call, *args):
+    with pytest.raises(HTTPException) as error:
+        call(*args)
+    assert error.value.status_code == status_code
+    return error.value
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(30, "4.2", "fingerprint")
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "4.2", "fingerprint") == 30
+
+
+def test_cursor_for_another_query_is_rejected():
+    raises_http(400, decode_cursor, encode_cursor(30, "4.2", "fingerprint"), "4.2", "another")
+
+
+def test_malformed_cursors_are_rejected():
+    negative = base64.urlsafe_b64encode(json.dumps({'o': -3, 'g': "4.2", 'f': "fingerprint"}).encode()).decode()
+    for cursor in ("not a cursor", base64.urlsafe_b64encode(b'{"g": "4.2"}').decode(), negative):
+        raises_http(400, decode_cursor, cursor, "4.2", "fingerprint")
+
+
+def test_cursor_from_another_index_generation_is_a_conflict():
+    raises_http(409, decode_cursor, encode_cursor(30, "4.2", "fingerprint"), "5.0", "fingerprint")
+
+
+@pytest.fixture
+def engine(uploads, make_engine):
+    for number in range(4):
+        rows = [f"Row {row} of orchard {number} grows {row * number} apples and {row + number} pears."
+                for row in range(40)]
+        (uploads / f"orchard{number}.txt").write_text(" ".join(rows))
+    engine = make_engine(chunker=Chunker(chunk_size=20, overlap=5))
+    engine.sync()
+    return engine
+
+
+def test_pages_follow_the_full_ranking(engine):
+    expected = [
+        (chunk['metadata']['file'], chunk['metadata']['chunk_index'])
+        for chunk in engine.search(QUERY, top_k=9)
+    ]
+    pages, cursor = [], None
+    while len(pages) < 3:
+        chunks, cursor = retrieve_page(engine, RetrievalRequest(query=QUERY, top_k=3, cursor=cursor))
+        pages.append([(chunk['metadata']['file'], chunk['metadata']['chunk_index']) for chunk in chunks])
+        assert cursor is not None
+    assert [key for page in pages for key in page] == expected
+
+
+def test_cursor_expires_when_the_index_changes(engine, uploads):
+    _, cursor = retrieve_page(engine, RetrievalRequest(query=QUERY, top_k=3))
+    (uploads / "orchard9.txt").write_text("Orchard 9 grows apples and pears.")
+    engine.sync()
+    error = raises_http(409, retrieve_page, engine, RetrievalRequest(query=QUERY, top_k=3, cursor=cursor))
+    assert "repeat the query" in error.detail
@@ -0,0 +1,91 @@
+"""Near-duplicate chunks at ingest: linked to their original or skipped."""
+import numpy as np
+import pytest
+
+from app import config
+from app.engine import Chunker
+from app.metadata import SearchFilter
+from fakes import WordHashEmbedder
+
+ORIGINAL = " ".join(f"Clause {number} of the lease binds tenant {number % 7} until year {2000 + number}."
+                    for number in range(30))
+ADDENDUM = " ".join(f"Addendum {number} waives fee {number * 3} for unit {number + 40}."
+                    for number in range(8))
+
+
+class RecordingEmbedder(WordHashEmbedder):
+    """Remembers every text it encoded for the corpus"""
+
+    def __init__(self, model_name: str = "word-hash"):
+        super().__init__(model_name)
+        self.encoded = []
+
+    def encode_corpus(self, texts: list, **kwargs) -> np.ndarray:
+        self.encoded.extend(texts)
+        return super().encode_corpus(texts, **kwargs)
+
+
+@pytest.fixture
+def ingest(uploads, make_engine, monkeypatch):
+    """Index lease.txt, then a draft of it with an addendum, under the given DEDUP_MODE"""
+    def ingest(mode: str):
+        monkeypatch.setattr(config, "DEDUP_MODE", mode)
+        # Chunks that never straddle the end of the shared text, so the draft's first chunks repeat exactly
+        engine = make_engine(RecordingEmbedder(), chunker=Chunker(chunk_size=15, overlap=0))
+        (uploads / "lease.txt").write_text(ORIGINAL)
+        engine.sync()
+        (uploads / "lease-draft.txt").write_text(f"{ORIGINAL} {ADDENDUM}")
+        engine.sync()
+        return engine
+
+    return ingest
+
+
+def chunks_of(engine, filename: str) -> list:
+    return engine.index.search(engine.embedder.encode(["lease"])[0], top_k=1000,
+                               search_filter=SearchFilter(files=[filename]), with_embeddings=True)
+
+
+def test_link_indexes_duplicates_with_their_originals_embedding(ingest):
+    engine = ingest("link")
+    original, draft = chunks_of(engine, "lease.txt"), chunks_of(engine, "lease-draft.txt")
+    # Every chunk of the original comes back in the draft, ahead of the addendum's
+    shared = len(original)
+    assert len(draft) > shared
+
+    by_text = {chunk['text']: chunk['embedding'] for chunk in original}
+    linked = [chunk for chunk in draft if chunk['text'] in by_text]
+    assert len(linked) == shared
+    for chunk in linked:
+        np.testing.assert_array_equal(chunk['embedding'], by_text[chunk['text']])
+    # Only the draft's new chunks were encoded
+    assert len(engine.embedder.encoded) == len(original) + len(draft) - shared
+    assert engine.dedup_stats == {'chunks': len(original) + len(draft), 'duplicates': shared}
+
+
+def test_skip_leaves_duplicates_out_of_the_index(ingest):
+    engine = ingest("skip")
+    original, draft = chunks_of(engine, "lease.txt"), chunks_of(engine, "lease-draft.txt")
+    assert not {chunk['text'] for chunk in draft} & {chunk['text'] for chunk in original}
+    assert sorted(chunk['metadata']['chunk_index'] for chunk in draft) == \
+        list(range(len(original), len(original) + len(draft)))
+    assert len(engine.embedder.encoded) == len(original) + len(draft)
+    assert engine.dedup_stats['duplicates'] == len(original)
+
+
+def test_off_encodes_every_chunk(ingest):
+    engine = ingest("off")
+    original, draft = chunks_of(engine, "lease.txt"), chunks_of(engine, "lease-draft.txt")
+    assert len(engine.embedder.encoded) == len(original) + len(draft)
+    assert engine.dedup_stats == {'chunks': 0, 'duplicates': 0}
+
+
+def test_repeated_chunks_within_a_file_are_duplicates(uploads, make_engine, monkeypatch):
+    monkeypatch.setattr(config, "DEDUP_MODE", "link")
+    engine = make_engine(RecordingEmbedder(), chunker=Chunker(chunk_size=15, overlap=0))
+    words = ORIGINAL.split()[:15]
+    (uploads / "minutes.txt").write_text(" ".join(words * 3))
+    engine.sync()
+    assert len(engine.index) == 3
+    assert engine.embedder.encoded == [" ".join(words)]
+    assert engine.dedup_stats == {'chunks': 3, 'duplicates': 2}
@@ -0,0 +1,117 @@
+"""Segmented index search against brute force, and compaction."""
+import numpy as np
+import pytest
+
+from app import config
+from app.engine import Index
+from app.metadata import ChunkMetadata, SearchFilter
+from fakes import WordHashEmbedder
+
+EMBEDDER = WordHashEmbedder()
+VOCABULARY = [f"word{i}" for i in range(300)]
+
+
+def random_texts(rng, count: int) -> list:
+    return [" ".join(rng.choice(VOCABULARY, size=12)) for _ in range(count)]
+
+
+@pytest.fixture
+def index():
+    """Six segments of six files each, two files deleted"""
+    rng = np.random.default_rng(0)
+    index = Index(model=EMBEDDER.model_name)
+    for segment in range(6):
+        texts = random_texts(rng, 60)
+        metadatas = [{'file': f"doc{segment}-{row % 3}.{'txt' if row % 2 else 'pdf'}"} for row in range(60)]
+        index.add(texts, metadatas, EMBEDDER.encode(texts), model=EMBEDDER.model_name)
+    index.remove_file("doc1-0.txt")
+    index.remove_file("doc4-2.pdf")
+    return index
+
+
+def brute_force(index, query_embedding, top_k, search_filter=None, min_score=None) -> list:
+    """(similarity, file, chunk_index) of the best live chunks, scoring every one"""
+    scored = []
+    for segment in index.segments:
+        for row in segment.live_rows():
+            metadata = segment.metadatas[row]
+            if search_filter is not None and not search_filter.matches_file(metadata['file']):
+                continue
+            score = float(segment.embeddings[row] @ query_embedding)
+            if min_score is None or score >= min_score:
+                scored.append((score, metadata['file'], metadata['chunk_index']))
+    return sorted(scored, reverse=True)[:top_k]
+
+
+def assert_same_results(results, expected):
+    assert [result['similarity'] for result in results] == pytest.approx([score for score, _, _ in expected])
+    scores = {(file, chunk_index): score for score, file, chunk_index in expected}
+    for result in results:
+        key = (result['metadata']['file'], result['metadata']['chunk_index'])
+        # Ties may be broken either way
+        assert key not in scores or scores[key] == pytest.approx(result['similarity'])
+
+
+QUERIES = random_texts(np.random.default_rng(1), 5)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_matches_brute_force(index, query, parallel, monkeypatch):
+    monkeypatch.setattr(config, "TWO_STAGE_TOP_DOCS", 0)
+    monkeypatch.setattr(config, "PARALLEL_SEARCH_MIN_CHUNKS", 0 if parallel else 10 ** 9)
+    query_embedding = EMBEDDER.encode([query])[0]
+    for top_k in (1, 7, 50, 1000):
+        assert_same_results(index.search(query_embedding, top_k), brute_force(index, query_embedding, top_k))
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_filtered_search_matches_brute_force(index, query):
+    query_embedding = EMBEDDER.encode([query])[0]
+    for search_filter in (SearchFilter(file_types=["pdf"]), SearchFilter(files=["doc0-1.txt", "doc5-2.pdf"]),
+                          SearchFilter(files=["doc1-0.txt"])):
+        assert_same_results(index.search(query_embedding, 20, search_filter),
+                            brute_force(index, query_embedding, 20, search_filter))
+    assert_same_results(index.search(query_embedding, 20, min_score=0.2),
+                        brute_force(index, query_embedding, 20, min_score=0.2))
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_two_stage_search_over_every_document_matches_brute_force(index, query, monkeypatch):
+    monkeypatch.setattr(config, "TWO_STAGE_MIN_CHUNKS", 0)
+    # Every document, so the first stage keeps them all
+    monkeypatch.setattr(config, "TWO_STAGE_TOP_DOCS", 36)
+    query_embedding = EMBEDDER.encode([query])[0]
+    assert_same_results(index.search(query_embedding, 10), brute_force(index, query_embedding, 10))
+
+
+def test_compaction_preserves_search_results(index, monkeypatch):
+    monkeypatch.setattr(config, "COMPACTION_MAX_SEGMENTS", 2)
+    query_embedding = EMBEDDER.encode([QUERIES[0]])[0]
+    before = brute_force(index, query_embedding, 1000)
+    while index.compact():
+        pass
+    assert len(index.segments) <= 2
+    assert len(index) == len(before)
+    assert_same_results(index.search(query_embedding, 1000), before)
+
+
+def test_compaction_keeps_deletions_made_while_merging(index, monkeypatch):
+    monkeypatch.setattr(config, "COMPACTION_MAX_SEGMENTS", 2)
+    concat = ChunkMetadata.concat
+
+    def concat_while_a_file_is_deleted(parts):
+        # Runs after compact() took its snapshot of the live rows, before the swap
+        index.remove_file("doc0-1.pdf")
+        return concat(parts)
+
+    monkeypatch.setattr(ChunkMetadata, "concat", staticmethod(concat_while_a_file_is_deleted))
+    live_before = len(index)
+    deleted = sum(segment.file_live_counts[segment.metadatas.file_id("doc0-1.pdf")]
+                  for segment in index.segments if segment.metadatas.file_id("doc0-1.pdf") >= 0)
+    assert deleted and index.compact()
+
+    assert len(index) == live_before - deleted
+    assert "doc0-1.pdf" not in {metadata['file'] for _, metadata in index.iter_chunks()}
+    query_embedding = EMBEDDER.encode([QUERIES[0]])[0]
+    assert all(result['metadata']['file'] != "doc0-1.pdf" for result in index.search(query_embedding, 1000))
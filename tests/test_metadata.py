@@ -0,0 +1,85 @@
+"""Columnar chunk metadata: re-interning the file tables of subsets and merges, and search filters."""
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.metadata import ChunkMetadata, SearchFilter
+
+
+def metadata_for(*files_and_counts, uploaded_at=None) -> ChunkMetadata:
+    """Metadata of consecutive files, `count` chunks each"""
+    return ChunkMetadata.from_dicts([
+        {'file': name, 'chunk_index': chunk, 'start': chunk * 10, 'end': chunk * 10 + 9,
+         'uploaded_at': (uploaded_at or {}).get(name)}
+        for name, count in files_and_counts for chunk in range(count)
+    ])
+
+
+def test_take_keeps_only_the_files_of_the_taken_rows():
+    metadata = metadata_for(("a.txt", 3), ("b.pdf", 2), ("c.docx", 4), uploaded_at={"c.docx": 1700000000.0})
+    taken = metadata.take(np.array([7, 0, 8]))
+    assert taken.files == ["a.txt", "c.docx"]
+    assert taken.file_total_chunks == [3, 4]
+    assert taken.file_uploaded_at == [None, 1700000000.0]
+    assert taken.file_ids.dtype == np.int32
+    assert list(taken) == [metadata[7], metadata[0], metadata[8]]
+    assert taken.file_id("b.pdf") == -1
+
+
+def test_take_of_no_rows_has_no_files():
+    taken = metadata_for(("a.txt", 3)).take(np.zeros(0, dtype=np.int64))
+    assert len(taken) == 0
+    assert taken.files == []
+
+
+def test_concat_interns_each_file_once_and_drops_files_without_rows():
+    first = metadata_for(("a.txt", 2), ("b.pdf", 2))
+    # Loaded from disk, a part's file table may still name files none of its rows belong to
+    second = ChunkMetadata(["b.pdf", "a.txt", "c.docx"], [1, 2, 1], np.array([1, 1, 2], dtype=np.int32),
+                           np.array([0, 1, 0], dtype=np.int32), np.array([0, 10, 0]), np.array([9, 19, 9]),
+                           np.full(3, -1, dtype=np.int32))
+    merged = ChunkMetadata.concat([first, second])
+    assert merged.files == ["a.txt", "b.pdf", "c.docx"]
+    assert list(merged) == [*first, *second]
+    assert np.bincount(merged.file_ids).tolist() == [4, 2, 1]
+
+    merged = ChunkMetadata.concat([first.take(np.array([0, 1])), second])
+    assert merged.files == ["a.txt", "c.docx"]
+    assert list(merged) == [first[0], first[1], *second]
+
+
+def test_concat_of_nothing_is_empty():
+    merged = ChunkMetadata.concat([])
+    assert len(merged) == 0
+    assert merged.files == []
+
+
+def test_search_filter_matches_files_by_name_type_and_upload_time():
+    uploaded_at = datetime(2024, 6, 1, tzinfo=timezone.utc).timestamp()
+    assert SearchFilter().is_empty
+    assert SearchFilter(files=["a.txt"]).matches_file("a.txt")
+    assert not SearchFilter(files=["a.txt"]).matches_file("b.txt")
+    assert SearchFilter(file_types=["PDF", ".docx"]).matches_file("report.pdf")
+    assert SearchFilter(file_types=["pdf"]).matches_file("REPORT.PDF")
+    assert not SearchFilter(file_types=["pdf"]).matches_file("notes.txt")
+
+    after = SearchFilter(uploaded_after=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    before = SearchFilter(uploaded_before=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    assert after.matches_file("a.txt", uploaded_at) and not before.matches_file("a.txt", uploaded_at)
+    # Files of unknown upload time never match a time window
+    assert not after.matches_file("a.txt") and not before.matches_file("a.txt")
+
+
+def test_empty_search_filter_lists_match_no_file():
+    metadata = metadata_for(("a.txt", 3), ("b.pdf", 2))
+    for search_filter in (SearchFilter(files=[]), SearchFilter(file_types=[])):
+        assert not search_filter.is_empty
+        assert not search_filter.matches_file("a.txt")
+        assert metadata.filter_rows(search_filter).tolist() == []
+
+
+def test_filter_rows():
+    metadata = metadata_for(("a.txt", 3), ("b.pdf", 2), ("c.txt", 1))
+    assert metadata.filter_rows(SearchFilter(file_types=["txt", "pdf"])) is None
+    assert metadata.filter_rows(SearchFilter(file_types=["txt"])).tolist() == [0, 1, 2, 5]
+    assert metadata.filter_rows(SearchFilter(files=["b.pdf"])).tolist() == [3, 4]
@@ -0,0 +1,64 @@
+"""The sources a query reports against the files its answer cites."""
+import asyncio
+import json
+import re
+
+import pytest
+
+import app.engine
+import app.query
+from app.answer_cache import SEMANTIC_CACHE
+from app.query import QueryRequest, handle_query, handle_query_stream
+from app.synthesis import ANSWER_CACHE
+
+QUERY = "which orchard grows apples and pears"
+
+
+@pytest.fixture
+def engine(uploads, make_engine, monkeypatch):
+    """An engine over two files that both answer QUERY, with the answer caches off"""
+    (uploads / "a.txt").write_text("The north orchard grows apples and pears every autumn.")
+    (uploads / "b.txt").write_text("The south orchard grows apples, pears and plums every summer.")
+    engine = make_engine()
+    monkeypatch.setattr(app.engine, "_engine", engine)
+    monkeypatch.setattr(app.query, "UPLOAD_DIR", uploads)
+    monkeypatch.setattr(SEMANTIC_CACHE, "max_entries", 0)
+    monkeypatch.setattr(ANSWER_CACHE, "max_entries", 0)
+    return engine
+
+
+def cited_files(answer: str) -> set:
+    match = re.search(r"\*\*Source:\*\* (.+)$", answer)
+    assert match, answer
+    return set(match.group(1).split(", "))
+
+
+async def stream_events(request: QueryRequest) -> list:
+    response = await handle_query_stream(request)
+    body = "".join([message async for message in response.body_iterator])
+    return [
+        (lines[0].removeprefix("event: "), json.loads(lines[1].removeprefix("data: ")))
+        for lines in (message.split("\n") for message in body.split("\n\n") if message)
+    ]
+
+
+def test_sources_include_every_file_the_answer_cites(engine):
+    response = asyncio.run(handle_query(QueryRequest(query=QUERY, top_k=1)))
+    assert cited_files(response.answer) == {"a.txt", "b.txt"}
+    assert cited_files(response.answer) <= set(response.sources)
+
+
+def test_streamed_sources_include_every_file_the_answer_cites(engine):
+    events = asyncio.run(stream_events(QueryRequest(query=QUERY, top_k=1)))
+    sources = next(data['sources'] for event, data in events if event == "sources")
+    answer = "".join(data['text'] for event, data in events if event == "token")
+    assert cited_files(answer) == {"a.txt", "b.txt"}
+    assert cited_files(answer) <= set(sources)
+
+
+def test_empty_file_list_matches_nothing(engine):
+    response = asyncio.run(handle_query(QueryRequest(query=QUERY, files=[])))
+    assert response.sources == []
+    assert "match the requested filters" in response.answer
+    assert QueryRequest(query=QUERY, files=[]).cache_scope() != QueryRequest(query=QUERY).cache_scope()
+    assert QueryRequest(query=QUERY, files=[]).fingerprint() != QueryRequest(query=QUERY).fingerprint()
@@ -0,0 +1,132 @@
+"""Re-embedding against a shared index store while another worker publishes."""
+import time
+
+import numpy as np
+import pytest
+
+from app.engine import Index
+from app.shared_index import IndexStore
+from fakes import DIMENSIONS, WordHashEmbedder
+
+
+class HookedEmbedder(WordHashEmbedder):
+    """Runs `on_encode_corpus` once, at the start of the next corpus encode, to interleave another worker's work"""
+
+    on_encode_corpus = None
+
+    def encode_corpus(self, texts: list, **kwargs) -> np.ndarray:
+        hook, HookedEmbedder.on_encode_corpus = HookedEmbedder.on_encode_corpus, None
+        if hook is not None:
+            hook()
+        return super().encode_corpus(texts, **kwargs)
+
+
+def indexed_chunks(index) -> list:
+    """(file, chunk_index) of every live chunk"""
+    return sorted(
+        (metadata['file'], metadata['chunk_index'])
+        for segment in index.segments
+        for metadata in segment.metadatas.take(segment.live_rows())
+    )
+
+
+def test_reembed_does_not_reuse_segment_ids_published_meanwhile(tmp_path, uploads, make_engine):
+    store = IndexStore(tmp_path / "index")
+    (uploads / "a.txt").write_text("alpha apples and avocados " * 40)
+    worker_a, worker_b = (make_engine(HookedEmbedder("old-model"), store=store) for _ in range(2))
+    worker_a.sync()
+
+    def other_worker_ingests():
+        (uploads / "b.txt").write_text("bravo bananas and blueberries " * 40)
+        worker_b.sync()
+
+    HookedEmbedder.on_encode_corpus = other_worker_ingests
+    worker_a.reembed("new-model")
+    assert worker_a.reembed_status['state'] == 'done', worker_a.reembed_status
+
+    index, files = store.attach(store.current_version())
+    assert index.model == "new-model"
+    assert sorted(files) == ["a.txt", "b.txt"]
+    chunks = indexed_chunks(index)
+    assert len(chunks) == len(set(chunks))
+    assert {file for file, _ in chunks} == {"a.txt", "b.txt"}
+    assert all(segment.embeddings.shape[1] == DIMENSIONS["new-model"] for segment in index.segments)
+    ids = [segment.id for segment in index.segments]
+    assert len(ids) == len(set(ids))
+
+
+def test_publish_refuses_to_reuse_an_existing_segment_id(tmp_path, uploads, make_engine):
+    store = IndexStore(tmp_path / "index")
+    (uploads / "a.txt").write_text("alpha apples and avocados " * 40)
+    make_engine(WordHashEmbedder("old-model"), store=store).sync()
+
+    # An index numbered from before that publish
+    stale = Index(next_segment_id=1, model="old-model")
+    stale.add(["charlie cherries"], [{'file': "c.txt"}], WordHashEmbedder("old-model").encode(["charlie cherries"]))
+    with store.lock():
+        with pytest.raises(FileExistsError):
+            store.publish(stale, {"c.txt": (0, 0)})
+    index, files = store.attach(store.current_version())
+    assert list(files) == ["a.txt"]
+
+
+class CountingEmbedder(HookedEmbedder):
+    """Records the model of every corpus encode, across instances"""
+
+    encoded_models = []
+
+    def encode_corpus(self, texts: list, **kwargs) -> np.ndarray:
+        CountingEmbedder.encoded_models.append(self.model_name)
+        return super().encode_corpus(texts, **kwargs)
+
+
+def finish_reembeds(*engines):
+    for engine in engines:
+        engine._reembedder.shutdown(wait=True)
+
+
+def test_workers_starting_together_reembed_once(tmp_path, uploads, make_engine, monkeypatch):
+    monkeypatch.setattr(CountingEmbedder, "encoded_models", [])
+    store = IndexStore(tmp_path / "index")
+    (uploads / "a.txt").write_text("alpha apples and avocados " * 40)
+    make_engine(CountingEmbedder("old-model"), store=store).sync()
+    worker_a, worker_b = (make_engine(CountingEmbedder("new-model"), store=store) for _ in range(2))
+
+    def worker_b_starts():
+        # While worker a is re-embedding; give worker b's re-embed time to start encoding, if it would
+        worker_b.sync()
+        deadline = time.monotonic() + 0.5
+        while CountingEmbedder.encoded_models.count("new-model") < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    HookedEmbedder.on_encode_corpus = worker_b_starts
+    worker_a.sync()
+    finish_reembeds(worker_a, worker_b)
+
+    assert CountingEmbedder.encoded_models.count("new-model") == 1
+    assert worker_b.reembed_status['state'] == 'done'
+    assert store.attach(store.current_version())[0].model == "new-model"
+    assert worker_b.embedder.model_name == "new-model"
+
+
+def test_restart_keeps_an_admin_reembed_until_the_configured_model_changes(tmp_path, uploads, make_engine):
+    store = IndexStore(tmp_path / "index")
+    (uploads / "a.txt").write_text("alpha apples and avocados " * 40)
+    admin = make_engine(WordHashEmbedder("old-model"), store=store)
+    admin.sync()
+    admin.reembed("new-model")
+    assert store.model_override() == {'model': "new-model", 'configured_model': "old-model"}
+
+    restarted = make_engine(WordHashEmbedder("old-model"), store=store)
+    restarted.sync()
+    finish_reembeds(restarted)
+    assert restarted.reembed_status['state'] == 'idle'
+    assert restarted.embedder.model_name == "new-model"
+    assert store.attach(store.current_version())[0].model == "new-model"
+
+    reconfigured = make_engine(WordHashEmbedder("third-model"), store=store)
+    reconfigured.sync()
+    finish_reembeds(reconfigured)
+    assert reconfigured.reembed_status['state'] == 'done'
+    assert store.attach(store.current_version())[0].model == "third-model"
+    assert store.model_override() is None